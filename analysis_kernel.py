@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+
+from instrument import stage
+
+YIELD_OFFSET = 0.002  # 0.2% strain offset of the yield line
+CHORD_START_STRAIN = 0.00005  # ASTM C469: the chord modulus runs from 50 millionths strain ...
+CHORD_STRESS_FRACTION = 0.4  # ... to 40% of the peak stress
+SOFTENING_FLOOR = 0.5  # the post-peak slope is fitted until the stress falls below this fraction of the peak
+# a descending branch must fall at least this fraction below the peak over at least this many samples;
+# a log cut off at or just after the peak has none, and its post-peak fit would be noise
+SOFTENING_MIN_DROP = 0.1
+SOFTENING_MIN_SAMPLES = 10
+ROLLING_WINDOW = 50  # samples in the rolling mean
+
+metric_names = ['strain_at_peak', 'toughness', 'toughness_to_peak', 'yield_strain', 'yield_strength',
+                'secant_modulus', 'softening_slope']
+
+
+class curve_result:
+    ''' Output of analyzeCurve. strain, stress and rolling are views on the kernel's buffers '''
+
+    def __init__(self, strain, stress, rolling, peak_index, slope, intercept, rvalue, fit_start, fit_end,
+                 metrics=None):
+        self.strain = strain
+        self.stress = stress
+        self.rolling = rolling
+        self.peak_index = peak_index
+        self.ultimate_strength = stress[peak_index] if len(stress) else np.nan
+        self.slope = slope
+        self.intercept = intercept
+        self.rvalue = rvalue
+        self.r_squared = rvalue ** 2
+        self.fit_start = fit_start  # the regression used samples fit_start:fit_end
+        self.fit_end = fit_end
+        if fit_end > fit_start:
+            self.elastic_strain_bounds = (strain[fit_start], strain[fit_end - 1])
+        else:
+            self.elastic_strain_bounds = (np.nan, np.nan)
+        self.metrics = metrics if metrics is not None else dict.fromkeys(metric_names, np.nan)
+
+    def dataTable(self, stress_scale=1.0):
+        ''' The curve as a table, with stress scaled into the caller's output units '''
+        if stress_scale == 1.0:
+            return pd.DataFrame({'strain': self.strain, 'stress': self.stress, 'rolling': self.rolling})
+        return pd.DataFrame({'strain': self.strain, 'stress': self.stress * stress_scale,
+                             'rolling': self.rolling * stress_scale})
+
+
+def asColumn(values):
+    ''' Contiguous float64 view of a column (copies only if the input is not already one) '''
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = pd.to_numeric(values).to_numpy()
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def kipsCurve(inch, kips, radius, min_kips, stress_per_force=None):
+    ''' Converts raw crosshead inches and kips into strain and stress, keeping rows with at least
+        min_kips and non-negative displacement, before and after the peak load. Works in place on the
+        one filtered copy, so the returned strain and stress are the only allocations. Other units
+        work through the scalars alone: the displacement and radius only need to share a length
+        unit, and stress_per_force (psi per unit of the force column, units.stressPerForce) replaces
+        the kips-on-inches default '''
+    with stage('clean', rows=len(kips)):
+        inch = asColumn(inch)
+        kips = asColumn(kips)
+
+        keep = (kips >= min_kips) & (inch >= 0)
+        strain = inch[keep]
+        stress = kips[keep]
+        if len(stress) == 0:
+            return strain, stress
+
+    with stage('derive', rows=len(stress)):
+        np.subtract(strain, strain[0], out=strain)  # corrected displacement
+        np.divide(strain, radius, out=strain)
+        if stress_per_force is None:
+            stress_per_force = 1000 / ((radius ** 2) * np.pi)
+        np.multiply(stress, stress_per_force, out=stress)
+    return strain, stress
+
+
+def finiteCurve(strain, stress):
+    ''' strain and stress without the rows where either is not a number, such as the blank lines at
+        the end of a test file, which kipsCurve's min_kips filter drops on the Kips path '''
+    strain = asColumn(strain)
+    stress = asColumn(stress)
+    keep = np.isfinite(strain) & np.isfinite(stress)
+    if keep.all():
+        return strain, stress
+    return strain[keep], stress[keep]
+
+
+def rollingMean(values, window, out=None, work=None):
+    ''' Trailing mean over window samples from one cumulative sum, NaN for the first window - 1
+        samples like pandas' rolling(window).mean(). out and work may be preallocated buffers '''
+    n = len(values)
+    if out is None:
+        out = np.empty(n, dtype=np.float64)
+    if n < window:
+        out[:] = np.nan
+        return out
+    if work is None:
+        work = np.empty(n, dtype=np.float64)
+
+    np.cumsum(values, out=work)
+    out[window - 1] = work[window - 1]
+    np.subtract(work[window:], work[:n - window], out=out[window:])
+    out[window - 1:] /= window
+    out[:window - 1] = np.nan
+    return out
+
+
+def linearFit(x, y):
+    ''' Least squares slope, intercept and Pearson r from the five running sums, matching
+        scipy.stats.linregress without building residual arrays '''
+    n = len(x)
+    if n < 2:
+        return np.nan, np.nan, np.nan
+
+    mean_x = x.sum() / n
+    mean_y = y.sum() / n
+    sxx = np.dot(x, x) / n - mean_x * mean_x
+    syy = np.dot(y, y) / n - mean_y * mean_y
+    sxy = np.dot(x, y) / n - mean_x * mean_y
+    if sxx <= 0:
+        return np.nan, np.nan, np.nan
+
+    slope = sxy / sxx
+    intercept = mean_y - slope * mean_x
+    rvalue = sxy / np.sqrt(sxx * syy) if syy > 0 else 0.0
+    return slope, intercept, float(np.clip(rvalue, -1, 1))
+
+
+def findElasticRegion(strain, stress, window_fractions=(0.1, 0.15, 0.2, 0.3, 0.4), min_samples=20,
+                      stability_weight=0.1, min_stress_span=0.25):
+    ''' Finds the most linear stretch of the loading curve (start of the data up to the peak).
+        Every window of each candidate length whose fitted line rises by at least min_stress_span of
+        the peak stress (shorter ones fit noise, and the elastic region of concrete runs to about 40%
+        of the peak) is scored by its R^2 minus stability_weight times the relative difference
+        between the slopes of its two halves, capped at 1, which penalizes the curving toe and
+        pre-peak softening. Window sums come from prefix sums, so each candidate length costs O(n)
+        instead of one linregress per window. Returns (start, end) sample indices, the whole curve
+        when no window qualifies '''
+    n = len(stress)
+    if n < 2 * min_samples:
+        return 0, n
+
+    # standardized values keep the prefix-sum differences well conditioned on long logs
+    x = (strain - strain.mean()) / (strain.std() or 1)
+    y = (stress - stress.mean()) / (stress.std() or 1)
+    min_rise = min_stress_span * stress.max() / (stress.std() or 1)  # in the standardized stress
+    sums = np.zeros((5, n + 1))
+    np.cumsum(x, out=sums[0, 1:])
+    np.cumsum(y, out=sums[1, 1:])
+    np.cumsum(x * x, out=sums[2, 1:])
+    np.cumsum(x * y, out=sums[3, 1:])
+    np.cumsum(y * y, out=sums[4, 1:])
+
+    def windowFits(start, length):
+        # slope and r of every window [start, start + length) from the prefix sums
+        end = start + length
+        sx, sy, sxx, sxy, syy = (sums[:, end] - sums[:, start]) / length
+        var_x = sxx - sx * sx
+        var_y = syy - sy * sy
+        cov = sxy - sx * sy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = cov / var_x
+            r_squared = cov * cov / (var_x * var_y)
+        return slope, r_squared
+
+    best_score = -np.inf
+    best = (0, n)
+    for fraction in window_fractions:
+        length = max(int(fraction * n), min_samples)
+        half = length // 2
+        if length > n:
+            continue
+
+        starts = np.arange(n - length + 1)
+        slope, r_squared = windowFits(starts, length)
+        first_half, _ = windowFits(starts, half)
+        second_half, _ = windowFits(starts + half, length - half)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            instability = np.minimum(np.abs(first_half - second_half) / np.abs(slope), 1)
+        score = r_squared - stability_weight * instability
+        rise = slope * (x[starts + length - 1] - x[starts])
+        score[~np.isfinite(score) | (slope <= 0) | (rise < min_rise)] = -np.inf
+
+        i = int(np.argmax(score))
+        if score[i] > best_score:
+            best_score = score[i]
+            best = (i, i + length)
+    return best
+
+
+def firstCrossing(values, start=0, end=None):
+    ''' Fractional index where values first reach zero from below within [start, end), interpolated
+        between the samples on either side; NaN if they never do '''
+    reached = values[start:end] >= 0
+    i = int(np.argmax(reached)) if len(reached) else 0
+    if not len(reached) or not reached[i]:
+        return np.nan
+    i += start
+    if i == start or values[i] == values[i - 1]:
+        return float(i)
+    return i - values[i] / (values[i] - values[i - 1])
+
+
+def atPosition(values, position):
+    ''' values linearly interpolated at a fractional index '''
+    if np.isnan(position):
+        return np.nan
+    i = int(position)
+    if i + 1 >= len(values):
+        return values[i]
+    return values[i] + (position - i) * (values[i + 1] - values[i])
+
+
+def curveMetrics(strain, stress, peak_index, slope, intercept, fit_start=0):
+    ''' Full-curve metrics from one set of O(n) passes over the arrays:
+        strain_at_peak
+        toughness, toughness_to_peak: area under the whole curve and up to the peak (cumulative
+            trapezoid, psi * strain, i.e. in-lb/in^3 for strain in in/in)
+        yield_strain, yield_strength: where the curve crosses the elastic line offset by YIELD_OFFSET
+            strain, searched from the start of the elastic fit
+        secant_modulus: ASTM C469 chord modulus from CHORD_START_STRAIN to CHORD_STRESS_FRACTION of
+            the peak on the loading branch
+        softening_slope: least squares slope of the descending branch, from the peak until the stress
+            falls below SOFTENING_FLOOR of the peak (NaN unless the stress falls at least SOFTENING_MIN_DROP
+            below the peak over SOFTENING_MIN_SAMPLES samples and the slope is negative)
+        Metrics the curve does not reach are NaN '''
+    n = len(stress)
+    metrics = dict.fromkeys(metric_names, np.nan)
+    if n < 2:
+        return metrics
+    peak_stress = stress[peak_index]
+    metrics['strain_at_peak'] = strain[peak_index]
+
+    areas = np.diff(strain)
+    areas *= stress[1:] + stress[:-1]
+    areas *= 0.5
+    toughness = np.cumsum(areas)
+    metrics['toughness'] = toughness[-1]
+    metrics['toughness_to_peak'] = toughness[peak_index - 1] if peak_index > 0 else 0.0
+
+    if np.isfinite(slope) and slope > 0:
+        # the curve's distance below the offset line, positive once it has crossed it
+        below = slope * (strain - YIELD_OFFSET)
+        below += intercept
+        below -= stress
+        position = firstCrossing(below, fit_start)
+        metrics['yield_strain'] = atPosition(strain, position)
+        metrics['yield_strength'] = atPosition(stress, position)
+
+    loading = slice(0, peak_index + 1)
+    chord_end = firstCrossing(stress[loading] - CHORD_STRESS_FRACTION * peak_stress)
+    chord_start = firstCrossing(strain[loading] - CHORD_START_STRAIN)
+    chord_strain = atPosition(strain, chord_end)
+    if chord_strain > CHORD_START_STRAIN:
+        metrics['secant_modulus'] = (CHORD_STRESS_FRACTION * peak_stress - atPosition(stress, chord_start)) / (
+            chord_strain - CHORD_START_STRAIN)
+
+    softened = firstCrossing(SOFTENING_FLOOR * peak_stress - stress, peak_index)
+    end = int(np.ceil(softened)) if np.isfinite(softened) else n
+    if end - peak_index >= SOFTENING_MIN_SAMPLES and (
+            stress[peak_index:end].min() <= (1 - SOFTENING_MIN_DROP) * peak_stress):
+        softening_slope = linearFit(strain[peak_index:end], stress[peak_index:end])[0]
+        if softening_slope < 0:
+            metrics['softening_slope'] = softening_slope
+    return {name: float(value) for name, value in metrics.items()}
+
+
+def analyzeCurve(strain, stress, fit_rows=None, window=ROLLING_WINDOW, metrics=True):
+    ''' Peak, rolling mean, the elastic regression and the full-curve metrics of a stress-strain
+        curve. The regression uses the first fit_rows samples (at most up to the peak), or the window
+        findElasticRegion picks when fit_rows is None '''
+    with stage('derive', rows=len(stress)):
+        strain = asColumn(strain)
+        stress = asColumn(stress)
+
+        peak_index = int(np.nanargmax(stress)) if len(stress) else 0
+        rolling = rollingMean(stress, window)
+
+    with stage('regress', rows=peak_index + 1):
+        if fit_rows is None:
+            fit_start, fit_end = findElasticRegion(strain[:peak_index + 1], stress[:peak_index + 1])
+        else:
+            fit_start, fit_end = 0, min(fit_rows, peak_index + 1)
+        slope, intercept, rvalue = linearFit(strain[fit_start:fit_end], stress[fit_start:fit_end])
+        curve_metrics = curveMetrics(strain, stress, peak_index, slope, intercept, fit_start) if metrics else None
+    return curve_result(strain, stress, rolling, peak_index, slope, intercept, rvalue, fit_start, fit_end,
+                        curve_metrics)
@@ -0,0 +1,67 @@
+''' Cold-start and batch prediction through Predictive (xgboost, sklearn, pandas) and through the
+    NumPy-only compiled_model. Cold starts run in fresh interpreters and report wall time to the first
+    prediction and peak resident memory; batch scoring checks the two agree bit for bit.
+
+        python benchmarks/bench_compiled.py --starts 5 --mixes 100000
+'''
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from concrete_analysis import Predictive
+from compiled_model import compiled_model
+from generators import mixTable
+
+mix = '540, 0, 0, 162, 2.5, 1040, 676, 28'
+starts = {'Predictive': 'from concrete_analysis import Predictive\nPredictive(%s).strength_predict' % mix,
+          'compiled_model': 'from compiled_model import compiled_model\ncompiled_model().predict([%s])' % mix}
+# peak RSS of the child itself (getrusage's maxrss can carry over from the forking parent)
+report = '\nprint([line.split()[1] for line in open("/proc/self/status") if line.startswith("VmHWM")][0])'
+
+
+def coldStart(code, repeats):
+    ''' Best wall time of a fresh interpreter running code, and its peak RSS in MB (Linux) '''
+    seconds = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code + report], cwd=REPO, check=True, capture_output=True,
+                                text=True).stdout
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds, int(output.split()[-1]) / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--starts', type=int, default=5)
+    parser.add_argument('--mixes', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    predictive = Predictive()  # trains or loads the model and publishes it for compiled_model
+    for name, code in (('python', 'pass'), ('numpy', 'import numpy')):
+        seconds, peak_mb = coldStart(code, args.starts)
+        print('%-16s %10.1f ms  %8.1f MB  (import only)' % (name, seconds * 1000, peak_mb))
+    for name, code in starts.items():
+        seconds, peak_mb = coldStart(code, args.starts)
+        print('%-16s %10.1f ms  %8.1f MB  to the first prediction' % (name, seconds * 1000, peak_mb))
+
+    mixes = mixTable(args.mixes, with_strength=False)
+    compiled = compiled_model()
+    start = time.perf_counter()
+    expected = predictive.predict_many(mixes, report=False)
+    xgboost_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    predicted = compiled.predict(mixes.to_numpy())
+    compiled_seconds = time.perf_counter() - start
+    print('%-16s %10.0f mixes/s' % ('Predictive', args.mixes / xgboost_seconds))
+    print('%-16s %10.0f mixes/s' % ('compiled_model', args.mixes / compiled_seconds))
+    print('Bit-identical predictions: %s' % np.array_equal(expected, predicted))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+''' Times XLSX ingest of a synthetic UTM export: pd.read_excel (the old path), openpyxl read-only
+    streaming, the fast reader in xlsx_reader, and a memory-mapped load from the ingest cache.
+
+        python benchmarks/bench_ingest.py --rows 50000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest import ingest_cache, readTable
+from xlsx_reader import readXlsxOpenpyxl
+
+
+def writeUtmWorkbook(file_name, rows, seed=0):
+    ''' A UTM-style export: a metadata block, the channel header, then rows of readings '''
+    rng = np.random.default_rng(seed)
+    strain = np.linspace(0, 0.004, rows)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['Diameter (in):', 'Stress at Break (psi):', 'Specimen:'])
+    sheet.append([4, 6000.0, 'Synthetic'])
+    sheet.append(['Time (s)', 'Ram Position (in)', 'Load (lbf)', 'Stress (psi)', 'Long. Strain'])
+    stress = 6000 * np.sin(strain / 0.004 * np.pi / 2) + rng.normal(0, 5, rows)
+    for i in range(rows):
+        sheet.append([i * 0.01, 0.5 - strain[i] * 4, stress[i] * 12.566, stress[i], strain[i]])
+    workbook.save(file_name)
+
+
+def timed(function, repeats):
+    best = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        file_name = os.path.join(folder, 'utm.xlsx')
+        writeUtmWorkbook(file_name, args.rows)
+        cache = ingest_cache(os.path.join(folder, 'cache'))
+        cache.load(file_name)
+
+        results = [('pd.read_excel', timed(lambda: pd.read_excel(file_name, header=None), args.repeats)),
+                   ('openpyxl read-only', timed(lambda: readXlsxOpenpyxl(file_name), args.repeats)),
+                   ('xlsx_reader', timed(lambda: readTable(file_name), args.repeats)),
+                   ('ingest cache (mmap)', timed(lambda: cache.load(file_name), args.repeats))]
+
+    baseline = results[0][1]
+    print('%i rows' % args.rows)
+    for name, seconds in results:
+        print('%-20s %8.3f s  %10.0f rows/s  %6.1fx' % (name, seconds, args.rows / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+''' Compares the old per-analyzer pandas pipeline against analysis_kernel on a synthetic
+    multi-million sample inch/kips log. Reports wall time and tracemalloc peak for each.
+
+        python benchmarks/bench_kernel.py --samples 5000000
+'''
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy.stats import linregress
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis_kernel import kipsCurve, analyzeCurve, curveMetrics
+
+
+def syntheticLog(samples, seed=0):
+    ''' Crosshead inches and kips for a cylinder loaded past its peak, with sensor noise '''
+    rng = np.random.default_rng(seed)
+    inch = np.linspace(0, 0.05, samples) + rng.normal(0, 1e-5, samples)
+    x = np.linspace(0, 1.4, samples)
+    kips = 75 * np.where(x < 1, 2 * x - x ** 2, 1 - 2 * (x - 1) ** 2) + rng.normal(0, 0.05, samples)
+    return pd.DataFrame({'inch': inch, 'kips': kips})
+
+
+def pandasPipeline(df, radius=2):
+    ''' The rename / copy / mask / truncate / rolling / linregress chain the analyzers used before '''
+    area = (radius ** 2) * np.pi
+    concrete_dft = df[['kips', 'inch']]
+    concrete_dftt = concrete_dft.drop([0, 1])
+    concrete_dftt['kips'] = pd.to_numeric(concrete_dftt['kips'])
+    concrete_dftt['inch'] = pd.to_numeric(concrete_dftt['inch'])
+    concrete_dff = concrete_dftt[(concrete_dftt['kips'] >= 0.5) & (concrete_dftt['inch'] >= 0)]
+    row_max = concrete_dff['kips'].idxmax()
+    concrete_dff['corrected disp'] = concrete_dff['inch'] - concrete_dff.iloc[0]['inch']
+    concrete_dff['strain'] = (concrete_dff['corrected disp'] / radius).truncate(after=row_max)
+    concrete_dff['stress'] = ((concrete_dff['kips'] * 1000) / area).truncate(after=row_max)
+    ultimate_strength = concrete_dff['stress'].max()
+    reg_line_head = int(3/7*len(concrete_dff))
+    concrete_dff['rolling'] = concrete_dff['stress'].rolling(50).mean()
+    reg_line = linregress(concrete_dff['strain'].head(reg_line_head), concrete_dff['stress'].head(reg_line_head))
+    return ultimate_strength, reg_line.slope
+
+
+def kernelPipeline(df, radius=2):
+    strain, stress = kipsCurve(df['inch'].values[2:], df['kips'].values[2:], radius, 0.5)
+    curve = analyzeCurve(strain, stress, int(3/7*len(stress)))
+    return curve.ultimate_strength, curve.slope
+
+
+def measure(function, df, repeats):
+    times = []
+    peak = 0
+    for i in range(repeats):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = function(df)
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, min(times), peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=5000000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    pd.options.mode.chained_assignment = None
+    df = syntheticLog(args.samples)
+    print('%i samples' % args.samples)
+    baseline = None
+    for name, function in (('pandas pipeline', pandasPipeline), ('analysis_kernel', kernelPipeline)):
+        (strength, modulus), seconds, peak = measure(function, df, args.repeats)
+        print('%-16s %8.3f s  %10.0f samples/s  peak %7.1f MB  strength %.2f psi  modulus %.0f psi' % (
+            name, seconds, args.samples / seconds, peak / 1e6, strength, modulus))
+        if baseline is None:
+            baseline = (seconds, peak)
+        else:
+            print('speedup %.1fx, peak memory %.1fx lower' % (baseline[0] / seconds, baseline[1] / peak))
+
+    # the full-curve metrics on top of the kernel, over the whole (pre- and post-peak) curve
+    strain, stress = kipsCurve(df['inch'].values[2:], df['kips'].values[2:], 2, 0.5)
+    curve = analyzeCurve(strain, stress, int(3/7*len(stress)), metrics=False)
+    metrics, seconds, peak = measure(lambda df: curveMetrics(curve.strain, curve.stress, curve.peak_index, curve.slope,
+                                                             curve.intercept), df, args.repeats)
+    print('%-16s %8.3f s  %10.0f samples/s  peak %7.1f MB  toughness %.2f  secant modulus %.0f psi' % (
+        'curveMetrics', seconds, len(strain) / seconds, peak / 1e6, metrics['toughness'], metrics['secant_modulus']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+''' Exports synthetic specimen plots the old way (pyplot figures with every sample, never closed) and
+    through plot_render (LTTB-decimated specs on Agg figures released after each file), reporting
+    time per plot and the memory still held once the export is done.
+
+        python benchmarks/bench_render.py --specimens 50 --samples 50000
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis_kernel import kipsCurve, analyzeCurve
+from bench_kernel import syntheticLog
+from plot_render import plot_spec, plot_renderer
+
+
+def oldExport(curve, name, folder, dpi):
+    plt.figure()
+    plt.plot(curve.strain, curve.stress, label='Stress vs. Strain of %s' % name)
+    plt.plot(curve.strain, curve.intercept + curve.slope * curve.strain, label='Regression Line')
+    plt.plot(curve.strain, curve.rolling, label='Rolling Average')
+    plt.legend(fontsize=10)
+    plt.savefig(os.path.join(folder, '%s plot.png' % name), dpi=dpi)
+
+
+def curveSpec(curve, name):
+    plot = plot_spec(name, 'Stress vs. Strain of %s' % name)
+    plot.addSeries(curve.strain, curve.stress, 'Stress vs. Strain of %s' % name)
+    plot.addLine(curve.slope, curve.intercept, curve.strain, 'Regression Line')
+    plot.addSeries(curve.strain, curve.rolling, 'Rolling Average')
+    return plot
+
+
+def measure(name, function):
+    ''' Wall time of one untraced run, then the memory held and peak of a second, traced run '''
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    plt.close('all')
+
+    tracemalloc.start()
+    function()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return name, seconds, held, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--specimens', type=int, default=50)
+    parser.add_argument('--samples', type=int, default=50000)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    log = syntheticLog(args.samples)
+    strain, stress = kipsCurve(log['inch'], log['kips'], 2, 0.5)
+    curve = analyzeCurve(strain, stress)
+    names = ['specimen %03i' % i for i in range(args.specimens)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        renderer = plot_renderer(workers=args.workers, dpi=args.dpi)
+        results = [
+            measure('pyplot, all samples', lambda: [oldExport(curve, name, folder, args.dpi) for name in names]),
+            measure('plot_render PNG', lambda: renderer.exportPng([curveSpec(curve, name) for name in names], folder)),
+            measure('plot_render PDF', lambda: renderer.exportPdf([curveSpec(curve, name) for name in names],
+                                                                  os.path.join(folder, 'report.pdf'))),
+        ]
+        renderer.close()
+        plt.close('all')
+
+    print('%i specimens of %i samples' % (args.specimens, len(curve.stress)))
+    for name, seconds, held, peak in results:
+        print('%-20s %8.1f ms/plot  held after export %8.1f MB  peak %8.1f MB' % (
+            name, seconds / args.specimens * 1000, held / 1e6, peak / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+''' Load test for prediction_server.py. Client threads each send single-mix /predict requests over a
+    kept-alive connection for a fixed time; reports client-side p50/p99 latency and throughput, and
+    the batch sizes the server's micro-batcher formed. Without --url a local server is started for the
+    run (and run again with batching off when --compare-unbatched is given).
+
+        python benchmarks/bench_server.py --clients 1 8 32 --seconds 5
+        python benchmarks/bench_server.py --url http://127.0.0.1:8765 --clients 16
+'''
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from generators import mixTable
+
+
+def startServer(port, max_batch, max_wait_ms, compiled):
+    command = [sys.executable, os.path.join(REPO, 'prediction_server.py'), '--port', str(port), '--max-batch',
+               str(max_batch), '--max-wait-ms', str(max_wait_ms)] + (['--compiled'] if compiled else [])
+    process = subprocess.Popen(command, cwd=REPO, stdout=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:%i' % port
+    for i in range(600):  # the first start may train the model
+        try:
+            urlopen(url + '/health', timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('prediction server did not start')
+
+
+def client(url, mixes, stop, latencies, errors):
+    address = urlparse(url)
+    connection = http.client.HTTPConnection(address.hostname, address.port, timeout=30)
+    i = 0
+    while not stop.is_set():
+        body = json.dumps({'mix': mixes[i % len(mixes)]})
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/predict', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except OSError as error:
+            errors.append(str(error))
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    connection.close()
+
+
+def loadTest(url, clients, seconds, mixes):
+    before = json.loads(urlopen(url + '/metrics').read())
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(url, mixes[c::clients], stop, latencies, errors))
+               for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    after = json.loads(urlopen(url + '/metrics').read())
+
+    latencies = np.array(latencies) * 1000
+    batches = after.get('batches', 0) - before.get('batches', 0)
+    return {'clients': clients, 'requests': len(latencies), 'errors': len(errors),
+            'requests_per_s': len(latencies) / elapsed, 'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_batch': (after['mixes'] - before['mixes']) / batches if batches else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help='server to test (default: start one locally)')
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--compiled', action='store_true', help='start the server with the compiled model')
+    parser.add_argument('--compare-unbatched', action='store_true',
+                        help='also run against a server that predicts every request on its own')
+    args = parser.parse_args(argv)
+
+    mixes = mixTable(5000, with_strength=False).to_numpy().tolist()
+    runs = [('batched', 256, args.max_wait_ms)] + ([('unbatched', 1, 0.0)] if args.compare_unbatched else [])
+    if args.url:
+        runs = [('server', None, None)]
+
+    print('%-10s %8s %10s %8s %12s %10s %10s %11s' % ('server', 'clients', 'requests', 'errors', 'requests/s',
+                                                       'p50 (ms)', 'p99 (ms)', 'mean batch'))
+    for name, max_batch, max_wait_ms in runs:
+        process, url = (None, args.url) if args.url else startServer(args.port, max_batch, max_wait_ms,
+                                                                    args.compiled)
+        try:
+            for clients in args.clients:
+                result = loadTest(url, clients, args.seconds, mixes)
+                print('%-10s %8i %10i %8i %12.0f %10.2f %10.2f %11.1f' % (
+                    name, clients, result['requests'], result['errors'], result['requests_per_s'],
+                    result['p50_ms'], result['p99_ms'], result['mean_batch']))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+''' Cold-start times of the entry points, each in a fresh interpreter: the GUI up to its first window,
+    the analysis module, a first UTM analysis and a first prediction. Alongside the best-of-repeats
+    time, each case lists the heavy libraries it ended up importing, and fails the run if it imported
+    one its feature does not need (e.g. xgboost for a UTM analysis). Results can be saved and compared
+    like benchmarks/suite.py baselines.
+
+        python benchmarks/bench_startup.py --save benchmarks/startup.json
+        python benchmarks/bench_startup.py --compare benchmarks/startup.json
+'''
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+from generators import writeUtmCsv
+from suite import saveBaseline, compareBaseline
+
+heavy = ['numpy', 'pandas', 'matplotlib', 'xgboost', 'sklearn', 'openpyxl', 'PySimpleGUI']
+
+utm_analysis = '''
+import ingest, concrete_analysis
+from results_store import results_store
+ingest.default_cache = ingest.ingest_cache(os.path.join(folder, 'ingest_cache'))
+concrete_analysis.UTM_analysis.results = results_store(os.path.join(folder, 'results.db'), ingest.default_cache)
+concrete_analysis.UTM_analysis(os.path.join(folder, 'utm.csv'), 'bench').specimenAnalysis(show=False, save_plot=False,
+                                                                                          use_store=False)
+'''
+
+# name: (code run after `import os` with `folder` set, libraries it must not import, needs a display)
+cases = {'gui first window': ("import concrete_gui\n"
+                              "window = concrete_gui.sg.Window('bench', concrete_gui.home_screen, finalize=True)\n"
+                              "window.close()", ['pandas', 'matplotlib', 'xgboost', 'sklearn', 'openpyxl'], True),
+         'analysis import': ('import concrete_analysis', ['matplotlib', 'xgboost', 'sklearn', 'openpyxl'], False),
+         'first utm analysis': (utm_analysis, ['matplotlib', 'xgboost', 'sklearn', 'openpyxl'], False),
+         'first prediction': ('from concrete_analysis import Predictive\n'
+                              'Predictive(540, 0, 0, 162, 2.5, 1040, 676, 28)', ['matplotlib', 'openpyxl'], False),
+         'compiled prediction': ('from compiled_model import compiled_model\n'
+                                 'compiled_model().predict([540, 0, 0, 162, 2.5, 1040, 676, 28])',
+                                 [name for name in heavy if name != 'numpy'], False)}
+
+report = '\nimport sys\nprint(",".join(name for name in %r if name in sys.modules))' % heavy
+
+
+def coldStart(code, folder, repeats):
+    ''' Best wall time of a fresh interpreter running code, and the heavy libraries it imported '''
+    seconds = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', 'import os\nfolder = %r\n' % folder + code + report], cwd=REPO,
+                                check=True, capture_output=True, text=True).stdout
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds, [name for name in output.strip().splitlines()[-1].split(',') if name]
+
+
+def canOpenWindows():
+    code = 'import PySimpleGUI as sg\nsg.Window("", [[]], finalize=True).close()'
+    return subprocess.run([sys.executable, '-c', code], capture_output=True).returncode == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=list(cases), default=None)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--save', default=None, help='write the results as a baseline JSON file')
+    parser.add_argument('--compare', default=None, help='baseline JSON file to check the results against')
+    parser.add_argument('--time-tolerance', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    args = parser.parse_args(argv)
+
+    windows = canOpenWindows()
+    results, failures = [], []
+    with tempfile.TemporaryDirectory() as folder:
+        writeUtmCsv(os.path.join(folder, 'utm.csv'), 100000)
+        for name in args.cases or cases:
+            code, unneeded, needs_display = cases[name]
+            if needs_display and not windows:
+                print('%-20s skipped: PySimpleGUI cannot open a window here' % name)
+                continue
+            seconds, imported = coldStart(code, folder, args.repeats)
+            extra = [library for library in imported if library in unneeded]
+            failures += ['%s imported %s' % (name, library) for library in extra]
+            results.append({'case': 'startup ' + name, 'rows': 1, 'seconds': seconds, 'peak_mb': 0.0})
+            print('%-20s %9.1f ms  imports %s%s' % (name, seconds * 1000, ', '.join(imported) or 'none',
+                                                    '  UNNEEDED: ' + ', '.join(extra) if extra else ''))
+
+    if args.save:
+        saveBaseline(results, args.save)
+        print('Baseline written to %s' % args.save)
+    if args.compare:
+        failures += compareBaseline(results, args.compare, args.time_tolerance)
+    for line in failures:
+        print('REGRESSION ' + line)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
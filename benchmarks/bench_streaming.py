@@ -0,0 +1,61 @@
+''' Per-update latency of the live analysis mode on a synthetic inch/kips log, sample by sample and
+    in small batches, compared with re-running the whole-file kernel on every update.
+
+        python benchmarks/bench_streaming.py --samples 200000 --batch 50
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analysis_kernel import kipsCurve, analyzeCurve
+from bench_kernel import syntheticLog
+from streaming import streaming_analysis, replay
+
+
+def chunks(inch, kips, batch_size):
+    for i in range(0, len(inch), batch_size):
+        yield inch[i:i + batch_size], kips[i:i + batch_size]
+
+
+def report(name, latencies, samples_per_update):
+    total = latencies.sum()
+    print('%-24s p50 %9.2f us  p99 %9.2f us  %12.0f samples/s' % (
+        name, np.percentile(latencies, 50) * 1e6, np.percentile(latencies, 99) * 1e6,
+        len(latencies) * samples_per_update / total))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--rerun-updates', type=int, default=20,
+                        help='updates timed for the re-run-the-kernel baseline (it is O(n) per update)')
+    args = parser.parse_args(argv)
+
+    log = syntheticLog(args.samples)
+    inch = log['inch'].to_numpy()
+    kips = log['kips'].to_numpy()
+
+    single = streaming_analysis()
+    report('add() per sample', replay(single, chunks(inch, kips, 1)), 1)
+    batched = streaming_analysis()
+    report('addBatch(%i)' % args.batch, replay(batched, chunks(inch, kips, args.batch)), args.batch)
+
+    latencies = []
+    for end in np.linspace(len(inch) // 2, len(inch), args.rerun_updates).astype(int):
+        start = time.perf_counter()
+        strain, stress = kipsCurve(inch[:end], kips[:end], 2, 0.5)
+        analyzeCurve(strain, stress, fit_rows=len(stress))
+        latencies.append(time.perf_counter() - start)
+    report('kernel re-run per update', np.array(latencies), 1)
+
+    print('final estimate: peak %(peak_stress).1f psi  modulus %(youngs_modulus).0f psi  R^2 %(r_squared).4f'
+          % single.estimates())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+''' Synthetic test files and mix tables for the benchmarks, from 10k to 10M rows. Curves follow
+    Hognestad's parabola up to the peak with a linear descending branch, a seating toe, sensor noise
+    and a few pre-load rows, at realistic magnitudes for concrete cylinders and cob specimens. Mix
+    tables resample concrete_data.csv with jitter, in the lb/yd^3 units the model is trained in. '''
+import os
+
+import numpy as np
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LB_PER_KG = 1.68555
+PSI_PER_MPA = 145.038
+
+# peak stress (psi), strain at peak, strain at the end of the descending branch, noise (psi)
+materials = {'concrete': (6000.0, 0.003, 0.0045, 8.0),
+             'cob': (140.0, 0.04, 0.06, 1.5)}
+
+
+def stressStrainCurve(rows, material='concrete', seed=0):
+    ''' (strain, stress) of a monotonic compression test sampled at rows points '''
+    peak, strain_at_peak, strain_end, noise = materials[material]
+    rng = np.random.default_rng(seed)
+    peak = peak * rng.uniform(0.9, 1.1)
+
+    strain = np.linspace(0, strain_end, rows)
+    ratio = strain / strain_at_peak
+    stress = np.where(ratio <= 1, peak * (2 * ratio - ratio ** 2),
+                      peak * (1 - 0.15 * (strain - strain_at_peak) / (strain_end - strain_at_peak)))
+    toe = strain < 0.05 * strain_at_peak  # seating: the platens close before the specimen carries load
+    stress[toe] *= strain[toe] / (0.05 * strain_at_peak)
+    stress += rng.normal(0, noise, rows)
+    strain += rng.normal(0, strain_end * 1e-4, rows)
+    return strain, stress
+
+
+def writeKipsCsv(file_name, rows, material='concrete', radius=2, seed=0):
+    ''' An inch, kips log like conc_mix_test.csv / cob_mix_test.csv. The kernel's strain is crosshead
+        inches over the radius, so that is inverted here '''
+    strain, stress = stressStrainCurve(rows, material, seed)
+    inch = 0.0003 + strain * radius
+    kips = stress * (radius ** 2) * np.pi / 1000
+    pd.DataFrame({'inch': inch, 'kips': kips}).to_csv(file_name, index=False, float_format='%.6f')
+    return file_name
+
+
+def utmTable(rows, seed=0, diameter=4):
+    strain, stress = stressStrainCurve(rows, 'concrete', seed)
+    return pd.DataFrame({'Time (s)': np.arange(rows) * 0.01,
+                         'Ram Position (in)': 0.5 - strain * diameter,
+                         'Load (lbf)': stress * np.pi * (diameter / 2) ** 2,
+                         'Stress (psi)': stress,
+                         'Long. Strain': strain}), float(stress.max())
+
+
+def writeUtmCsv(file_name, rows, seed=0, diameter=4):
+    ''' A UTM export as CSV: the metadata block, the channel header, then the readings '''
+    table, break_stress = utmTable(rows, seed, diameter)
+    with open(file_name, 'w', newline='') as f:
+        f.write('Diameter (in):,Stress at Break (psi):,Specimen:\n%s,%f,Synthetic\n' % (diameter, break_stress))
+        table.to_csv(f, index=False, float_format='%.6f')
+    return file_name
+
+
+def writeUtmXlsx(file_name, rows, seed=0, diameter=4):
+    ''' The same export as an .xlsx workbook (slow to write beyond a few hundred thousand rows) '''
+    import openpyxl
+
+    table, break_stress = utmTable(rows, seed, diameter)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['Diameter (in):', 'Stress at Break (psi):', 'Specimen:'])
+    sheet.append([diameter, break_stress, 'Synthetic'])
+    sheet.append(list(table.columns))
+    for row in table.itertuples(index=False):
+        sheet.append(list(row))
+    workbook.save(file_name)
+    return file_name
+
+
+def mixTable(rows, seed=0, with_strength=True):
+    ''' rows mixes resampled from concrete_data.csv with 5% jitter, converted to lb/yd^3 and psi '''
+    rng = np.random.default_rng(seed)
+    data = pd.read_csv(os.path.join(REPO, 'concrete_data.csv'))
+    sample = data.to_numpy(dtype=np.float64)[rng.integers(0, len(data), rows)]
+    sample[:, :7] *= rng.normal(1, 0.05, (rows, 7)).clip(0.8, 1.2) * LB_PER_KG
+    sample[:, 8] *= PSI_PER_MPA
+    mixes = pd.DataFrame(sample, columns=data.columns)
+    mixes['Age'] = mixes['Age'].round()
+    return mixes if with_strength else mixes.drop(columns='Strength')
@@ -0,0 +1,209 @@
+''' Benchmark suite for every hot path, on synthetic files from benchmarks/generators.py. Each case
+    runs at each requested size (capped per case where a size would take minutes, e.g. XLSX writing
+    and model training). Best-of-repeats wall time comes from untraced runs, peak memory from one
+    run under tracemalloc (Python and NumPy allocations; XGBoost's native buffers are not seen).
+
+        python benchmarks/suite.py --sizes 10000 100000 1000000 --save benchmarks/baseline.json
+        python benchmarks/suite.py --sizes 10000 100000 1000000 --compare benchmarks/baseline.json
+
+A compare run exits with status 1 when any case is slower or uses more memory than the baseline
+beyond the tolerances.
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ingest
+from concrete_analysis import Predictive, concrete_specimen, cob_specimen, UTM_analysis
+from results_store import results_store
+from generators import writeKipsCsv, writeUtmCsv, writeUtmXlsx, mixTable
+
+BASELINE_VERSION = 1
+
+
+def ingestCsv(folder, rows):
+    file_name = writeKipsCsv(os.path.join(folder, 'ingest.csv'), rows)
+    return lambda: ingest.readTable(file_name)
+
+
+def ingestXlsx(folder, rows):
+    file_name = writeUtmXlsx(os.path.join(folder, 'ingest.xlsx'), rows)
+    return lambda: ingest.readTable(file_name)
+
+
+def ingestCached(folder, rows):
+    file_name = writeKipsCsv(os.path.join(folder, 'cached.csv'), rows)
+    ingest.loadTestFile(file_name)
+    return lambda: ingest.loadTestFile(file_name).column(1).sum()
+
+
+def concreteKips(folder, rows):
+    file_name = writeKipsCsv(os.path.join(folder, 'concrete.csv'), rows)
+    ingest.loadTestFile(file_name)
+    specimen = concrete_specimen(file_name, 'concrete', 2, 2, 1, 'Imperial', 'Kips')
+    return lambda: specimen.concreteAnalysis(show=False, save_plot=False, use_store=False)
+
+
+def concreteStrain(folder, rows):
+    file_name = writeUtmCsv(os.path.join(folder, 'strain.csv'), rows)
+    ingest.loadTestFile(file_name)
+    specimen = concrete_specimen(file_name, 'strain', 2, 2, 1, 'Imperial', 'Strain')
+    return lambda: specimen.concreteAnalysis(show=False, save_plot=False, use_store=False)
+
+
+def cob(folder, rows):
+    file_name = writeKipsCsv(os.path.join(folder, 'cob.csv'), rows, 'cob', radius=3)
+    ingest.loadTestFile(file_name)
+    specimen = cob_specimen(file_name, 'cob', 3, 1, 2)
+    return lambda: specimen.cobAnalysis(show=False, save_plot=False, use_store=False)
+
+
+def utm(folder, rows):
+    file_name = writeUtmCsv(os.path.join(folder, 'utm.csv'), rows)
+    ingest.loadTestFile(file_name)
+    specimen = UTM_analysis(file_name, 'utm')
+    return lambda: specimen.specimenAnalysis(show=False, save_plot=False, use_store=False)
+
+
+def train(folder, rows):
+    mixes = mixTable(rows)
+    predictive = Predictive()
+    predictive.X = mixes.drop(columns='Strength').to_numpy()
+    predictive.y = mixes['Strength']
+    return predictive.train
+
+
+def predictSingle(folder, rows):
+    Predictive()  # the first instance loads the model into the shared store
+    return lambda: Predictive(540, 0, 0, 162, 2.5, 1040, 676, 28).strength_predict
+
+
+def predictBatch(folder, rows):
+    mixes = mixTable(rows, with_strength=False)
+    predictive = Predictive()
+    return lambda: predictive.predict_many(mixes, report=False)
+
+
+# name: (setup(folder, rows) -> callable, largest size run, fixed size or None)
+cases = {'ingest csv': (ingestCsv, None, None),
+         'ingest xlsx': (ingestXlsx, 200000, None),
+         'ingest cached': (ingestCached, None, None),
+         'concrete kips': (concreteKips, None, None),
+         'concrete strain': (concreteStrain, None, None),
+         'cob': (cob, None, None),
+         'utm': (utm, None, None),
+         'train': (train, 1000000, None),
+         'predict single': (predictSingle, None, 1),
+         'predict batch': (predictBatch, None, None)}
+
+
+def measure(function, repeats):
+    seconds = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def runSuite(sizes, names=None, repeats=3):
+    ''' Runs the cases at each size and returns the result records '''
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        ingest.default_cache = ingest.ingest_cache(os.path.join(folder, 'ingest_cache'))
+        # the analysis cases run with use_store=False; a store in the temp folder keeps anything else out of
+        # the repo's .results.db
+        store = results_store(os.path.join(folder, 'results.db'), ingest.default_cache)
+        for analyzer in (concrete_specimen, cob_specimen, UTM_analysis):
+            analyzer.results = store
+        for name in names or cases:
+            setup, max_rows, fixed_rows = cases[name]
+            case_sizes = [fixed_rows] if fixed_rows else [s for s in sizes if max_rows is None or s <= max_rows]
+            for rows in case_sizes:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    function = setup(folder, rows)
+                    seconds, peak = measure(function, repeats)
+                results.append({'case': name, 'rows': rows, 'seconds': seconds, 'peak_mb': peak / 1e6})
+                print('%-16s %10i rows  %10.4f s  %12.0f rows/s  peak %9.1f MB' % (
+                    name, rows, seconds, rows / seconds, peak / 1e6))
+    return results
+
+
+def machineInfo():
+    import pandas
+    import xgboost
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'numpy': np.__version__, 'pandas': pandas.__version__,
+            'xgboost': xgboost.__version__}
+
+
+def saveBaseline(results, file_name):
+    with open(file_name, 'w') as f:
+        json.dump({'version': BASELINE_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'machine': machineInfo(), 'results': results}, f, indent=1)
+
+
+def compareBaseline(results, file_name, time_tolerance=0.25, memory_tolerance=0.10, memory_slack_mb=1.0):
+    ''' Returns the regressions of results against a saved baseline as readable lines. Cases or sizes
+        missing from the baseline are skipped '''
+    with open(file_name) as f:
+        baseline = json.load(f)
+    previous = {(r['case'], r['rows']): r for r in baseline['results']}
+
+    regressions = []
+    for result in results:
+        before = previous.get((result['case'], result['rows']))
+        if before is None:
+            continue
+        label = '%s at %i rows' % (result['case'], result['rows'])
+        if result['seconds'] > before['seconds'] * (1 + time_tolerance):
+            regressions.append('%s: %.4f s vs %.4f s baseline (+%.0f%%)' % (
+                label, result['seconds'], before['seconds'], 100 * (result['seconds'] / before['seconds'] - 1)))
+        if result['peak_mb'] > before['peak_mb'] * (1 + memory_tolerance) + memory_slack_mb:
+            regressions.append('%s: peak %.1f MB vs %.1f MB baseline' % (label, result['peak_mb'], before['peak_mb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--cases', nargs='+', choices=list(cases), default=None)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--save', default=None, help='write the results as a baseline JSON file')
+    parser.add_argument('--compare', default=None, help='baseline JSON file to check the results against')
+    parser.add_argument('--time-tolerance', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    parser.add_argument('--memory-tolerance', type=float, default=0.10, help='allowed peak memory growth')
+    args = parser.parse_args(argv)
+
+    results = runSuite(args.sizes, args.cases, args.repeats)
+    if args.save:
+        saveBaseline(results, args.save)
+        print('Baseline written to %s' % args.save)
+    if args.compare:
+        regressions = compareBaseline(results, args.compare, args.time_tolerance, args.memory_tolerance)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        print('%i regressions against %s' % (len(regressions), args.compare))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
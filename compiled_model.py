@@ -0,0 +1,202 @@
+''' The strength model compiled to plain arrays, for predictions without xgboost, sklearn or pandas.
+    The booster's trees are flattened into one node table (feature, threshold, children, missing-value
+    direction, leaf value) and saved with the scaler's mean and scale as a run of .npy arrays. The evaluator
+    only needs NumPy: it walks every tree for a block of rows at once and adds the leaves in tree order
+    in float32, the way XGBoost does, so its predictions match model.predict bit for bit.
+
+    Predictive publishes the model it serves to .model_cache/compiled.npy, so once the GUI or any
+    prediction has run:
+
+        python compiled_model.py 540 0 0 162 2.5 1040 676 28
+        python compiled_model.py --batch mixes.csv --output predictions.csv
+'''
+import os
+import threading
+import time
+
+import numpy as np
+
+# argparse, json and zipfile (behind .npz) are left out of the import path: the point of this module
+# is a cold start that costs little more than importing NumPy
+
+COMPILED_VERSION = 1
+COMPILED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache', 'compiled.npy')
+BLOCK_ROWS = 512  # rows walked through every tree at once; small blocks keep the node indices in cache
+
+published_key = None  # key of the model last written to COMPILED_FILE by this process
+
+
+def exportModel(model, scaler, columns, key=''):
+    ''' The arrays of a fitted XGBRegressor and StandardScaler. children holds each node's (left, right)
+        pair; leaves point back at themselves, so walking depth steps from a root always ends on a leaf '''
+    import json
+
+    booster = json.loads(bytes(model.get_booster().save_raw('json')))['learner']
+    if booster['objective']['name'] != 'reg:squarederror':
+        raise ValueError('Only reg:squarederror models can be compiled, not %s' % booster['objective']['name'])
+    trees = booster['gradient_booster']['model']['trees']
+
+    feature, threshold, children, missing, value, roots, depth = [], [], [], [], [], [], 0
+    offset = 0
+    for tree in trees:
+        tree_left = np.asarray(tree['left_children'], dtype=np.int64)
+        tree_right = np.asarray(tree['right_children'], dtype=np.int64)
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        nodes = np.arange(len(tree_left))
+        leaf = tree_left == -1
+
+        feature.append(np.where(leaf, 0, tree['split_indices']))
+        threshold.append(np.where(leaf, np.float32(0), conditions))
+        left = np.where(leaf, nodes, tree_left) + offset
+        right = np.where(leaf, nodes, tree_right) + offset
+        children.append(np.stack([left, right], axis=1))
+        missing.append(np.where(np.asarray(tree['default_left'], dtype=bool), left, right))
+        value.append(np.where(leaf, conditions, np.float32(0)))  # a leaf's split condition is its value
+        roots.append(offset)
+        depth = max(depth, treeDepth(tree_left, tree_right))
+        offset += len(tree_left)
+
+    base_score = booster['learner_model_param']['base_score'].strip('[]')
+    return {'version': np.int32(COMPILED_VERSION), 'key': np.str_(key), 'columns': np.asarray(columns, dtype=str),
+            'feature': np.concatenate(feature).astype(np.int32), 'threshold': np.concatenate(threshold),
+            'children': np.concatenate(children).astype(np.int32),
+            'missing': np.concatenate(missing).astype(np.int32), 'value': np.concatenate(value),
+            'roots': np.asarray(roots, dtype=np.int32), 'depth': np.int32(depth),
+            'base_score': np.float32(base_score), 'mean': np.asarray(scaler.mean_, dtype=np.float64),
+            'scale': np.asarray(scaler.scale_, dtype=np.float64)}
+
+
+def treeDepth(left, right):
+    depth, level = 0, np.array([0])
+    while True:
+        level = level[left[level] != -1]
+        if len(level) == 0:
+            return depth
+        level = np.concatenate([left[level], right[level]])
+        depth += 1
+
+
+def saveCompiled(arrays, file_name=COMPILED_FILE):
+    ''' Writes the array names and then each array as consecutive .npy records, atomically '''
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    tmp_file = file_name + '.tmp%d-%d' % (os.getpid(), threading.get_ident())
+    with open(tmp_file, 'wb') as f:
+        np.save(f, np.asarray(list(arrays), dtype=str))
+        for name in arrays:
+            np.save(f, arrays[name])
+    os.replace(tmp_file, file_name)
+
+
+def loadCompiled(file_name=COMPILED_FILE):
+    with open(file_name, 'rb') as f:
+        return {str(name): np.load(f) for name in np.load(f)}
+
+
+def publish(model, scaler, columns, key, file_name=COMPILED_FILE):
+    ''' Makes (model, scaler) the model compiled_model() loads, unless it already is '''
+    global published_key
+    if key == published_key:
+        return
+    try:
+        published_key = str(loadCompiled(file_name)['key'])
+    except (OSError, KeyError, ValueError, EOFError):
+        published_key = None
+    if key != published_key:
+        saveCompiled(exportModel(model, scaler, columns, key), file_name)
+        published_key = key
+
+
+class compiled_model:
+    ''' Loads a compiled model and predicts strengths (psi) from mixes in lb/yd^3 '''
+
+    def __init__(self, file_name=COMPILED_FILE):
+        compiled = loadCompiled(file_name)
+        if int(compiled['version']) != COMPILED_VERSION:
+            raise ValueError('%s was compiled by another version; run a prediction to recompile' % file_name)
+        for name, array in compiled.items():
+            setattr(self, name, array)
+        self.columns = [str(column) for column in self.columns]
+        self.key = str(self.key)
+        self.depth = int(self.depth)
+        # np.take with native indices is the fastest gather; children flattened so node 2n + 1 is n's right child
+        self.children = self.children.ravel().astype(np.intp)
+        self.feature = self.feature.astype(np.intp)
+        self.missing = self.missing.astype(np.intp)
+        self.roots = self.roots.astype(np.intp)
+        self.throughput = 0
+
+    def scaled(self, mixes):
+        ''' StandardScaler.transform in float64, then the float32 cast XGBoost makes of its input '''
+        mixes = np.array(mixes, dtype=np.float64, ndmin=2)
+        if mixes.shape[1] != len(self.columns):
+            raise ValueError('Expected %i ingredient columns (%s), got %i' % (
+                len(self.columns), ', '.join(self.columns), mixes.shape[1]))
+        mixes -= self.mean
+        mixes /= self.scale
+        return mixes.astype(np.float32)
+
+    def leaves(self, X):
+        ''' Leaf values of every tree (columns) for every row of X '''
+        row_start = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        X = X.ravel()
+        node = np.broadcast_to(self.roots, (len(row_start), len(self.roots))).copy()
+        for i in range(self.depth):
+            value = np.take(X, row_start + np.take(self.feature, node))
+            # XGBoost goes left when value < threshold; NaN compares false and takes the node's default
+            child = np.take(self.children, 2 * node + (value >= np.take(self.threshold, node)))
+            missing = np.isnan(value)
+            node = np.where(missing, np.take(self.missing, node), child) if missing.any() else child
+        return np.take(self.value, node)
+
+    def predict(self, mixes):
+        ''' Strength of every mix (rows of ingredients in the model's column order) as float32 '''
+        start = time.perf_counter()
+        X = self.scaled(mixes)
+        predictions = np.empty(len(X), dtype=np.float32)
+        for first in range(0, len(X), BLOCK_ROWS):
+            block = X[first:first + BLOCK_ROWS]
+            leaves = np.empty((len(block), len(self.roots) + 1), dtype=np.float32)
+            leaves[:, 0] = self.base_score
+            leaves[:, 1:] = self.leaves(block)
+            # cumsum adds one tree at a time, left to right, matching XGBoost's float32 sum
+            predictions[first:first + BLOCK_ROWS] = np.cumsum(leaves, axis=1, dtype=np.float32)[:, -1]
+        elapsed = time.perf_counter() - start
+        self.throughput = len(X) / elapsed if elapsed > 0 else float('inf')
+        return predictions
+
+    def predictFile(self, file_name, output_file=None):
+        ''' Predicts every mix in a CSV with the model's column names in its header '''
+        with open(file_name) as f:
+            header = f.readline().strip().split(',')
+        missing_columns = [column for column in self.columns if column not in header]
+        if missing_columns:
+            raise ValueError('%s has no %s column' % (file_name, ', '.join(missing_columns)))
+        table = np.loadtxt(file_name, delimiter=',', skiprows=1, ndmin=2,
+                           usecols=[header.index(column) for column in self.columns])
+        predictions = self.predict(table)
+        if output_file is not None:
+            np.savetxt(output_file, np.column_stack([table, predictions]), delimiter=',', fmt='%.9g',
+                       header=','.join(self.columns + ['Predicted Strength (psi)']), comments='')
+        return predictions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mix', nargs='*', type=float, help='the ingredients in the model\'s column order')
+    parser.add_argument('--batch', default=None, help='CSV of mixes with the column names in its header')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--model', default=COMPILED_FILE)
+    args = parser.parse_args(argv)
+
+    model = compiled_model(args.model)
+    if args.batch:
+        predictions = model.predictFile(args.batch, args.output)
+        print('Predicted %i mixes (%f mixes/s)' % (len(predictions), model.throughput))
+    else:
+        print('%f psi' % model.predict(args.mix)[0])
+
+
+if __name__ == '__main__':
+    main()
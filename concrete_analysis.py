@@ -1,18 +1,81 @@
+import os
+import time
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-from scipy.stats import linregress
-import PySimpleGUI as sg
-import openpyxl
-from xgboost import XGBRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
+from model_store import model_store
+from model_search import loadParams
+from model_updates import model_updater
+from compiled_model import publish
+from analysis_kernel import kipsCurve, finiteCurve, analyzeCurve
+from ingest import loadTestFile
+from plot_render import plot_spec, finishPlot
+from instrument import stage, instrumented
+from results_store import results_store
+from units import IMPERIAL, SI, unitSystem, unitLabel, factor, convert, convertMixes, convertMetrics, stressPerForce
 
 pd.options.mode.chained_assignment = None  # default='warn'
 
+default_model_params = {'learning_rate': 0.05, 'n_estimators': 250}
+model_params = loadParams(default_model_params)  # the winner of the last model_search run, if any
+feature_columns = ['Cement', 'Blast Furnace Slag', 'Fly Ash', 'Water', 'Superplasticizer', 'Coarse Aggregate',
+                   'Fine Aggregate', 'Age']
+TRAINING_FILE = 'concrete_data.csv'  # kg/m^3 and MPa
+training_cache = {}
+
+
+def trainingData(file_name=TRAINING_FILE):
+    ''' The training table in the model's units (lb/yd^3 and psi), as (DataFrame, feature matrix,
+        strength Series). Converted with one multiply and kept for the process, so every Predictive
+        shares it; treat it as read-only '''
+    key = (os.path.abspath(file_name), os.path.getmtime(file_name))
+    if key not in training_cache:
+        table = pd.read_csv(file_name)
+        matrix = convertMixes(table[feature_columns + ['Strength']].to_numpy(dtype=np.float64), SI, IMPERIAL,
+                              with_strength=True)
+        df_train = pd.DataFrame(matrix, columns=feature_columns + ['Strength'])
+        training_cache.clear()
+        training_cache[key] = (df_train, matrix[:, :-1], df_train['Strength'])
+    return training_cache[key]
+
+
+def printResults(specimen):
+    ''' The results of an analyzer's last analysis, converted from psi into its output units '''
+    units = specimen.units
+    stress_units = unitLabel('stress', units)
+    metrics = convertMetrics(specimen.metrics, units)
+    print("%s Ultimate Strength: %f %s. Young's Modulus: %f %s" % (
+        specimen.specimen_name, convert(specimen.ultimate_strength, 'stress', IMPERIAL, units), stress_units,
+        convert(specimen.youngs_modulus, 'stress', IMPERIAL, units), stress_units))
+    print('%s Strain at Peak: %f. Toughness: %f (%f to peak) %s. Yield (0.2%% offset): %f %s at %f. Secant Modulus '
+          '(40%%): %f %s. Softening Slope: %f %s' % (
+              specimen.specimen_name, metrics['strain_at_peak'], metrics['toughness'], metrics['toughness_to_peak'],
+              unitLabel('toughness', units), metrics['yield_strength'], stress_units, metrics['yield_strain'],
+              metrics['secant_modulus'], stress_units, metrics['softening_slope'], stress_units))
+
+
+def stressPlot(specimen, ylim, legend_loc='best'):
+    ''' A plot_spec of an analyzer's curve. The curve stays in psi; the spec scales it into the output
+        units when drawn '''
+    stress_units = unitLabel('stress', specimen.units)
+    return plot_spec(specimen.specimen_name, 'Stress vs. Strain of %s with Ultimate Strength %f %s' % (
+        specimen.specimen_name, convert(specimen.ultimate_strength, 'stress', IMPERIAL, specimen.units),
+        stress_units), ylabel='Stress (%s)' % stress_units, ylim=ylim, legend_loc=legend_loc,
+        yscale=factor('stress', IMPERIAL, specimen.units))
+
 class Predictive:
-    def __init__(self, cement, blast_furnace_slag, flyash, water, super, coarse_agg, fine_agg, age):
-        self.df_train = pd.read_csv('concrete_data.csv')
+    store = model_store()  # shared across instances so every click reuses the same trained model
+    updates = model_updater(store)  # lab results boosted onto the model since it was trained
+    feature_columns = feature_columns
+
+    def __init__(self, cement=None, blast_furnace_slag=0, flyash=0, water=0, super=0, coarse_agg=0, fine_agg=0, age=28,
+                 units=IMPERIAL):
+        ''' Loads the strength model and, when a mix is given, predicts its strength. Leave the
+            ingredients out to use the instance for predict_many only. units is 'imperial' (mixes in
+            lb/yd^3, strengths in psi) or 'si' (kg/m^3 and MPa), for the mix given here and by default for
+            predict_many and addResults; the model itself works in lb/yd^3 and psi '''
+        self.df_train, self.X, self.y = trainingData()
+        self.units = unitSystem(units)
+        self.strength_units = unitLabel('stress', self.units)
         self.cement = cement
         self.blast_furnace_slag = blast_furnace_slag
         self.flyash = flyash
@@ -21,537 +84,411 @@ class Predictive:
         self.coarse_agg = coarse_agg
         self.fine_agg = fine_agg
         self.age = age
-        self.conversions()
-        self.predictor()
-
-    def conversions(self):
-        self.lb_per_kg = 1.68555
-        self.psi_per_mpa = 145.038
-        self.df_train['Cement'] = self.df_train['Cement']* self.lb_per_kg  # grams to lbs
-        self.df_train['Coarse Aggregate'] = self.df_train['Coarse Aggregate'] * self.lb_per_kg  # grams to lbs
-        self.df_train['Water'] = self.df_train['Water'] * self.lb_per_kg  # grams to lbs'
-        self.df_train['Cement'] = self.df_train['Cement'] * self.lb_per_kg  # grams to lbs'
-        self.df_train['Blast Furnace Slag'] = self.df_train['Blast Furnace Slag'] * self.lb_per_kg
-        self.df_train['Fine Aggregate'] = self.df_train['Fine Aggregate'] * self.lb_per_kg# grams to lbs'
-        self.df_train['Fly Ash'] = self.df_train['Fly Ash'] * self.lb_per_kg  # grams to lbs
-        self.df_train['Superplasticizer']  = self.df_train['Superplasticizer'] * self.lb_per_kg  # grams to lbs'
-        self.df_train['Strength'] = self.df_train['Strength'] * self.psi_per_mpa
-
+        self.model = None
+        self.throughput = 0
+        if cement is None:
+            self.loadModel()
+        else:
+            self.predictor()
+
+    @instrumented('predictor')
     def predictor(self):
-        self.X = self.df_train.drop("Strength", axis=1).values
-        self.y = self.df_train["Strength"]
-
-        self.X_train, self.X_test, self.y_train, self.y_test = train_test_split(self.X, self.y, random_state=1, test_size=0.2)
-
-        self.df_test = pd.DataFrame(self.X).iloc[0:0]
-        self.df_test.loc[-1] = [self.cement, self.blast_furnace_slag, self.flyash, self.water, self.super,
-                                               self.coarse_agg, self.fine_agg, self.age]
-
-        self.scaler = StandardScaler()
-
-        self.scaler.fit(self.X)
-        self.scaler.fit(self.df_test)
+        self.loadModel()
 
-        self.X = self.scaler.transform(self.X)
-        #self.y = self.scaler.transform(self.y)
+        self.df_test = pd.DataFrame([[self.cement, self.blast_furnace_slag, self.flyash, self.water, self.super,
+                                      self.coarse_agg, self.fine_agg, self.age]], columns=feature_columns)
 
-        params = {'objective': 'reg:squarederror',
-                  'max_depth': 6,
-                  'colsample_bylevel': 0.5,
-                  'learning_rate': 0.01,
-                  'random_state': 20}
-
-        self.model = XGBRegressor(learning_rate=0.05, n_estimators=250)
-
-        self.model.fit(self.X, self.y)
-
-        self.strength_predict = self.model.predict(self.df_test)
+        with stage('predict', rows=1):
+            self.strength_predict = self.predictMatrix(self.df_test.to_numpy(dtype=np.float64), self.units)
 
         return self.strength_predict
 
+    def loadModel(self):
+        if self.model is not None:
+            return
+
+        with stage('load'):
+            base_key = self.updates.baseKey(self.df_train, model_params)
+            self.model_key = self.updates.currentKey(base_key)
+            loaded = self.store.load(self.model_key) if self.model_key else None
+            if loaded is None:
+                self.model_key = base_key
+                loaded = self.updates.baseModel(self, model_params)  # every base row but the update check rows
+            self.model, self.scaler = loaded
+            publish(self.model, self.scaler, feature_columns, self.model_key)  # for compiled_model's fast path
+
+    def featureMatrix(self, mixes):
+        ''' Turns a DataFrame (matched by column name, else by position) or an array of
+            mixes into a float matrix in feature_columns order '''
+        if isinstance(mixes, pd.DataFrame):
+            if all(column in mixes.columns for column in feature_columns):
+                mixes = mixes[feature_columns]
+            mixes = mixes.to_numpy(dtype=np.float64)
+
+        mixes = np.asarray(mixes, dtype=np.float64)
+        if mixes.ndim == 1:
+            mixes = mixes.reshape(1, -1)
+        if mixes.shape[1] != len(feature_columns):
+            raise ValueError('Expected %i ingredient columns (%s), got %i' % (
+                len(feature_columns), ', '.join(feature_columns), mixes.shape[1]))
+        return mixes
+
+    @instrumented('predict_many')
+    def predict_many(self, mixes, output_file=None, chunksize=None, report=True, units=None):
+        ''' Predicts the strength of every mix in a DataFrame, NumPy array or CSV path with one
+            model.predict call. Mixes and strengths are in units (default: the instance's), converted
+            with one multiply per matrix. For a CSV with chunksize or output_file set, the file is
+            streamed in chunks and each chunk's predictions are appended to output_file, so inputs
+            larger than memory can be scored. Throughput in mixes per second is stored on self.throughput '''
+        self.loadModel()
+        units = self.units if units is None else unitSystem(units)
+        strength_column = 'Predicted Strength (%s)' % unitLabel('stress', units)
+        start = time.perf_counter()
+
+        if isinstance(mixes, (str, os.PathLike)) and (chunksize is not None or output_file is not None):
+            total = 0
+            predictions = [] if output_file is None else None
+            for i, chunk in enumerate(pd.read_csv(mixes, chunksize=chunksize or 100000)):
+                with stage('predict', rows=len(chunk)):
+                    chunk_predict = self.predictMatrix(self.featureMatrix(chunk), units)
+                total += len(chunk_predict)
+                if output_file is None:
+                    predictions.append(chunk_predict)
+                else:
+                    chunk[strength_column] = chunk_predict
+                    chunk.to_csv(output_file, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            strength_predict = np.concatenate(predictions) if predictions else None
+        else:
+            if isinstance(mixes, (str, os.PathLike)):
+                with stage('load'):
+                    mixes = pd.read_csv(mixes)
+            mix_matrix = self.featureMatrix(mixes)
+            with stage('predict', rows=len(mix_matrix)):
+                strength_predict = self.predictMatrix(mix_matrix, units)
+            total = len(strength_predict)
+            if output_file is not None:
+                predicted_df = pd.DataFrame(mix_matrix, columns=feature_columns)
+                predicted_df[strength_column] = strength_predict
+                predicted_df.to_csv(output_file, index=False)
+
+        elapsed = time.perf_counter() - start
+        self.throughput = total / elapsed if elapsed > 0 else float('inf')
+        if report:
+            print("Predicted %i mixes in %f s (%f mixes/s)" % (total, elapsed, self.throughput))
+        return strength_predict
+
+    def predictMatrix(self, mix_matrix, units=IMPERIAL):
+        ''' Strengths of a feature matrix, both in units '''
+        mix_matrix = convertMixes(mix_matrix, units, IMPERIAL)
+        return convert(self.model.predict(self.scaler.transform(mix_matrix)), 'stress', IMPERIAL, units)
+
+    def addResults(self, results, retrain=True, units=None):
+        ''' Adds tested mixes with their measured strength (a DataFrame of the feature columns plus
+            Strength, in units, by default the instance's) to the lab results and boosts the model on
+            them. A full retrain runs in the background every model_updater.retrain_every results.
+            Returns the update report '''
+        self.loadModel()
+        units = self.units if units is None else unitSystem(units)
+        if units != IMPERIAL:
+            columns = feature_columns + ['Strength']
+            results = results.copy()
+            results[columns] = convertMixes(results[columns].to_numpy(dtype=np.float64), units, IMPERIAL,
+                                            with_strength=True)
+        with stage('train', rows=len(results)):
+            report = self.updates.addResults(results, self, model_params, retrain)
+        publish(self.model, self.scaler, feature_columns, self.model_key)
+        print("Added %i results. Held-out RMSE %s -> %s psi, base data %s -> %s psi, update %s" % (
+            report['added'], report['rmse_before'], report['rmse_after'], report['base_rmse_before'],
+            report['base_rmse_after'], 'kept' if report['kept'] else 'discarded'))
+        return report
+
+    def train(self, X=None, y=None):
+        ''' Fits the scaler on the training mixes and the regressor on the scaled mixes. Only called
+            when the model store has no artifact for this training data and these params '''
+        # imported here, not at the top: xgboost (which loads sklearn) takes about two seconds to import,
+        # and a model from the store or the compiled fast path never needs them
+        from xgboost import XGBRegressor
+        from sklearn.preprocessing import StandardScaler
+
+        X = self.X if X is None else X
+        y = self.y if y is None else y
+        with stage('train', rows=len(X)):
+            scaler = StandardScaler()
+            scaler.fit(X)
+
+            model = XGBRegressor(**model_params)
+
+            model.fit(scaler.transform(X), y)
+
+        return model, scaler
+
 class concrete_specimen:
-    def __init__(self, file_name, specimen_name, radius, kips_column, inch_column, unit_type, kips_or_strain):
+    results = results_store()  # shared, so every analyzer reads and writes the same database
+
+    def __init__(self, file_name, specimen_name, radius, kips_column, inch_column, unit_type, kips_or_strain,
+                 predicted_strength=None, input_units=IMPERIAL):
+        ''' unit_type is the system results are reported in ('Imperial' or 'Metric'), predicted_strength
+            included; input_units is the one the radius and a kips file's displacement and load columns
+            are in (in and kips, or mm and kN). Everything in between works in psi and inches '''
         self.file_name = file_name
         self.specimen_name = specimen_name
         self.radius = radius
         self.ultimate_strength = 0
         self.youngs_modulus = 0
+        self.r_squared = 0
+        self.elastic_strain_bounds = (0, 0)
         self.data_table = 0
+        self.curve = None  # curve_result of the last analysis, every sample of the file
+        self.stored_curve = None  # the results store's decimated copy, when the last analysis was a store hit
+        self.metrics = {}  # full-curve metrics of the last analysis (analysis_kernel.curveMetrics)
+        self.plot_job = None  # background PNG render of the last analysis
         self.kips_or_strain = kips_or_strain
+        self.units = unitSystem(unit_type)
+        self.input_units = unitSystem(input_units)
+        self.predicted_strength = convert(predicted_strength, 'stress', self.units, IMPERIAL)  # psi, drawn when set
         self.predictive_data_table = 0
         self.kips_column = kips_column-1
         self.inch_column = inch_column-1
 
 
 
-    def concreteAnalysis(self):
+    @instrumented('concreteAnalysis')
+    def concreteAnalysis(self, show=True, save_plot=True, use_store=True):
         ''' Takes an Excel file of inches vs kips and produces a graphical representation including
             a scatter plot, a rolling average, and a linear regression line. Also produces key metrics
-            such as Young's Modulus and Ultimate Strength '''
-
-        file_extension = self.file_name[-4:]
-        if file_extension == "xlsx":
-            concrete_df = pd.read_excel(self.file_name)
-        elif file_extension == ".csv":
-            concrete_df = pd.read_csv(self.file_name)
-
+            such as Young's Modulus and Ultimate Strength. Pass show=False to run without blocking
+            on the plot window, and save_plot=False as well to skip plotting entirely. A file already
+            analyzed with the same settings is answered from the results store unless use_store=False '''
+
+        analysis = 'concrete ' + self.kips_or_strain.lower()
+        params = {'radius': float(self.radius), 'inch_column': self.inch_column, 'kips_column': self.kips_column}
+        if self.input_units != IMPERIAL:
+            params['input_units'] = self.input_units
+        with stage('load', file=self.file_name):
+            stored = self.results.get(self.file_name, analysis, params) if use_store else None
+
+        strain, stress = self.loadCurve()
+        if stored is not None:
+            self.results.restore(self, stored, strain, stress)
+        else:
+            curve = analyzeCurve(strain, stress)
+            if self.kips_or_strain == 'Kips':
+                self.ultimate_strength = curve.ultimate_strength
+
+            self.youngs_modulus = curve.slope
+            self.r_squared = curve.r_squared
+            self.elastic_strain_bounds = curve.elastic_strain_bounds
+            self.curve = curve
+            self.stored_curve = None
+            self.metrics = curve.metrics
+            self.results.put(self.file_name, analysis, params, self, 'concrete')
+
+        printResults(self)
+        self.data_table = self.curve.dataTable(factor('stress', IMPERIAL, self.units))
+
+        if show or save_plot:
+            with stage('render'):
+                plot = self.plotSpec()
+            self.plot_job = finishPlot(plot, show, save_plot)
+
+    def loadCurve(self):
+        ''' Strain and stress (psi) of the whole test file. Stored results are restored onto this too, so
+            data_table and the plots always have every sample '''
+        with stage('load', file=self.file_name):
+            test_data = loadTestFile(self.file_name)  # parsed once, memory-mapped from the ingest cache afterwards
 
         if self.kips_or_strain == 'Kips':
-            area = (self.radius ** 2) * np.pi  # opens CSV file
-            concrete_df.rename(columns={concrete_df.columns[self.inch_column]: 'inch'}, inplace=True)
-            concrete_df.rename(columns={concrete_df.columns[self.kips_column]: 'kips'}, inplace=True)
-            concrete_dft = concrete_df[['kips', 'inch']]
-            concrete_dftt = concrete_dft.drop([0, 1])
-            concrete_dftt['kips'] = pd.to_numeric(concrete_dftt['kips'])
-            concrete_dftt['inch'] = pd.to_numeric(concrete_dftt['inch'])
-
-
-            concrete_dff = concrete_dftt[
-                (concrete_dftt['kips'] >= 0.5) & (concrete_dftt['inch'] >= 0)]  # new df with all > 0 kips and inch values
-            row_max = concrete_dff['kips'].idxmax()
-
-
-            concrete_dff['corrected disp'] = concrete_dff['inch'] - concrete_dff.iloc[0]['inch']
-            concrete_dff['strain'] = (concrete_dff['corrected disp'] / self.radius).truncate(after=row_max)
-            concrete_dff['stress'] = ((concrete_dff['kips'] * 1000) / area).truncate(after=row_max)
-            self.ultimate_strength = concrete_dff['stress'].max()
-
-
-
-
-
-        elif self.kips_or_strain == 'Strain':
-            self.ultimate_strength = concrete_df.iloc[0]['Stress at Break (psi):']
-            if file_extension == "xlsx":
-                concrete_dft = pd.read_excel(self.file_name, skiprows=2)
-            elif file_extension == ".csv":
-                concrete_dft = pd.read_csv(self.file_name, skiprows=2)
-            #concrete_dff = pd.DataFrame((concrete_dft['Stress (psi)', 'Long. Strain']), columns=['Stress', 'Strain'])
-            concrete_dff = concrete_dft.rename(columns={'Stress (psi)': 'stress', 'Long. Strain': 'strain'})
-
-        reg_line_head = int(3/7*len(concrete_dff))
-
-
-        concrete_dff['rolling'] = concrete_dff['stress'].rolling(50).mean()
-        reg_line = linregress(concrete_dff['strain'].head(reg_line_head), concrete_dff['stress'].head(reg_line_head))
-        self.youngs_modulus = reg_line.slope
-        print(self.specimen_name + " Ultimate Strength: %f. Young's Modulus: %f" % (
-        self.ultimate_strength, self.youngs_modulus))
-        self.data_table = concrete_dff
-
-        plt.figure()
-        plt.plot(concrete_dff['strain'], concrete_dff['stress'],
-                     label='Stress vs. Strain of %s' % self.specimen_name)
-        plt.plot(concrete_dff['strain'], reg_line.intercept + self.youngs_modulus * concrete_dff['strain'],
-                     label='Regression Line = %ix + %i with R^2 %f' % (
-                     int(self.youngs_modulus), int(reg_line.intercept), reg_line.rvalue))
-        plt.plot(concrete_dff['strain'], concrete_dff['rolling'], label='Rolling Average')
-
-        if 'pred_strength' in globals():
-            plt.hlines(y=float(pred_strength), xmin=0, xmax=concrete_dff['strain'].max(), label='Predicted Strength - %f psi' % float(pred_strength))
-
-        plt.title(
-                'Stress vs. Strain of %s with Ultimate Strength %f kips' % (self.specimen_name, self.ultimate_strength))
-        plt.xlabel('Strain (in/in)')
-        plt.ylabel('Stress (psi)')
-        plt.ylim(0, self.ultimate_strength)
-        plt.legend(fontsize=10, loc='lower right')
-        plt.show()
-        plt.savefig('%s plot.png' % self.specimen_name, dpi=500)
-
-        def predictiveAnalysis(self):
-            analysis_data = {'Cement': [self.cement_percent], 'Blast Furnace Slag': [self.blast_furnace_slag],
-                             'Fly Ash': [self.fly_ash], 'Water': [self.water_percent],
-                             'Superplasticizer': [self.super_plastisizer], 'Coarse Aggregate': [self.aggregate_percent],
-                             'Fine Aggregate': [self.sand_percent], 'Age': [self.age], 'Concrete compressive strength': [self.ultimate_stength]}
-            predictive_df = pd.DataFrame(data=analysis_data)
-            self.predictive_data_table = predictive_df
+            strain, stress = kipsCurve(test_data.column(self.inch_column), test_data.column(self.kips_column),
+                                          self.radius, convert(0.5, 'force', IMPERIAL, self.input_units),
+                                          stressPerForce(self.radius, self.input_units))
+            return strain, stress
+
+        self.ultimate_strength = test_data.metadata()['Stress at Break (psi):']
+        return finiteCurve(test_data.column('Long. Strain'), test_data.column('Stress (psi)'))
+
+    def predictiveAnalysis(self, cement, blast_furnace_slag=0, flyash=0, water=0, super=0, coarse_agg=0, fine_agg=0,
+                           age=28, update_model=True, units=IMPERIAL):
+        ''' Turns the tested mix (in units: lb/yd^3 or kg/m^3) and the ultimate strength of the last
+            analysis into a training row in the same units, kept as predictive_data_table, and adds it to
+            the strength model's lab results '''
+        analysis_data = {'Cement': [cement], 'Blast Furnace Slag': [blast_furnace_slag], 'Fly Ash': [flyash],
+                         'Water': [water], 'Superplasticizer': [super], 'Coarse Aggregate': [coarse_agg],
+                         'Fine Aggregate': [fine_agg], 'Age': [age],
+                         'Strength': [convert(self.ultimate_strength, 'stress', IMPERIAL, units)]}
+        predictive_df = pd.DataFrame(data=analysis_data)
+        self.predictive_data_table = predictive_df
+        if update_model:
+            return Predictive().addResults(predictive_df, units=units)
+
+    def plotSpec(self):
+        ''' Decimated plot of the last analysis, for showing, saving or adding to a PDF report '''
+        curve = self.curve
+        scale = factor('stress', IMPERIAL, self.units)
+        plot = stressPlot(self, (0, self.ultimate_strength), 'lower right')
+        plot.addSeries(curve.strain, curve.stress, 'Stress vs. Strain of %s' % self.specimen_name)
+        plot.addLine(self.youngs_modulus, curve.intercept, curve.strain,
+                     'Regression Line = %ix + %i with R^2 %f' % (int(self.youngs_modulus * scale),
+                                                                  int(curve.intercept * scale), curve.rvalue))
+        plot.addSeries(curve.strain, curve.rolling, 'Rolling Average')
+        plot.addSpan(*self.elastic_strain_bounds, 'Elastic Region')
+
+        if self.predicted_strength is not None:
+            plot.addHline(float(self.predicted_strength), 0, curve.strain.max(), 'Predicted Strength - %f %s' % (
+                float(self.predicted_strength) * scale, unitLabel('stress', self.units)))
+
+        return plot
 
 class cob_specimen:
-    def __init__(self, file_name, specimen_name, radius, inch_column, kips_column):
+    results = concrete_specimen.results
+
+    def __init__(self, file_name, specimen_name, radius, inch_column, kips_column, units=IMPERIAL,
+                 input_units=IMPERIAL):
+        ''' Results are reported in units; the radius and the file's displacement and load columns are
+            in input_units (in and kips, or mm and kN) '''
         self.file_name = file_name
         self.specimen_name = specimen_name
-        #self.inch_column = inch_column-1
-        #self.kips_column = kips_column-1
+        self.inch_column = inch_column-1
+        self.kips_column = kips_column-1
         self.radius = radius
+        self.units = unitSystem(units)
+        self.input_units = unitSystem(input_units)
+        self.ultimate_strength = 0
+        self.youngs_modulus = 0
+        self.r_squared = 0
+        self.elastic_strain_bounds = (0, 0)
+        self.data_table = 0
+        self.curve = None  # curve_result of the last analysis, every sample of the file
+        self.stored_curve = None  # the results store's decimated copy, when the last analysis was a store hit
+        self.metrics = {}  # full-curve metrics of the last analysis (analysis_kernel.curveMetrics)
+        self.plot_job = None  # background PNG render of the last analysis
 
 
-    def cobAnalysis(self):
+    @instrumented('cobAnalysis')
+    def cobAnalysis(self, show=True, save_plot=True, use_store=True):
         ''' Takes an Excel file of inches vs kips and produces a graphical representation including
             a scatter plot, a rolling average, and a linear regression line. Also produces key metrics
             such as Young's Modulus and Ultimate Strength '''
-        area = (self.radius ** 2) * np.pi
-        cob_df = pd.read_excel(self.file_name)  # opens CSV file
-
-        cob_df.rename(columns={cob_df.columns[self.inch_column]: 'inch'}, inplace=True)
-        cob_df.rename(columns={cob_df.columns[self.kips_column]: 'kips'}, inplace=True)
-        cob_dft = cob_df[['kips', 'inch']]
-        cob_dftt = cob_dft.drop([0, 1])
-        cob_dftt['kips'] = pd.to_numeric(cob_dftt['kips'])
-        cob_dftt['inch'] = pd.to_numeric(cob_dftt['inch'])
-
-        cob_dff = cob_dftt[
-            (cob_dftt['kips'] >= 0.15) & (cob_dftt['inch'] >= 0)]  # new df with all > 0 kips and inch values
-        row_max = cob_dff['kips'].idxmax()
-
-        cob_dff['corrected disp'] = cob_dff['inch'] - cob_dff.iloc[0]['inch']
-        cob_dff['strain'] = (cob_dff['corrected disp'] / self.radius).truncate(after=row_max)
-        cob_dff['stress'] = ((cob_dff['kips'] * 1000) / area).truncate(after=row_max)
-        self.ultimate_strength = cob_dff['stress'].max()
-        cob_dff['rolling'] = cob_dff['stress'].rolling(50).mean()
-        reg_line = linregress(cob_dff['strain'].head(5000), cob_dff['stress'].head(5000))
-        self.youngs_modulus = reg_line.slope
-        print(self.specimen_name + " Ultimate Strength: %f. Young's Modulus: %f" % (
-        self.ultimate_strength, self.youngs_modulus))
-        self.data_table = cob_dff
-
-        plt.figure()
-        plt.plot(cob_dff['strain'], cob_dff['stress'],
-                     label='Structural Analysis of %s' % self.specimen_name)
-        plt.plot(cob_dff['strain'], reg_line.intercept + self.youngs_modulus * cob_dff['strain'],
-                     label='Regression Line = %fx + %f with R^2 %f' % (
-                     self.youngs_modulus, reg_line.intercept, reg_line.rvalue))
-        plt.plot(cob_dff['strain'], cob_dff['rolling'], label='Rolling Average')
-        plt.title(
-                'Stress vs. Strain of %s with Ultimate Strength %f kips' % (self.specimen_name, self.ultimate_strength))
-        plt.xlabel('Strain (in/in)')
-        plt.ylabel('Stress (psi)')
-        plt.ylim(0, self.ultimate_strength)
-        plt.legend(fontsize=10)
-        plt.show()
-        plt.savefig('%s plot.png' % self.specimen_name, dpi=500)
+        params = {'radius': float(self.radius), 'inch_column': self.inch_column, 'kips_column': self.kips_column}
+        if self.input_units != IMPERIAL:
+            params['input_units'] = self.input_units
+        with stage('load', file=self.file_name):
+            stored = self.results.get(self.file_name, 'cob', params) if use_store else None
+
+        strain, stress = self.loadCurve()
+        if stored is not None:
+            self.results.restore(self, stored, strain, stress)
+        else:
+            curve = analyzeCurve(strain, stress)
+            self.ultimate_strength = curve.ultimate_strength
+            self.youngs_modulus = curve.slope
+            self.r_squared = curve.r_squared
+            self.elastic_strain_bounds = curve.elastic_strain_bounds
+            self.curve = curve
+            self.stored_curve = None
+            self.metrics = curve.metrics
+            self.results.put(self.file_name, 'cob', params, self, 'cob')
+
+        printResults(self)
+        self.data_table = self.curve.dataTable(factor('stress', IMPERIAL, self.units))
+
+        if show or save_plot:
+            with stage('render'):
+                plot = self.plotSpec()
+            self.plot_job = finishPlot(plot, show, save_plot)
+
+    def loadCurve(self):
+        ''' Strain and stress (psi) of the whole test file '''
+        with stage('load', file=self.file_name):
+            test_data = loadTestFile(self.file_name)
+
+        strain, stress = kipsCurve(test_data.column(self.inch_column), test_data.column(self.kips_column),
+                                      self.radius, convert(0.15, 'force', IMPERIAL, self.input_units),
+                                      stressPerForce(self.radius, self.input_units))
+        return strain, stress
+
+    def plotSpec(self):
+        ''' Decimated plot of the last analysis, for showing, saving or adding to a PDF report '''
+        curve = self.curve
+        scale = factor('stress', IMPERIAL, self.units)
+        plot = stressPlot(self, (0, self.ultimate_strength))
+        plot.addSeries(curve.strain, curve.stress, 'Structural Analysis of %s' % self.specimen_name)
+        plot.addLine(self.youngs_modulus, curve.intercept, curve.strain, 'Regression Line = %fx + %f with R^2 %f' % (
+            self.youngs_modulus * scale, curve.intercept * scale, curve.rvalue))
+        plot.addSeries(curve.strain, curve.rolling, 'Rolling Average')
+        plot.addSpan(*self.elastic_strain_bounds, 'Elastic Region')
+        return plot
 
 class UTM_analysis:
-    def __init__(self, file_name, specimen_name):
+    results = concrete_specimen.results
+
+    def __init__(self, file_name, specimen_name, units=IMPERIAL):
+        ''' Results are reported in units. The UTM export itself is always in inches and psi '''
         self.file_name = file_name
         self.specimen_name = specimen_name
+        self.units = unitSystem(units)
         self.radius = 0
-
-    def specimenAnalysis(self):
-        self.file_extension = self.file_name[-4:]
-
-        if self.file_extension == "xlsx":
-            self.concrete_df = pd.read_excel(self.file_name)
-        elif self.file_extension == ".csv":
-            self.concrete_df = pd.read_csv(self.file_name)
-
-        self.radius = self.concrete_df.iloc[0]['Diameter (in):']/2
-        self.ultimate_strength = self.concrete_df.iloc[0]['Stress at Break (psi):']
-
-        if self.file_extension == "xlsx":
-            self.concrete_dft = pd.read_excel(self.file_name, skiprows=2)
-        elif self.file_extension == ".csv":
-            self.concrete_dft = pd.read_csv(self.file_name, skiprows=2)
-
-
-        self.concrete_dft['Corrected Strain'] = -1*(self.concrete_dft['Ram Position (in)'] - self.concrete_dft.iloc[0]['Ram Position (in)'])
-
-        self.concrete_dff = self.concrete_dft.rename(columns={'Stress (psi)': 'stress', 'Corrected Strain': 'strain'})
-
-
-        self.reg_line_head = int(4/7*len(self.concrete_dff))
-
-
-        self.concrete_dff['rolling'] = self.concrete_dff['stress'].rolling(50).mean()
-        reg_line = linregress(self.concrete_dff['strain'].head(self.reg_line_head), self.concrete_dff['stress'].head(self.reg_line_head))
-        self.youngs_modulus = reg_line.slope
-        print(self.specimen_name + " Ultimate Strength: %f. Young's Modulus: %f" % (
-        self.ultimate_strength, self.youngs_modulus))
-        self.data_table = self.concrete_dff
-
-        plt.figure()
-        plt.plot(self.concrete_dff['strain'], self.concrete_dff['stress'],
-                     label='Structural Analysis of %s' % self.specimen_name)
-        plt.plot(self.concrete_dff['strain'], reg_line.intercept + self.youngs_modulus * self.concrete_dff['strain'],
-                     label='Regression Line = %fx + %f with R^2 %f' % (
-                     self.youngs_modulus, reg_line.intercept, reg_line.rvalue))
-        plt.plot(self.concrete_dff['strain'], self.concrete_dff['rolling'], label='Rolling Average')
-        plt.title(
-                'Stress vs. Strain of %s with Ultimate Strength %f psi' % (self.specimen_name, self.ultimate_strength))
-        plt.xlabel('Strain (in/in)')
-        plt.ylabel('Stress (psi)')
-        plt.ylim(0, self.ultimate_strength)
-        plt.legend(fontsize=10)
-        plt.show()
-        plt.savefig('%s plot.png' % self.specimen_name, dpi=500)
-
-
-'''
-BEGIN GUI CODE
-'''
-
-
-#sg.theme('LightGrey') #sets theme of window
-sg.set_options(font=('Arial', 16))
-sg.theme('Reddit')
-
-material_choices = ['Concrete', 'Cob', 'Other (Coming Soon)']
-
-
-setting_choices = [
-    #[sg.Text('File Name'), sg.Input(enable_events=True, key='-IN-',font=('Arial Bold', 12),expand_x=True), sg.FileBrowse()],
-    #[sg.Text('Current Units'), sg.Radio("Imperial", "gen", key='imperial', default=True), sg.Radio("Metric", "gen", key='metric', default=False)],
-    [sg.Text('Desired Units'), sg.Radio("Imperial", "gen", key='imperial', default=True), sg.Radio("Metric", "gen", key='metric', default=False)],
-    [sg.Combo(material_choices, expand_x=True, default_value=material_choices[0], key='-COMBO-'), sg.Button('Confirm', key='-CONFIRM-')]
-]
-
-
-home_screen = [
-    [sg.Image(filename='mame logo.png', expand_x=True)],
-    [sg.Button(button_text="Specimen Analysis from Kips/Inch File", key='Kip/Inch', expand_x=True)],
-    [sg.Button(button_text="Specimen Analysis from Stress/Strain File", key='Stress/Strain', expand_x=True)],
-    [sg.Button(button_text='UTM Analysis', key='UTM', expand_x=True)],
-    [sg.Button(button_text="Predict Performance from Ingredients", key='Predict', expand_x=True)],
-]
-
-specimen_type_concrete = [
-    #[sg.Text('Kips Column #'), sg.Input(key='-KIPS COLUMN-'), sg.Text('Inch Column #'), sg.Input(key='-INCH COLUMN-')],
-    [sg.Text('Specimen Name*        ', justification='left', expand_x=True), sg.Input(key='Specimen Name')],
-    [sg.Text('Specimen Radius* (in) ', justification='left'), sg.Input(default_text='2', key='Rad')],
-          ]
-
-
-choices = [
-    [sg.Button('OK', key='-OK-'), sg.Cancel()],
-]
-
-specimen_type_cob = [
-    [sg.Combo(material_choices, expand_x=True, default_value=material_choices[0], key='-COMBO-'), sg.Button('Confirm', key='-CONFIRM-')],
-    [sg.Text('Specimen Name*     ', justification='left', expand_x=True), sg.Input(key='Specimen Name', expand_x=True)],
-    [sg.Text('Radius* (in)              ', justification='left', expand_x=True), sg.Input(key='Cob Radius', default_text='3', expand_x=True)]
-]
-
-is_visible = False
-
-predictive_layout = [
-    [sg.Image(filename='mame logo.png', expand_x=True)],
-    [sg.Text('Fine Aggregate (lb/yd^3)      ', justification='left', expand_x=True), sg.Input(key='Fine Agg')],
-    [sg.Text('Course Aggregate (lb/yd^3)    ', justification='left', expand_x=True), sg.Input(key='Coarse Agg')],
-    [sg.Text('Cement (lb/yd^3)      ', justification='left', expand_x=True), sg.Input(key='Cement')],
-    [sg.Text('Water (lb/yd^3)       ', justification='left', expand_x=True), sg.Input(key='Water')],
-    [sg.Text('Fly Ash (lb/yd^3)     ', justification='left', expand_x=True), sg.Input(default_text='0', key='Fly Ash')],
-    [sg.Text('Super Plasticizer (lb/yd^3)   ', justification='left', expand_x=True), sg.Input(default_text='0', key='Super')],
-    [sg.Text('Blast Furnace Slag (lb/yd^3)  ', justification='left', expand_x=True), sg.Input(default_text='0', key='Blast Slag')],
-    [sg.Text('Curing Time (days)    ', justification='left', expand_x=True), sg.Input(default_text='28', key='Age')],
-    [sg.Button('Predict', key='Run Predictor')],
-]
-
-specimen_type = specimen_type_concrete
-
-
-concrete_layout = [
-    [sg.Image(filename='mame logo.png', expand_x=True)],
-    [setting_choices],
-    [specimen_type_concrete],
-    [sg.Text('File Options', expand_x='true', justification='center', font=('Arial Bold', 16))],
-    [sg.Text('File Name*'), sg.Input(key='-FILEBROWSE-',font=('Arial Bold', 12),expand_x=True, ), sg.FileBrowse()],
-    [sg.Text('Inch Column #*         ', expand_x=True), sg.Input(key='-INCH COLUMN-', expand_x=True)],
-    [sg.Text('Kips Column #*         ', expand_x=True), sg.Input(key='-KIPS COLUMN-', expand_x=True)],
-    [sg.Button('Analyze', key='-OK-')],
-    ]
-
-stressstrain_specimen =  [
-    [sg.Image(filename='mame logo.png', expand_x=True)],
-    [sg.Text('Specimen Name*', expand_x=True), sg.Input(key='Specimen Name', default_text='New Mix')],
-    [sg.Text('Radius*', expand_x=True), sg.Input(key='Radius')],
-    [sg.Text('File Options', expand_x='true', justification='center', font=('Arial Bold', 16))],
-    [sg.Text('File Name*', expand_x=True), sg.Input(key='-FILEBROWSE-',expand_x=True), sg.FileBrowse()],
-    [sg.Button('Analyze', key='-OK-')],
-]
-
-cob_layout = [
-    [sg.Image(filename='mame logo.png', expand_x=True)],
-    [specimen_type_cob],
-    [sg.Text('File Options', expand_x='true', justification='center', font=('Arial Bold', 16))],
-    [sg.Text('File Name*'), sg.Input(key='-FILEBROWSE-',font=('Arial Bold', 12),expand_x=True), sg.FileBrowse()],
-    [sg.Text('Inch Column #*       '), sg.Input(key='-INCH COLUMN-', expand_x=False)],
-    [sg.Text('Kips Column #*       '), sg.Input(key='-KIPS COLUMN-', expand_x=False)],
-    [sg.Button('Analyze', key='-OK-')],
-    ]
-
-utm_layout = [
-    [sg.Image(filename='mame logo.png', expand_x=True)],
-    [sg.Text('Specimen Name*'), sg.Input(key='Specimen Name', default_text='New Mix')],
-    [sg.Text('File Name*'), sg.Input(key='-FILEBROWSE-',font=('Arial Bold', 12),expand_x=True), sg.FileBrowse()],
-    [sg.Button('Analyze', key='-OK-')],
-]
-
-current_layout = home_screen
-
-window = sg.Window('Concrete Machine', layout=current_layout, finalize=False) #creates a window based on the layout above with title and size
-#shown
-
-
-
-while True:
-    event, values = window.read()
-
-    if event == 'Kip/Inch':
-        window.close()
-        window = sg.Window('Concrete Machine', concrete_layout)
-        current_layout = concrete_layout
-
-    if event == 'Stress/Strain':
-        window.close()
-        window = sg.Window('Stress Strain Machine', stressstrain_specimen)
-        current_layout = stressstrain_specimen
-
-    if event == '-CONFIRM-':
-        if values['-COMBO-'] == 'Cob':
-            window.close()
-            window = sg.Window('Cob Machine', cob_layout)
-            current_layout = cob_layout
-
-    if event == 'Predict':
-        window.close()
-        window = sg.Window('Concrete Predictor', predictive_layout)
-        current_layout = predictive_layout
-
-    if event == 'UTM':
-        window.close()
-        window = sg.Window('UTM Data Analysis', utm_layout)
-        current_layout = utm_layout
-
-    elif event == '-CANCEL-':
-        window.close()
-        window = sg.Window('NOMAD - Alpha Version',home_screen)
-        current_layout = home_screen
-
-    elif event == 'Run Predictor':
-        vals = ['Cement', 'Coarse Agg', 'Fine Agg', 'Water', 'Fly Ash', 'Super', 'Blast Slag', 'Age']
-
-        for i in vals:
-            if values[i] == '':
-                values[i] = 0
-
-        cement = int(values['Cement'])
-        coarse_agg = int(values['Coarse Agg'])
-        fine_agg = int(values['Fine Agg'])
-        water = int(values['Water'])
-        flyash = int(values['Fly Ash'])
-        super = int(values['Super'])
-        blast_furnace_slag = int(values['Blast Slag'])
-        age = int(values['Age'])
-
-        mix = Predictive(cement, blast_furnace_slag, flyash, water, super, coarse_agg, fine_agg, age)
-        predictive_strength = mix.predictor()
-        pred_strength = str(predictive_strength[0])
-
-        ch = sg.popup_yes_no(
-            'We predict your mix will have strength ' + pred_strength + ' psi. Would you like to analyze your data for comparison? (kips/inch data only)')
-
-        if ch == 'Yes':
-            window.close()
-            window = sg.Window('Concrete Machine', concrete_layout)
-            current_layout = concrete_layout
-
-    elif event == '-OK-':
-        if current_layout == concrete_layout:
-            required_vals = ['Specimen Name', 'Rad', '-INCH COLUMN-', '-FILEBROWSE-', '-KIPS COLUMN-']
-
-            error = 0
-
-            for i in required_vals:
-                if values[i] == '':
-                    error += 1
-
-            if error > 0:
-                sg.popup_auto_close("Please Enter All Required Fields", title='Error')
-
-            kips_col = int((values['-KIPS COLUMN-']))
-            inch_col = int((values['-INCH COLUMN-']))
-            filename = values['-FILEBROWSE-']
-            specimen_name = values['Specimen Name']
-            radius = int(values['Rad'])
-
-            if values['imperial'] == True:
-                units = "Imperial"
-            else:
-                units = "Metric"
-
-            mix_name = concrete_specimen(filename, specimen_name, radius, kips_col, inch_col, units, "Kips")
-
-            mix_name_data = mix_name.concreteAnalysis()
-
-            if event == sg.WIN_CLOSED:
-                break
-
-        elif current_layout == cob_layout:
-            required_vals = ['Specimen Name', 'Cob Radius', '-INCH COLUMN-', '-FILEBROWSE-', '-KIPS COLUMN-']
-
-            error = 0
-
-            for i in required_vals:
-                if values[i] == '':
-                    error += 1
-
-            if error > 0:
-                sg.popup_auto_close("Please Enter All Required Fields", title='Error')
-
-            if error == 0:
-                specimen_name = values['Specimen Name']
-                #soil = int(values['Soil'])
-                #sand = int(values['Sand'])
-                #straw = int(values['Straw'])
-                #water = int(values['Water'])
-                radius = int(values['Cob Radius'])
-                inch_column = int(values['-INCH COLUMN-'])
-                filename = values['-FILEBROWSE-']
-                kips_column = int(values['-KIPS COLUMN-'])
-
-                mix_name = cob_specimen(filename, specimen_name, radius, inch_column, kips_column)
-                mix_name_data = mix_name.cobAnalysis()
-
-            if event == sg.WIN_CLOSED:
-                break
-
-        elif current_layout == stressstrain_specimen:
-            required_vals = ['Specimen Name', '-FILEBROWSE-']
-
-            error = 0
-
-            for i in required_vals:
-                if values[i] == '':
-                    error += 1
-
-            if error > 0:
-                sg.popup_auto_close("Please Enter All Required Fields", title='Error')
-
-            if error == 0:
-                specimen_name = values['Specimen Name']
-                radius = 0
-                inch_column = 0
-                filename = values['-FILEBROWSE-']
-                kips_column = 0
-
-                units = "Imperial"
-
-                mix_name = concrete_specimen(filename, specimen_name, radius, inch_column, kips_column, units, "Strain")
-                mix_name_data = mix_name.concreteAnalysis()
-
-            if event == sg.WIN_CLOSED:
-                break
-
-        elif current_layout == utm_layout:
-            required_vals = ['Specimen Name', '-FILEBROWSE-']
-
-            error = 0
-
-            for i in required_vals:
-                if values[i] == '':
-                    error += 1
-
-            if error > 0:
-                sg.popup_auto_close("Please Enter All Required Fields", title='Error')
-
-            if error == 0:
-                specimen_name = values['Specimen Name']
-                filename = values['-FILEBROWSE-']
-
-                mix_name = UTM_analysis(filename, specimen_name)
-                mix_name_data = mix_name.specimenAnalysis()
-
-    elif event == sg.WIN_CLOSED: # if user closes window or clicks cancel
-        break
-
-
+        self.ultimate_strength = 0
+        self.youngs_modulus = 0
+        self.r_squared = 0
+        self.elastic_strain_bounds = (0, 0)
+        self.data_table = 0
+        self.curve = None  # curve_result of the last analysis, every sample of the file
+        self.stored_curve = None  # the results store's decimated copy, when the last analysis was a store hit
+        self.metrics = {}  # full-curve metrics of the last analysis (analysis_kernel.curveMetrics)
+        self.plot_job = None  # background PNG render of the last analysis
+
+    @instrumented('specimenAnalysis')
+    def specimenAnalysis(self, show=True, save_plot=True, use_store=True):
+        with stage('load', file=self.file_name):
+            stored = self.results.get(self.file_name, 'utm', {}) if use_store else None
+
+        strain, stress = self.loadCurve()
+        if stored is not None:
+            self.results.restore(self, stored, strain, stress)
+        else:
+            curve = analyzeCurve(strain, stress)
+            self.youngs_modulus = curve.slope
+            self.r_squared = curve.r_squared
+            self.elastic_strain_bounds = curve.elastic_strain_bounds
+            self.curve = curve
+            self.stored_curve = None
+            self.metrics = curve.metrics
+            self.results.put(self.file_name, 'utm', {}, self, 'concrete')
+
+        printResults(self)
+        self.data_table = self.curve.dataTable(factor('stress', IMPERIAL, self.units))
+
+        if show or save_plot:
+            with stage('render'):
+                plot = self.plotSpec()
+            self.plot_job = finishPlot(plot, show, save_plot)
+
+    def loadCurve(self):
+        ''' Strain and stress (psi) of the whole export, plus the radius and strength it reports '''
+        with stage('load', file=self.file_name):
+            test_data = loadTestFile(self.file_name)
+            metadata = test_data.metadata()
+
+        self.radius = metadata['Diameter (in):']/2
+        self.ultimate_strength = metadata['Stress at Break (psi):']
+
+        with stage('derive'):
+            ram_position = test_data.column('Ram Position (in)')
+            strain = ram_position[0] - ram_position  # corrected strain, compression positive
+        return finiteCurve(strain, test_data.column('Stress (psi)'))
+
+    def plotSpec(self):
+        ''' Decimated plot of the last analysis, for showing, saving or adding to a PDF report '''
+        curve = self.curve
+        scale = factor('stress', IMPERIAL, self.units)
+        plot = stressPlot(self, (0, self.ultimate_strength))
+        plot.addSeries(curve.strain, curve.stress, 'Structural Analysis of %s' % self.specimen_name)
+        plot.addLine(self.youngs_modulus, curve.intercept, curve.strain, 'Regression Line = %fx + %f with R^2 %f' % (
+            self.youngs_modulus * scale, curve.intercept * scale, curve.rvalue))
+        plot.addSeries(curve.strain, curve.rolling, 'Rolling Average')
+        plot.addSpan(*self.elastic_strain_bounds, 'Elastic Region')
+        return plot
+
+if __name__ == '__main__':
+    import concrete_gui
+    concrete_gui.main()
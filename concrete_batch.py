@@ -0,0 +1,165 @@
+''' Command line batch engine: analyzes every test file in a folder or glob without the GUI and
+    writes one summary table. Example:
+
+        python concrete_batch.py "tests/*.csv" --material concrete --radius 2 --inch-column 1 --kips-column 2
+        python concrete_batch.py utm_exports/ --material utm --output utm_summary.xlsx --pdf utm_plots.pdf
+        python concrete_batch.py "tests/*.csv" --input-units si --radius 50.8 --units si
+'''
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')  # no windows from worker processes
+
+import pandas as pd
+import instrument
+from concrete_analysis import concrete_specimen, cob_specimen, UTM_analysis
+from units import IMPERIAL, unitSystem, unitLabel, convert, convertMetrics, metricColumns
+from plot_render import default_renderer
+
+test_file_extensions = ('.csv', '.xlsx')
+
+
+def findFiles(paths):
+    ''' Expands folders and glob patterns into a sorted list of CSV/XLSX files '''
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [os.path.join(path, name) for name in os.listdir(path)]
+        else:
+            candidates = glob.glob(path)
+        found += [c for c in candidates if os.path.isfile(c) and c.lower().endswith(test_file_extensions)]
+    return sorted(set(found))
+
+
+def analyzeFile(file_name, material='concrete', radius=2, inch_column=1, kips_column=2, plot_dir=None,
+                keep_plot=False, dpi=None, timings_file=None, profile=None, use_store=True, units=IMPERIAL,
+                input_units=IMPERIAL):
+    ''' Runs the matching analyzer on one file without showing anything and returns its summary row.
+        Failures are reported in the row instead of raised so one bad file does not stop a batch.
+        With keep_plot the row also carries the decimated plot_spec under 'Plot'. With timings_file
+        the per-stage timings are appended to it as JSON lines. Files already in the results store
+        are not re-analyzed unless use_store is False. Results are reported in units; the radius and
+        kips/inch columns of concrete and cob files are read in input_units '''
+    specimen_name = os.path.splitext(os.path.basename(file_name))[0]
+    save_plot = plot_dir if plot_dir is not None else False
+    if dpi is not None:
+        default_renderer.dpi = dpi  # set in the worker, which may not share the parent's renderer
+    if timings_file is not None and not instrument.enabled:
+        instrument.enable(timings_file, profile_mode=profile, profile_folder=os.path.dirname(timings_file) or '.')
+
+    units = unitSystem(units)
+    strength_column = 'Ultimate Strength (%s)' % unitLabel('stress', units)
+    modulus_column = "Young's Modulus (%s)" % unitLabel('stress', units)
+    metric_columns = metricColumns(units)
+    row = {'File': file_name, 'Specimen': specimen_name, 'Material': material, strength_column: None,
+           modulus_column: None, 'R^2': None, 'Elastic Strain Start': None, 'Elastic Strain End': None}
+    row.update(dict.fromkeys(metric_columns.values()))
+    row['Error'] = ''
+    try:
+        if material == 'concrete':
+            specimen = concrete_specimen(file_name, specimen_name, radius, kips_column, inch_column, units, 'Kips',
+                                         input_units=input_units)
+            specimen.concreteAnalysis(show=False, save_plot=save_plot, use_store=use_store)
+        elif material == 'strain':
+            specimen = concrete_specimen(file_name, specimen_name, radius, kips_column, inch_column, units, 'Strain',
+                                         input_units=input_units)
+            specimen.concreteAnalysis(show=False, save_plot=save_plot, use_store=use_store)
+        elif material == 'cob':
+            specimen = cob_specimen(file_name, specimen_name, radius, inch_column, kips_column, units, input_units)
+            specimen.cobAnalysis(show=False, save_plot=save_plot, use_store=use_store)
+        else:
+            specimen = UTM_analysis(file_name, specimen_name, units)
+            specimen.specimenAnalysis(show=False, save_plot=save_plot, use_store=use_store)
+        if specimen.plot_job is not None:
+            specimen.plot_job.result()  # the PNG must be written before a worker process exits
+        if keep_plot:
+            row['Plot'] = specimen.plotSpec()
+    except Exception as e:
+        row['Error'] = '%s: %s' % (type(e).__name__, e)
+        return row
+
+    row[strength_column] = convert(specimen.ultimate_strength, 'stress', IMPERIAL, units)
+    row[modulus_column] = convert(specimen.youngs_modulus, 'stress', IMPERIAL, units)
+    row['R^2'] = float(specimen.r_squared)
+    row['Elastic Strain Start'], row['Elastic Strain End'] = map(float, specimen.elastic_strain_bounds)
+    metrics = convertMetrics(specimen.metrics, units)
+    for name, column in metric_columns.items():
+        row[column] = float(metrics[name])
+    return row
+
+
+def analyzeFiles(files, material='concrete', radius=2, inch_column=1, kips_column=2, plot_dir=None, workers=None,
+                 pdf_file=None, dpi=None, timings_file=None, profile=None, use_store=True, units=IMPERIAL,
+                 input_units=IMPERIAL):
+    ''' Fans the files out over a process pool and returns the summary table in input order. With
+        pdf_file every analyzed specimen's plot also becomes one page of that PDF '''
+    if plot_dir is not None:
+        os.makedirs(plot_dir, exist_ok=True)
+
+    options = (material, radius, inch_column, kips_column, plot_dir, pdf_file is not None, dpi, timings_file, profile,
+               use_store, units, input_units)
+    if workers == 1 or len(files) <= 1:
+        rows = [analyzeFile(f, *options) for f in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(analyzeFile, files, *[[option] * len(files) for option in options],
+                                 chunksize=max(len(files) // (4 * (workers or os.cpu_count() or 1)), 1)))
+
+    if pdf_file is not None:
+        default_renderer.exportPdf([row.pop('Plot') for row in rows if 'Plot' in row], pdf_file)
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze a folder or glob of specimen test files.')
+    parser.add_argument('paths', nargs='+', help='folders, files or glob patterns of .csv/.xlsx test files')
+    parser.add_argument('--material', choices=['concrete', 'strain', 'cob', 'utm'], default='concrete',
+                        help='concrete/cob: inch vs kips files, strain: stress/strain export, utm: UTM export')
+    parser.add_argument('--radius', type=float, default=2,
+                        help='specimen radius in inches, or mm with --input-units si (concrete/cob)')
+    parser.add_argument('--inch-column', type=int, default=1, help='1-based inch (or mm) column (concrete/cob)')
+    parser.add_argument('--kips-column', type=int, default=2, help='1-based kips (or kN) column (concrete/cob)')
+    parser.add_argument('--units', choices=['imperial', 'si'], default='imperial',
+                        help='units of the summary and plots: psi, or MPa')
+    parser.add_argument('--input-units', choices=['imperial', 'si'], default='imperial',
+                        help='units of the radius and the inch/kips columns: in and kips, or mm and kN')
+    parser.add_argument('--output', default='summary.csv', help='summary table, .csv or .xlsx')
+    parser.add_argument('--plots', default=None, help='folder to save one PNG plot per specimen into')
+    parser.add_argument('--pdf', default=None, help='multi-page PDF with one plot per specimen')
+    parser.add_argument('--dpi', type=int, default=500, help='resolution of the PNG plots')
+    parser.add_argument('--timings', default=None,
+                        help='append per-stage wall time, CPU time and peak memory to this JSON lines file')
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=None,
+                        help='with --timings, also profile each analysis (.prof files next to the timings file)')
+    parser.add_argument('--rerun', action='store_true',
+                        help='re-analyze every file instead of reusing results already in the results store')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    args = parser.parse_args(argv)
+
+    files = findFiles(args.paths)
+    if not files:
+        print('No .csv or .xlsx files found in %s' % ', '.join(args.paths))
+        return 1
+
+    start = time.perf_counter()
+    summary = analyzeFiles(files, args.material, args.radius, args.inch_column, args.kips_column, args.plots,
+                           args.workers, args.pdf, args.dpi, args.timings, args.profile, not args.rerun, args.units,
+                           args.input_units)
+    if args.output.lower().endswith('.xlsx'):
+        summary.to_excel(args.output, index=False)
+    else:
+        summary.to_csv(args.output, index=False)
+
+    failed = (summary['Error'] != '').sum()
+    print('Analyzed %i files in %f s (%i failed). Summary written to %s' % (
+        len(files), time.perf_counter() - start, failed, args.output))
+    return 1 if failed == len(files) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
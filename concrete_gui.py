@@ -0,0 +1,504 @@
+import os
+import threading
+import PySimpleGUI as sg
+from job_queue import job_queue, JOB_EVENT
+from mix_optimizer import mix_optimizer, default_bounds, default_prices
+from units import IMPERIAL, SI, unitLabel, convert, convertMixes
+
+
+def analysis():
+    ''' The concrete_analysis module, imported on first use. With pandas and the plotting and model
+        stacks behind it, it takes seconds to load, and the home screen does not need it '''
+    import concrete_analysis
+    return concrete_analysis
+
+
+def prewarm():
+    ''' Imports the analysis stack and loads the strength model on a background thread, so the first
+        analysis or prediction does not wait for them. Started once the home screen is showing '''
+    def load():
+        import matplotlib.figure  # noqa: F401 -- prewarm: the first plot then skips the half-second import
+        analysis().Predictive()  # loads xgboost and the model (training it on the very first run)
+
+    thread = threading.Thread(target=load, name='prewarm', daemon=True)
+    thread.start()
+    return thread
+
+
+def analyzeSpecimen(specimen, method):
+    ''' Runs an analysis on a job thread. The plot is only saved there (pyplot windows belong to the
+        GUI thread, which shows it once the job is done), and the job finishes once the PNG is written '''
+    getattr(specimen, method)(show=False, save_plot=True)
+    if specimen.plot_job is not None:
+        specimen.plot_job.result()
+    return specimen
+
+
+def queuedFiles(values, specimen_name):
+    ''' (file, specimen name) for every file picked; with several files each name gets its file's name '''
+    files = [file_name for file_name in values['-FILEBROWSE-'].split(';') if file_name]
+    if len(files) == 1:
+        return [(files[0], specimen_name)]
+    return [(file_name, '%s %s' % (specimen_name, os.path.splitext(os.path.basename(file_name))[0]))
+            for file_name in files]
+
+
+def submitSpecimens(jobs, values, kind, specimens, method, steps, set_name, mix=None, predicted_strength=None,
+                    units=IMPERIAL):
+    ''' Queues each specimen as its own job or, with the replicate set box ticked and several files
+        picked, all of them as one replicate set job with an overlay plot (mix and predicted_strength
+        in units, like its results) '''
+    if values.get('-REPLICATES-') and len(specimens) > 1:
+        from replicate_set import replicate_set
+        replicates = replicate_set(set_name, specimens, mix, predicted_strength, units=units)
+        jobs.submit('replicates', set_name, analyzeSpecimen, replicates, 'replicateAnalysis',
+                    steps=steps * len(specimens) + 2)
+    else:
+        for specimen in specimens:
+            jobs.submit(kind, specimen.specimen_name, analyzeSpecimen, specimen, method, steps=steps)
+
+
+def replicateOption():
+    return [sg.Checkbox('Analyze the files as one replicate set', key='-REPLICATES-')]
+
+
+def queuePanel():
+    ''' Job list with the progress of the running job and cancel buttons, for every screen that starts
+        background work. A function, since a PySimpleGUI element can only be in one layout '''
+    return [
+        [sg.Text('Jobs', expand_x=True, justification='center', font=('Arial Bold', 16))],
+        [sg.Listbox([], key='-QUEUE-', size=(70, 5), select_mode=sg.LISTBOX_SELECT_MODE_EXTENDED, expand_x=True)],
+        [sg.ProgressBar(100, key='-PROGRESS-', size=(30, 15), expand_x=True)],
+        [sg.Button('Cancel Selected', key='-CANCEL JOBS-'), sg.Button('Cancel All', key='-CANCEL ALL-'),
+         sg.Button('Clear Finished', key='-CLEAR JOBS-')],
+    ]
+
+
+def showQueue(window, jobs):
+    if '-QUEUE-' not in window.AllKeysDict:
+        return
+    listed = list(jobs.jobs)
+    window['-QUEUE-'].update([queued.describe() for queued in listed])
+    running = [queued for queued in listed if queued.state == 'running']
+    window['-PROGRESS-'].update(int(100 * running[0].progress()) if running else 0)
+
+
+def selectedJobs(values):
+    return [int(line.split()[0][1:]) for line in values.get('-QUEUE-') or []]
+
+'''
+BEGIN GUI CODE
+'''
+
+
+#sg.theme('LightGrey') #sets theme of window
+sg.set_options(font=('Arial', 16))
+sg.theme('Reddit')
+
+material_choices = ['Concrete', 'Cob', 'Other (Coming Soon)']
+
+
+setting_choices = [
+    #[sg.Text('File Name'), sg.Input(enable_events=True, key='-IN-',font=('Arial Bold', 12),expand_x=True), sg.FileBrowse()],
+    #[sg.Text('Current Units'), sg.Radio("Imperial", "gen", key='imperial', default=True), sg.Radio("Metric", "gen", key='metric', default=False)],
+    [sg.Text('Desired Units'), sg.Radio("Imperial", "gen", key='imperial', default=True), sg.Radio("Metric", "gen", key='metric', default=False)],
+    [sg.Combo(material_choices, expand_x=True, default_value=material_choices[0], key='-COMBO-'), sg.Button('Confirm', key='-CONFIRM-')]
+]
+
+
+home_screen = [
+    [sg.Image(filename='mame logo.png', expand_x=True)],
+    [sg.Button(button_text="Specimen Analysis from Kips/Inch File", key='Kip/Inch', expand_x=True)],
+    [sg.Button(button_text="Specimen Analysis from Stress/Strain File", key='Stress/Strain', expand_x=True)],
+    [sg.Button(button_text='UTM Analysis', key='UTM', expand_x=True)],
+    [sg.Button(button_text="Predict Performance from Ingredients", key='Predict', expand_x=True)],
+    [sg.Button(button_text="Design Mix for Target Strength", key='Optimize', expand_x=True)],
+]
+
+specimen_type_concrete = [
+    #[sg.Text('Kips Column #'), sg.Input(key='-KIPS COLUMN-'), sg.Text('Inch Column #'), sg.Input(key='-INCH COLUMN-')],
+    [sg.Text('Specimen Name*        ', justification='left', expand_x=True), sg.Input(key='Specimen Name')],
+    [sg.Text('Specimen Radius* (in) ', justification='left'), sg.Input(default_text='2', key='Rad')],
+          ]
+
+
+choices = [
+    [sg.Button('OK', key='-OK-'), sg.Cancel()],
+]
+
+specimen_type_cob = [
+    [sg.Combo(material_choices, expand_x=True, default_value=material_choices[0], key='-COMBO-'), sg.Button('Confirm', key='-CONFIRM-')],
+    [sg.Text('Specimen Name*     ', justification='left', expand_x=True), sg.Input(key='Specimen Name', expand_x=True)],
+    [sg.Text('Radius* (in)              ', justification='left', expand_x=True), sg.Input(key='Cob Radius', default_text='3', expand_x=True)]
+]
+
+is_visible = False
+
+predictive_layout = [
+    [sg.Image(filename='mame logo.png', expand_x=True)],
+    [sg.Text('Fine Aggregate (lb/yd^3)      ', justification='left', expand_x=True), sg.Input(key='Fine Agg')],
+    [sg.Text('Course Aggregate (lb/yd^3)    ', justification='left', expand_x=True), sg.Input(key='Coarse Agg')],
+    [sg.Text('Cement (lb/yd^3)      ', justification='left', expand_x=True), sg.Input(key='Cement')],
+    [sg.Text('Water (lb/yd^3)       ', justification='left', expand_x=True), sg.Input(key='Water')],
+    [sg.Text('Fly Ash (lb/yd^3)     ', justification='left', expand_x=True), sg.Input(default_text='0', key='Fly Ash')],
+    [sg.Text('Super Plasticizer (lb/yd^3)   ', justification='left', expand_x=True), sg.Input(default_text='0', key='Super')],
+    [sg.Text('Blast Furnace Slag (lb/yd^3)  ', justification='left', expand_x=True), sg.Input(default_text='0', key='Blast Slag')],
+    [sg.Text('Curing Time (days)    ', justification='left', expand_x=True), sg.Input(default_text='28', key='Age')],
+    [sg.Text('Mix Units'), sg.Radio("Imperial (lb/yd^3, psi)", "mix units", key='mix imperial', default=True),
+     sg.Radio("Metric (kg/m^3, MPa)", "mix units", key='mix metric', default=False)],
+    [sg.Button('Predict', key='Run Predictor')],
+    [sg.Text('Batch File (CSV of mixes)'), sg.Input(key='Batch File', expand_x=True), sg.FileBrowse()],
+    [sg.Button('Predict File', key='Run Batch Predictor')],
+] + queuePanel()
+
+optimizer_layout = [
+    [sg.Image(filename='mame logo.png', expand_x=True)],
+    [sg.Text('Target Strength* (psi)', expand_x=True), sg.Input(key='Target', default_text='4000')],
+    [sg.Text('Curing Time (days)', expand_x=True), sg.Input(key='Age', default_text='28')],
+    [sg.Text('Ingredient (lb/yd^3)', expand_x=True), sg.Text('Min'), sg.Text('Max'), sg.Text('Price ($/lb)')],
+] + [
+    [sg.Text(ingredient, expand_x=True), sg.Input(default_text=str(default_bounds[ingredient][0]), key='Min ' + ingredient, size=8),
+     sg.Input(default_text=str(default_bounds[ingredient][1]), key='Max ' + ingredient, size=8),
+     sg.Input(default_text=str(default_prices[ingredient]), key='Price ' + ingredient, size=8)]
+    for ingredient in default_bounds
+] + [
+    [sg.Button('Find Mixes', key='Run Optimizer')],
+] + queuePanel()
+
+specimen_type = specimen_type_concrete
+
+
+concrete_layout = [
+    [sg.Image(filename='mame logo.png', expand_x=True)],
+    [setting_choices],
+    [specimen_type_concrete],
+    [sg.Text('File Options', expand_x='true', justification='center', font=('Arial Bold', 16))],
+    [sg.Text('File Name*'), sg.Input(key='-FILEBROWSE-',font=('Arial Bold', 12),expand_x=True, ), sg.FilesBrowse()],
+    replicateOption(),
+    [sg.Text('Inch Column #*         ', expand_x=True), sg.Input(key='-INCH COLUMN-', expand_x=True)],
+    [sg.Text('Kips Column #*         ', expand_x=True), sg.Input(key='-KIPS COLUMN-', expand_x=True)],
+    [sg.Button('Analyze', key='-OK-')],
+    ] + queuePanel()
+
+stressstrain_specimen =  [
+    [sg.Image(filename='mame logo.png', expand_x=True)],
+    [sg.Text('Specimen Name*', expand_x=True), sg.Input(key='Specimen Name', default_text='New Mix')],
+    [sg.Text('Radius*', expand_x=True), sg.Input(key='Radius')],
+    [sg.Text('File Options', expand_x='true', justification='center', font=('Arial Bold', 16))],
+    [sg.Text('File Name*', expand_x=True), sg.Input(key='-FILEBROWSE-',expand_x=True), sg.FilesBrowse()],
+    replicateOption(),
+    [sg.Button('Analyze', key='-OK-')],
+] + queuePanel()
+
+cob_layout = [
+    [sg.Image(filename='mame logo.png', expand_x=True)],
+    [specimen_type_cob],
+    [sg.Text('File Options', expand_x='true', justification='center', font=('Arial Bold', 16))],
+    [sg.Text('File Name*'), sg.Input(key='-FILEBROWSE-',font=('Arial Bold', 12),expand_x=True), sg.FilesBrowse()],
+    replicateOption(),
+    [sg.Text('Inch Column #*       '), sg.Input(key='-INCH COLUMN-', expand_x=False)],
+    [sg.Text('Kips Column #*       '), sg.Input(key='-KIPS COLUMN-', expand_x=False)],
+    [sg.Button('Analyze', key='-OK-')],
+    ] + queuePanel()
+
+utm_layout = [
+    [sg.Image(filename='mame logo.png', expand_x=True)],
+    [sg.Text('Specimen Name*'), sg.Input(key='Specimen Name', default_text='New Mix')],
+    [sg.Text('File Name*'), sg.Input(key='-FILEBROWSE-',font=('Arial Bold', 12),expand_x=True), sg.FilesBrowse()],
+    replicateOption(),
+    [sg.Button('Analyze', key='-OK-')],
+] + queuePanel()
+
+def main(prewarm_imports=True):
+    current_layout = home_screen
+
+    window = sg.Window('Concrete Machine', layout=current_layout, finalize=True) #creates a window based on the layout above with title and size
+    #shown
+    if prewarm_imports:
+        prewarm()
+    pred_strength = None  # psi
+    predicted_mix = None  # the last mix run through the predictor, added to the lab results once tested
+    predicted_units = IMPERIAL  # what predicted_mix was entered in
+
+    def notify(event, queued):
+        window.write_event_value(event, queued)  # whichever window is open when the job reports
+
+    jobs = job_queue(notify)
+    shown_window = None
+
+    while True:
+        if window is not shown_window:
+            window.finalize()
+            showQueue(window, jobs)
+            shown_window = window
+        event, values = window.read()
+
+        if event == 'Kip/Inch':
+            window.close()
+            window = sg.Window('Concrete Machine', concrete_layout)
+            current_layout = concrete_layout
+
+        if event == 'Stress/Strain':
+            window.close()
+            window = sg.Window('Stress Strain Machine', stressstrain_specimen)
+            current_layout = stressstrain_specimen
+
+        if event == '-CONFIRM-':
+            if values['-COMBO-'] == 'Cob':
+                window.close()
+                window = sg.Window('Cob Machine', cob_layout)
+                current_layout = cob_layout
+
+        if event == 'Predict':
+            window.close()
+            window = sg.Window('Concrete Predictor', predictive_layout)
+            current_layout = predictive_layout
+
+        if event == 'Optimize':
+            window.close()
+            window = sg.Window('Mix Designer', optimizer_layout)
+            current_layout = optimizer_layout
+
+        if event == 'UTM':
+            window.close()
+            window = sg.Window('UTM Data Analysis', utm_layout)
+            current_layout = utm_layout
+
+        elif event == '-CANCEL-':
+            window.close()
+            window = sg.Window('NOMAD - Alpha Version',home_screen)
+            current_layout = home_screen
+
+        elif event == 'Run Predictor':
+            vals = ['Cement', 'Coarse Agg', 'Fine Agg', 'Water', 'Fly Ash', 'Super', 'Blast Slag', 'Age']
+
+            for i in vals:
+                if values[i] == '':
+                    values[i] = 0
+
+            try:
+                # floats, not ints: metric amounts such as 2.5 kg/m^3 of superplasticizer have decimals
+                cement, coarse_agg, fine_agg, water, flyash, super, blast_furnace_slag, age = [
+                    float(values[i]) for i in vals]
+            except ValueError:
+                sg.popup_auto_close("Please Enter Numbers Only", title='Error')
+            else:
+                predicted_mix = (cement, blast_furnace_slag, flyash, water, super, coarse_agg, fine_agg, age)
+                predicted_units = SI if values['mix metric'] else IMPERIAL
+                jobs.submit('predict', 'mix %g %s cement' % (cement, unitLabel('mix', predicted_units)),
+                            lambda mix, units: (analysis().Predictive(*mix, units=units).strength_predict[0], units),
+                            predicted_mix, predicted_units, steps=2)
+
+        elif event == 'Run Optimizer':
+            if values['Target'] == '':
+                sg.popup_auto_close("Please Enter All Required Fields", title='Error')
+            else:
+                bounds = {}
+                prices = {}
+                for ingredient in default_bounds:
+                    bounds[ingredient] = (float(values['Min ' + ingredient]), float(values['Max ' + ingredient]))
+                    prices[ingredient] = float(values['Price ' + ingredient])
+
+                def design(target, age, bounds, prices):
+                    return target, mix_optimizer(analysis().Predictive(), float(target), age, bounds, prices).optimize()
+
+                jobs.submit('mix design', '%s psi' % values['Target'], design, values['Target'], int(values['Age']),
+                            bounds, prices)
+
+        elif event == 'Run Batch Predictor':
+            if values['Batch File'] == '':
+                sg.popup_auto_close("Please Enter All Required Fields", title='Error')
+            else:
+                batch_file = values['Batch File']
+                output_file = os.path.splitext(batch_file)[0] + ' predictions.csv'
+
+                def predictFile(batch_file, output_file):
+                    batch = analysis().Predictive()
+                    batch.predict_many(batch_file, output_file=output_file)
+                    return output_file, batch.throughput
+
+                jobs.submit('batch predict', os.path.basename(batch_file), predictFile, batch_file, output_file)
+
+        elif event == '-OK-':
+            if current_layout == concrete_layout:
+                required_vals = ['Specimen Name', 'Rad', '-INCH COLUMN-', '-FILEBROWSE-', '-KIPS COLUMN-']
+
+                error = 0
+
+                for i in required_vals:
+                    if values[i] == '':
+                        error += 1
+
+                if error > 0:
+                    sg.popup_auto_close("Please Enter All Required Fields", title='Error')
+
+                if error == 0:
+                    kips_col = int((values['-KIPS COLUMN-']))
+                    inch_col = int((values['-INCH COLUMN-']))
+                    specimen_name = values['Specimen Name']
+                    radius = int(values['Rad'])
+
+                    if values['imperial'] == True:
+                        units = "Imperial"
+                    else:
+                        units = "Metric"
+
+                    # the predicted strength and mix go to the analyzers in the units they report in
+                    strength = convert(pred_strength, 'stress', IMPERIAL, units)
+                    mix = None if predicted_mix is None else convertMixes(list(predicted_mix), predicted_units, units)
+                    specimens = [analysis().concrete_specimen(filename, name, radius, kips_col, inch_col, units, "Kips",
+                                                              predicted_strength=strength)
+                                 for filename, name in queuedFiles(values, specimen_name)]
+                    submitSpecimens(jobs, values, 'concrete', specimens, 'concreteAnalysis', 7, specimen_name, mix,
+                                    strength, units)
+
+                if event == sg.WIN_CLOSED:
+                    break
+
+            elif current_layout == cob_layout:
+                required_vals = ['Specimen Name', 'Cob Radius', '-INCH COLUMN-', '-FILEBROWSE-', '-KIPS COLUMN-']
+
+                error = 0
+
+                for i in required_vals:
+                    if values[i] == '':
+                        error += 1
+
+                if error > 0:
+                    sg.popup_auto_close("Please Enter All Required Fields", title='Error')
+
+                if error == 0:
+                    specimen_name = values['Specimen Name']
+                    #soil = int(values['Soil'])
+                    #sand = int(values['Sand'])
+                    #straw = int(values['Straw'])
+                    #water = int(values['Water'])
+                    radius = int(values['Cob Radius'])
+                    inch_column = int(values['-INCH COLUMN-'])
+                    kips_column = int(values['-KIPS COLUMN-'])
+
+                    specimens = [analysis().cob_specimen(filename, name, radius, inch_column, kips_column)
+                                 for filename, name in queuedFiles(values, specimen_name)]
+                    submitSpecimens(jobs, values, 'cob', specimens, 'cobAnalysis', 7, specimen_name)
+
+                if event == sg.WIN_CLOSED:
+                    break
+
+            elif current_layout == stressstrain_specimen:
+                required_vals = ['Specimen Name', '-FILEBROWSE-']
+
+                error = 0
+
+                for i in required_vals:
+                    if values[i] == '':
+                        error += 1
+
+                if error > 0:
+                    sg.popup_auto_close("Please Enter All Required Fields", title='Error')
+
+                if error == 0:
+                    specimen_name = values['Specimen Name']
+                    radius = 0
+                    inch_column = 0
+                    kips_column = 0
+
+                    units = "Imperial"
+
+                    specimens = [analysis().concrete_specimen(filename, name, radius, inch_column, kips_column, units, "Strain")
+                                 for filename, name in queuedFiles(values, specimen_name)]
+                    submitSpecimens(jobs, values, 'stress-strain', specimens, 'concreteAnalysis', 5, specimen_name)
+
+                if event == sg.WIN_CLOSED:
+                    break
+
+            elif current_layout == utm_layout:
+                required_vals = ['Specimen Name', '-FILEBROWSE-']
+
+                error = 0
+
+                for i in required_vals:
+                    if values[i] == '':
+                        error += 1
+
+                if error > 0:
+                    sg.popup_auto_close("Please Enter All Required Fields", title='Error')
+
+                if error == 0:
+                    specimen_name = values['Specimen Name']
+
+                    specimens = [analysis().UTM_analysis(filename, name)
+                                 for filename, name in queuedFiles(values, specimen_name)]
+                    submitSpecimens(jobs, values, 'utm', specimens, 'specimenAnalysis', 6, specimen_name)
+
+        elif event == '-CANCEL JOBS-':
+            jobs.cancel(selectedJobs(values))
+
+        elif event == '-CANCEL ALL-':
+            jobs.cancel()
+
+        elif event == '-CLEAR JOBS-':
+            jobs.clearFinished()
+            showQueue(window, jobs)
+
+        elif event == JOB_EVENT:
+            queued = values[JOB_EVENT]
+            showQueue(window, jobs)
+            if not queued.finished() or queued.handled:
+                continue
+            queued.handled = True  # progress events posted before the last one can still be queued behind it
+
+            if queued.state == 'failed':
+                sg.popup_error('%s %s failed: %s' % (queued.kind, queued.name, queued.error))
+
+            elif queued.state == 'done' and queued.kind == 'predict':
+                strength, strength_units = queued.result
+                pred_strength = convert(strength, 'stress', strength_units, IMPERIAL)
+
+                ch = sg.popup_yes_no(
+                    'We predict your mix will have strength %f %s. Would you like to analyze your data for comparison? (kips/inch data only)' % (
+                        strength, unitLabel('stress', strength_units)))
+
+                if ch == 'Yes':
+                    window.close()
+                    window = sg.Window('Concrete Machine', concrete_layout)
+                    current_layout = concrete_layout
+
+            elif queued.state == 'done' and queued.kind == 'mix design':
+                target, pareto_front = queued.result
+                if len(pareto_front) == 0:
+                    sg.popup('No mix within these bounds reaches %s psi.' % target)
+                else:
+                    pareto_front.to_csv('mix design %s psi.csv' % target, index=False)
+                    cheapest = pareto_front.iloc[0]
+                    sg.popup('Cheapest mix ($%.2f/yd^3, %i psi predicted):\n' % (cheapest['Cost ($/yd^3)'], cheapest['Predicted Strength (psi)']) +
+                             '\n'.join('%s: %.1f lb/yd^3' % (ingredient, cheapest[ingredient]) for ingredient in default_bounds) +
+                             '\n\nFull Pareto front saved to mix design %s psi.csv' % target)
+
+            elif queued.state == 'done' and queued.kind == 'batch predict':
+                output_file, throughput = queued.result
+                sg.popup('Predictions written to ' + output_file + ' (%i mixes/s)' % int(throughput))
+
+            elif queued.state == 'done' and queued.kind == 'model update':
+                report = queued.result
+                sg.popup_auto_close('Model %s. Held-out RMSE: %s psi, on the base data: %s psi' % (
+                    'updated' if report['kept'] else 'unchanged', report['rmse_after'], report['base_rmse_after']))
+
+            elif queued.state == 'done':
+                mix_name = queued.result
+                mix_name.plotSpec().show(block=False)
+
+                if queued.kind == 'concrete' and predicted_mix is not None and sg.popup_yes_no(
+                        'Add %s to the strength model (measured %f %s)?' % (
+                            mix_name.specimen_name, convert(mix_name.ultimate_strength, 'stress', IMPERIAL, mix_name.units),
+                            unitLabel('stress', mix_name.units))) == 'Yes':
+                    jobs.submit('model update', mix_name.specimen_name, mix_name.predictiveAnalysis, *predicted_mix,
+                                units=predicted_units, steps=2)
+                    predicted_mix = None
+
+        elif event == sg.WIN_CLOSED: # if user closes window or clicks cancel
+            jobs.shutdown()
+            break
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+from xlsx_reader import readXlsx, readXlsxOpenpyxl
+
+INGEST_VERSION = 3
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ingest_cache')
+HEAD_ROWS = 30  # rows kept as raw cells for layout detection, headers and metadata
+
+
+def jsonCell(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (int, float, str, bool)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def contentHash(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def isNumber(cell):
+    if isinstance(cell, bool) or cell is None:
+        return False
+    if isinstance(cell, (int, float, np.number)):
+        return not np.isnan(cell)
+    try:
+        float(cell)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def isFilled(cell):
+    return cell is not None and not (isinstance(cell, str) and cell.strip() == '') and \
+        not (isinstance(cell, float) and np.isnan(cell))
+
+
+def detectLayout(head):
+    ''' Finds (header_row, data_start) in the first rows of a sheet. Data starts at the first of
+        three consecutive rows whose filled cells are all numbers. The header is the widest row of
+        the text rows right above it; anything between the header and the data (unit rows) is
+        skipped, and anything above the header is the metadata block '''
+    numeric = [any(isFilled(c) for c in row) and all(isNumber(c) for c in row if isFilled(c)) for row in head]
+    data_start = len(head)
+    for i in range(len(head)):
+        if all(numeric[i:i + 3]):
+            data_start = i
+            break
+
+    block_start = data_start
+    while block_start > 0 and not numeric[block_start - 1] and any(isFilled(c) for c in head[block_start - 1]):
+        block_start -= 1
+    if block_start == data_start:
+        return max(data_start - 1, 0), data_start
+
+    widths = [sum(isFilled(c) for c in head[i]) for i in range(block_start, data_start)]
+    return block_start + widths.index(max(widths)), data_start
+
+
+def parseMetadata(rows):
+    ''' Reads the rows above the header either as a names row over a values row
+        (Diameter (in): | Stress at Break (psi): / 4 | 6015) or as name, value pairs along a row '''
+    metadata = {}
+    i = 0
+    while i < len(rows):
+        row = rows[i]
+        filled = [c for c in row if isFilled(c)]
+        below = rows[i + 1] if i + 1 < len(rows) else None
+        if filled and not any(isNumber(c) for c in filled) and below is not None and any(isNumber(c) for c in below):
+            for name, value in zip(row, below):
+                if isFilled(name) and isFilled(value):
+                    metadata.setdefault(str(name).strip(), float(value) if isNumber(value) else value)
+            i += 2
+            continue
+
+        cells = [c for c in row if isFilled(c)]
+        for name, value in zip(cells[::2], cells[1::2]):
+            metadata.setdefault(str(name).strip(), float(value) if isNumber(value) else value)
+        i += 1
+    return metadata
+
+
+def isXlsx(file_name):
+    ''' Sniffs the zip signature instead of trusting the extension '''
+    with open(file_name, 'rb') as f:
+        return f.read(4) == b'PK\x03\x04'
+
+
+def readCsvHead(file_name, head_rows=HEAD_ROWS):
+    with open(file_name, newline='', encoding='utf-8-sig') as f:
+        head = [row for _, row in zip(range(head_rows), csv.reader(f))]
+    head = [[float(c) if isNumber(c) else (c if c.strip() != '' else None) for c in row] for row in head]
+    n_columns = max((len(row) for row in head), default=0)
+    return [row + [None] * (n_columns - len(row)) for row in head]
+
+
+def readCsv(file_name, head_rows=HEAD_ROWS, usecols=None):
+    ''' (head, values) like readXlsx: the head rows are read as text to find the layout, then the
+        data rows go through pandas' C parser straight into floats '''
+    head = readCsvHead(file_name, head_rows)
+    n_columns = len(head[0]) if head else 0
+    _, data_start = detectLayout(head)
+
+    columns = list(range(n_columns)) if usecols is None else list(usecols)
+    data = pd.read_csv(file_name, header=None, names=range(n_columns), usecols=columns, skiprows=data_start,
+                       encoding='utf-8-sig', skip_blank_lines=False, low_memory=False)[columns]
+    for column in columns:
+        if not pd.api.types.is_numeric_dtype(data[column]):  # text cells (object, or str under pandas 3)
+            data[column] = pd.to_numeric(data[column], errors='coerce')
+
+    values = np.empty((data_start + len(data), len(columns)), order='F')
+    for j, column in enumerate(columns):
+        values[:data_start, j] = [head[i][column] if isNumber(head[i][column]) else np.nan for i in range(data_start)]
+        values[data_start:, j] = data[column].to_numpy(dtype=np.float64)
+    head = [[row[column] for column in columns] for row in head]
+    return head, values
+
+
+def readTable(file_name, usecols=None):
+    ''' Reads a CSV or XLSX test file into (head rows, float grid), using the fast XLSX reader
+        and falling back to openpyxl read-only streaming for workbooks it cannot parse '''
+    if not isXlsx(file_name):
+        return readCsv(file_name, usecols=usecols)
+    try:
+        return readXlsx(file_name, HEAD_ROWS, usecols)
+    except (ValueError, KeyError, IndexError, ET.ParseError):
+        return readXlsxOpenpyxl(file_name, HEAD_ROWS, usecols)
+
+
+class test_file:
+    ''' One ingested test file: the numeric channels as a column-major float64 grid (NaN where a cell
+        is not a number), memory-mapped from the ingest cache, plus the first rows as raw cells. The
+        header row, the first data row and the metadata block above the header are detected from
+        those first rows. Rows and columns are those of the source sheet '''
+
+    def __init__(self, values, head):
+        self.values = values
+        self.head = head
+        self.header_row, self.data_start = detectLayout(head)
+
+    def columnNames(self, header_row=None):
+        header_row = self.header_row if header_row is None else header_row
+        row = self.head[header_row] if header_row < len(self.head) else []
+        return [None if cell is None else str(cell).strip() for cell in row]
+
+    def columnIndex(self, column, header_row=None):
+        if isinstance(column, (int, np.integer)):
+            return int(column)
+        names = self.columnNames(header_row)
+        if column not in names:
+            raise KeyError('%s not found in the header row (%s)' % (column, names))
+        return names.index(column)
+
+    def column(self, column, header_row=None):
+        ''' Numeric data values for a column name or 0-based index, as a view on the cache. Passing
+            header_row overrides the detected layout and takes every row below it '''
+        start = self.data_start if header_row is None else header_row + 1
+        return self.values[start:, self.columnIndex(column, header_row)]
+
+    def metadata(self):
+        ''' The metadata block above the header, e.g. metadata()['Diameter (in):'] on a UTM export '''
+        return parseMetadata(self.head[:self.header_row])
+
+
+class ingest_cache:
+    ''' Converts each source file once into a .npy channel grid plus a JSON header, stored under its
+        content hash. An index on (path, mtime, size) skips rehashing unchanged files, and copies
+        or re-saved files with the same content share one entry. Later loads memory-map the grid '''
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=500):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def indexPath(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def readIndex(self):
+        try:
+            with open(self.indexPath()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def writeIndex(self, index):
+        # written atomically so parallel batch workers never see a half-written index
+        tmp_path = self.indexPath() + '.tmp%d-%d' % (os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.indexPath())
+
+    def fileKey(self, file_name):
+        ''' Content hash for file_name, reusing the indexed one while path, mtime and size match '''
+        path = os.path.abspath(file_name)
+        stat = os.stat(path)
+        index = self.readIndex()
+        entry = index.get(path)
+        if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return entry['hash']
+
+        key = contentHash(path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index = self.readIndex()
+        index[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': key}
+        self.writeIndex(index)
+        return key
+
+    def load(self, file_name):
+        ''' Returns the test_file for file_name, parsing and caching it on first use '''
+        key = self.fileKey(file_name)
+        entry_path = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(entry_path, 'header.json')) as f:
+                header = json.load(f)
+            if header['version'] != INGEST_VERSION:
+                raise ValueError('cached with an older ingest version')
+            values = np.load(os.path.join(entry_path, 'channels.npy'), mmap_mode='r')
+            os.utime(os.path.join(entry_path, 'header.json'))  # recently used, for eviction
+            return test_file(values, header['head'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        values, head = self.parse(file_name)
+        self.save(key, values, head, file_name)
+        return test_file(np.load(os.path.join(entry_path, 'channels.npy'), mmap_mode='r'), head)
+
+    def parse(self, file_name):
+        head, values = readTable(file_name)
+        return np.asfortranarray(values), [[jsonCell(cell) for cell in row] for row in head]
+
+    def save(self, key, values, head, file_name):
+        entry_path = os.path.join(self.cache_dir, key)
+        tmp_path = entry_path + '.tmp%d-%d' % (os.getpid(), threading.get_ident())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'channels.npy'), values)
+        with open(os.path.join(tmp_path, 'header.json'), 'w') as f:
+            json.dump({'head': head, 'source': os.path.abspath(file_name), 'created': time.time(),
+                       'version': INGEST_VERSION}, f)
+
+        shutil.rmtree(entry_path, ignore_errors=True)
+        try:
+            os.replace(tmp_path, entry_path)
+        except OSError:
+            # another worker cached the same content first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        ''' Lists (key, last_used) for every cached file, most recently used first '''
+        if not os.path.isdir(self.cache_dir):
+            return []
+        found = []
+        for key in os.listdir(self.cache_dir):
+            header = os.path.join(self.cache_dir, key, 'header.json')
+            if '.tmp' not in key and os.path.isfile(header):
+                found.append((key, os.path.getmtime(header)))
+        return sorted(found, key=lambda item: item[1], reverse=True)
+
+    def invalidate(self, file_name=None):
+        ''' Drops the cached copy of one source file, or the whole cache when file_name is None '''
+        if file_name is None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            return
+
+        path = os.path.abspath(file_name)
+        index = self.readIndex()
+        entry = index.pop(path, None)
+        if entry is not None:
+            shutil.rmtree(os.path.join(self.cache_dir, entry['hash']), ignore_errors=True)
+            self.writeIndex(index)
+
+    def evict(self):
+        ''' Drops the least recently used entries beyond max_entries '''
+        for key, last_used in self.entries()[self.max_entries:]:
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+
+default_cache = ingest_cache()
+
+
+def loadTestFile(file_name, cache=None):
+    return (cache or default_cache).load(file_name)
@@ -0,0 +1,265 @@
+''' Per-stage instrumentation for analyses and predictions. Each stage (load, clean, derive, regress,
+    render, train, predict) records its wall time, CPU time and peak allocation, grouped into runs
+    (one analysis or prediction call). Records are kept in memory, returned on the analyzer as
+    .timings, and appended as JSON lines to a log file. Disabled by default; while disabled every
+    stage() is a shared no-op context manager, so the hooks cost one function call each.
+
+        import instrument
+        instrument.enable('timings.jsonl', profile_mode='cprofile')
+        specimen.concreteAnalysis(show=False)
+        specimen.timings  # [{'stage': 'load', 'wall_s': ..., 'cpu_s': ..., 'peak_bytes': ...}, ...]
+
+    python instrument.py timings.jsonl summarizes a log per stage.
+'''
+import argparse
+import collections
+import cProfile
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+STAGES = ('load', 'clean', 'derive', 'regress', 'render', 'train', 'predict')
+
+enabled = False
+log_file = None
+track_memory = True
+profile = None  # None, 'cprofile' or 'tracemalloc', applied per run
+profile_dir = '.'
+history = collections.deque(maxlen=10000)
+
+local = threading.local()
+write_lock = threading.Lock()
+run_ids = itertools.count(1)
+
+
+def enable(file_name=None, memory=True, profile_mode=None, profile_folder='.'):
+    ''' Starts recording. file_name receives one JSON line per stage and per run; memory=True traces
+        allocations with tracemalloc for the peak_bytes of each stage (slower); profile_mode
+        'cprofile' writes a .prof file per run into profile_folder and 'tracemalloc' adds the top
+        allocation sites to each run record '''
+    global enabled, log_file, track_memory, profile, profile_dir
+    if profile_mode not in (None, 'cprofile', 'tracemalloc'):
+        raise ValueError("profile_mode must be None, 'cprofile' or 'tracemalloc', not %r" % profile_mode)
+    log_file = file_name
+    track_memory = memory
+    profile = profile_mode
+    profile_dir = profile_folder
+    if (memory or profile_mode == 'tracemalloc') and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def records():
+    ''' Every stage and run record since recording was enabled (the most recent 10000) '''
+    return list(history)
+
+
+def write(record):
+    history.append(record)
+    if log_file is not None:
+        with write_lock, open(log_file, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+
+def openTimers():
+    if not hasattr(local, 'stack'):
+        local.stack = []
+    return local.stack
+
+
+class null_timer:
+    ''' Stands in for stage_timer and run_timer while recording is off '''
+    stages = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null = null_timer()
+
+
+class stage_timer:
+    ''' Times one stage. Peak allocation is the highest traced memory during the stage above the
+        level at its start; tracemalloc's peak is reset on entry, so enclosing timers fold it in
+        first. It is process-wide, so allocations on other threads during the stage count too '''
+
+    kind = 'stage'
+    label = 'stage'  # key the name is recorded under
+
+    def __init__(self, name, info):
+        self.name = name
+        self.info = info
+
+    def __enter__(self):
+        stack = openTimers()
+        if track_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            for timer in stack:
+                timer.peak = max(timer.peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = self.peak = current
+        else:
+            self.start_memory = None
+        stack.append(self)
+        self.started = time.time()
+        # this thread's CPU time: GUI jobs and plot rendering run on other threads at the same time, and
+        # process_time would count their work too (native threads, e.g. xgboost's, are not counted either)
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        stack = openTimers()
+        stack.remove(self)
+
+        peak_bytes = None
+        if self.start_memory is not None and tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            for timer in stack:
+                timer.peak = max(timer.peak, self.peak)
+            peak_bytes = self.peak - self.start_memory
+
+        current_run = getattr(local, 'run', None)
+        self.record = {'type': self.kind, 'run': current_run.run_id if current_run else None, self.label: self.name,
+                       'started': self.started, 'wall_s': wall, 'cpu_s': cpu, 'peak_bytes': peak_bytes,
+                       'error': exc_type.__name__ if exc_type else None}
+        self.record.update(self.info)
+        if self.kind == 'stage' and current_run is not None:
+            current_run.stages.append(self.record)
+        self.finish()
+        write(self.record)
+        return False
+
+    def finish(self):
+        pass
+
+
+class run_timer(stage_timer):
+    ''' Groups the stages of one analysis or prediction call, with the optional per-run profiler '''
+
+    kind = 'run'
+    label = 'name'
+
+    def __enter__(self):
+        self.stages = []
+        self.run_id = next(run_ids)
+        self.outer_run = getattr(local, 'run', None)
+        self.profiler = None
+        if profile == 'cprofile' and self.outer_run is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif profile == 'tracemalloc' and self.outer_run is None and tracemalloc.is_tracing():
+            self.snapshot = tracemalloc.take_snapshot()
+        stage_timer.__enter__(self)
+        local.run = self
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        local.run = self.outer_run
+        if self.profiler is not None:
+            self.profiler.disable()
+        return stage_timer.__exit__(self, exc_type, exc, traceback)
+
+    def finish(self):
+        # the run record carries its own id, not the enclosing run's
+        self.record['run'] = self.run_id
+        self.record['parent'] = self.outer_run.run_id if self.outer_run else None
+        self.record['stages'] = len(self.stages)
+        if self.profiler is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, '%s-%i-%i.prof' % (self.name, os.getpid(), self.run_id))
+            self.profiler.dump_stats(path)
+            self.record['profile'] = path
+        elif profile == 'tracemalloc' and self.outer_run is None and tracemalloc.is_tracing():
+            top = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')[:10]
+            self.record['top_allocations'] = [{'where': str(stat.traceback), 'size_diff': stat.size_diff,
+                                               'count_diff': stat.count_diff} for stat in top]
+            self.snapshot = None
+
+
+def watch(callback):
+    ''' Calls callback(stage name) at the start of every stage on this thread, or stops with None.
+        The GUI's job queue uses it for progress, and raises from it to stop a cancelled job '''
+    local.watcher = callback
+
+
+def stage(name, **info):
+    ''' with stage('regress', rows=n): ... records the block when recording is on '''
+    watcher = getattr(local, 'watcher', None)
+    if watcher is not None:
+        watcher(name)
+    if not enabled:
+        return null
+    return stage_timer(name, info)
+
+
+def run(name, **info):
+    if not enabled:
+        return null
+    return run_timer(name, info)
+
+
+def instrumented(name):
+    ''' Decorator for analyzer and predictor methods: runs the method as one run and leaves its stage
+        records on the instance as .timings ([] while recording is off) '''
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not enabled:
+                self.timings = []
+                return method(self, *args, **kwargs)
+            with run_timer(name, {'owner': type(self).__name__}) as current:
+                result = method(self, *args, **kwargs)
+            self.timings = current.stages
+            return result
+        return wrapper
+    return decorate
+
+
+def summarize(file_name):
+    ''' Per-stage count and wall, CPU and peak memory totals of a JSON lines log '''
+    totals = collections.OrderedDict()
+    with open(file_name) as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('type') != 'stage':
+                continue
+            total = totals.setdefault(record['stage'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_bytes': 0})
+            total['count'] += 1
+            total['wall_s'] += record['wall_s']
+            total['cpu_s'] += record['cpu_s']
+            total['peak_bytes'] = max(total['peak_bytes'], record['peak_bytes'] or 0)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize an instrumentation log per stage.')
+    parser.add_argument('file_name')
+    args = parser.parse_args(argv)
+
+    totals = summarize(args.file_name)
+    wall = sum(total['wall_s'] for total in totals.values()) or 1
+    print('%-10s %8s %12s %12s %8s %14s' % ('stage', 'count', 'wall (s)', 'cpu (s)', 'share', 'max peak (MB)'))
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]['wall_s']):
+        print('%-10s %8i %12.4f %12.4f %7.1f%% %14.1f' % (name, total['count'], total['wall_s'], total['cpu_s'],
+                                                          100 * total['wall_s'] / wall, total['peak_bytes'] / 1e6))
+
+
+if __name__ == '__main__':
+    main()
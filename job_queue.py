@@ -0,0 +1,147 @@
+''' Background jobs for the GUI. Analyses, predictions and model training run on a small worker pool
+    while the PySimpleGUI event loop keeps handling the window. A job reports back through window
+    events: one when it starts, one at the start of each instrumented stage (load, clean, derive,
+    regress, render, train, predict), which doubles as its progress, and one when it finishes.
+    Cancelling a queued job drops it; cancelling a running one stops it at its next stage, so a model
+    fit already under way completes but its result is dropped.
+
+        jobs = job_queue(window.write_event_value)
+        jobs.submit('analysis', 'Mix A', specimen.concreteAnalysis, show=False, steps=7)
+        # the event loop then receives ('-JOB-', job) events
+'''
+import itertools
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+
+JOB_EVENT = '-JOB-'
+
+
+class job_cancelled(Exception):
+    ''' Raised inside a cancelled job at its next stage '''
+
+
+class job:
+    ''' One queued call, with its state (queued, running, done, failed or cancelled), the stage it is
+        in and its result or error. handled is for the event loop to mark finished jobs it has acted on,
+        since progress events can still arrive after the final one '''
+
+    def __init__(self, job_id, kind, name, function, args, kwargs, steps):
+        self.job_id = job_id
+        self.kind = kind
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.steps = steps
+        self.step = 0
+        self.stage = ''
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.handled = False
+        self.cancel_requested = threading.Event()
+
+    def cancel(self):
+        self.cancel_requested.set()
+
+    def finished(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def progress(self):
+        ''' Fraction done, from the stages passed out of the expected steps; 1 once finished '''
+        if self.finished():
+            return 1.0
+        if not self.steps:
+            return 0.0
+        return min(self.step / self.steps, 0.99)
+
+    def describe(self):
+        status = self.state if self.state != 'running' else '%s %3i%%' % (self.stage or 'running',
+                                                                             100 * self.progress())
+        return '#%i %-14s %-32s %s' % (self.job_id, self.kind, self.name, status)
+
+
+class job_queue:
+    ''' Runs jobs on worker threads and posts (event, job) through notify, e.g. a window's
+        write_event_value, whenever a job changes '''
+
+    def __init__(self, notify, workers=None, event=JOB_EVENT):
+        self.notify = notify
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.event = event
+        self.pool = None
+        self.jobs = []
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, kind, name, function, *args, steps=None, **kwargs):
+        ''' Queues function(*args, **kwargs). steps is the number of stages it is expected to pass
+            through, for the progress fraction '''
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        queued = job(next(self.job_ids), kind, name, function, args, kwargs, steps)
+        with self.lock:
+            self.jobs.append(queued)
+        self.post(queued)
+        self.pool.submit(self.run, queued)
+        return queued
+
+    def run(self, current):
+        if current.cancel_requested.is_set():
+            current.state = 'cancelled'
+            self.post(current)
+            return
+
+        current.state = 'running'
+        self.post(current)
+        instrument.watch(lambda stage_name: self.checkpoint(current, stage_name))
+        try:
+            current.result = current.function(*current.args, **current.kwargs)
+            current.state = 'done'
+        except job_cancelled:
+            current.state = 'cancelled'
+        except Exception as error:
+            current.error = error
+            current.traceback = traceback.format_exc()
+            current.state = 'failed'
+        finally:
+            instrument.watch(None)
+        self.post(current)
+
+    def checkpoint(self, current, stage_name):
+        if current.cancel_requested.is_set():
+            raise job_cancelled(current.name)
+        current.step += 1
+        current.stage = stage_name
+        self.post(current)
+
+    def post(self, current):
+        # a window closed in between misses the update; the job itself still holds its state
+        try:
+            self.notify(self.event, current)
+        except Exception:
+            pass
+
+    def cancel(self, job_ids=None):
+        ''' Cancels the given jobs, or every unfinished job '''
+        with self.lock:
+            targets = [queued for queued in self.jobs if job_ids is None or queued.job_id in job_ids]
+        for queued in targets:
+            if not queued.finished():
+                queued.cancel()
+
+    def clearFinished(self):
+        with self.lock:
+            self.jobs = [queued for queued in self.jobs if not queued.finished()]
+
+    def shutdown(self):
+        ''' Cancels whatever is left and waits for the running jobs to reach their next stage '''
+        self.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
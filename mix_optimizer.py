@@ -0,0 +1,120 @@
+import time
+import numpy as np
+
+from units import IMPERIAL
+
+# lb/yd^3, the same units the predictor takes
+default_bounds = {'Cement': (200, 900), 'Blast Furnace Slag': (0, 500), 'Fly Ash': (0, 400), 'Water': (200, 400),
+                  'Superplasticizer': (0, 50), 'Coarse Aggregate': (1300, 2000), 'Fine Aggregate': (1000, 1600)}
+
+# $/lb
+default_prices = {'Cement': 0.07, 'Blast Furnace Slag': 0.04, 'Fly Ash': 0.03, 'Water': 0.0,
+                  'Superplasticizer': 1.5, 'Coarse Aggregate': 0.01, 'Fine Aggregate': 0.01}
+
+
+def latinHypercube(n, lower, upper, rng):
+    ''' n samples with exactly one sample in each of n equal strata per ingredient '''
+    strata = (np.arange(n)[:, None] + rng.random((n, len(lower)))) / n
+    for column in range(len(lower)):
+        strata[:, column] = strata[rng.permutation(n), column]
+    return lower + strata * (upper - lower)
+
+
+def paretoFront(cost, cement):
+    ''' Indices of the mixes no other mix beats on both cost and cement, cheapest first '''
+    order = np.lexsort((cement, cost))
+    running_min = np.minimum.accumulate(cement[order])
+    keep = np.empty(len(order), dtype=bool)
+    keep[0] = True
+    keep[1:] = cement[order][1:] < running_min[:-1]
+    return order[keep]
+
+
+class mix_optimizer:
+    ''' Inverse mix design: searches for the cheapest / lowest-cement mixes that the Predictive
+        model expects to reach target_psi at the given age. Candidates are scored in large
+        vectorized batches; XGBoost's predict is multithreaded across rows, so each batch uses
+        every core. '''
+
+    def __init__(self, predictive, target_psi, age=28, bounds=None, prices=None, seed=0):
+        self.predictive = predictive
+        self.target_psi = target_psi
+        self.age = age
+        self.bounds = default_bounds if bounds is None else bounds
+        self.prices = default_prices if prices is None else prices
+        self.rng = np.random.default_rng(seed)
+
+        self.ingredients = [column for column in predictive.feature_columns if column != 'Age']
+        self.lower = np.array([self.bounds.get(name, (0, 0))[0] for name in self.ingredients], dtype=np.float64)
+        self.upper = np.array([self.bounds.get(name, (0, 0))[1] for name in self.ingredients], dtype=np.float64)
+        self.price_vector = np.array([self.prices.get(name, 0) for name in self.ingredients], dtype=np.float64)
+        self.cement_index = self.ingredients.index('Cement')
+        self.pareto_front = None
+        self.evaluated = 0
+        self.elapsed = 0
+
+    def evaluate(self, candidates):
+        ''' Returns (predicted strength, cost) for every candidate row with one predict call '''
+        mixes = np.empty((len(candidates), len(self.ingredients) + 1))
+        mixes[:, :-1] = candidates
+        mixes[:, -1] = self.age
+        # bounds, prices and target are lb/yd^3, $/lb and psi whatever units the predictor displays in
+        strength = self.predictive.predict_many(mixes, report=False, units=IMPERIAL)
+        return strength, candidates @ self.price_vector
+
+    def penalizedCost(self, strength, cost):
+        # infeasible mixes rank behind every feasible one, and closer to the target ranks first
+        shortfall = np.maximum(self.target_psi - strength, 0)
+        return cost + np.where(shortfall > 0, 1e6 + shortfall, 0)
+
+    def optimize(self, population=20000, generations=8, elite_fraction=0.1, mutation=0.1):
+        ''' Latin-hypercube start followed by an elitist evolutionary search. Returns the Pareto front
+            of (cost, cement) over every feasible mix evaluated, as a DataFrame sorted by cost '''
+        start = time.perf_counter()
+        candidates = latinHypercube(population, self.lower, self.upper, self.rng)
+        strength, cost = self.evaluate(candidates)
+        seen = [(candidates, strength, cost)]
+
+        n_elite = max(int(population * elite_fraction), 1)
+        span = self.upper - self.lower
+        for generation in range(generations):
+            best = np.argsort(self.penalizedCost(strength, cost))[:n_elite]
+            elite = candidates[best]
+
+            # children mutate a random elite parent, with steps shrinking each generation; a share of
+            # fresh Latin-hypercube samples keeps the search from collapsing onto one region
+            n_fresh = population // 5
+            parents = elite[self.rng.integers(0, n_elite, population - n_elite - n_fresh)]
+            scale = mutation * span * (1 - generation / (generations + 1))
+            children = np.clip(parents + self.rng.normal(size=parents.shape) * scale, self.lower, self.upper)
+            fresh = latinHypercube(n_fresh, self.lower, self.upper, self.rng)
+
+            new = np.vstack((children, fresh))
+            new_strength, new_cost = self.evaluate(new)
+            seen.append((new, new_strength, new_cost))
+
+            candidates = np.vstack((elite, new))
+            strength = np.concatenate((strength[best], new_strength))
+            cost = np.concatenate((cost[best], new_cost))
+
+        all_mixes = np.vstack([batch[0] for batch in seen])
+        all_strength = np.concatenate([batch[1] for batch in seen])
+        all_cost = np.concatenate([batch[2] for batch in seen])
+
+        feasible = all_strength >= self.target_psi
+        self.evaluated = len(all_mixes)
+        self.elapsed = time.perf_counter() - start
+
+        import pandas as pd  # only for the result table; the GUI imports this module for its defaults
+
+        front_df = pd.DataFrame(all_mixes[feasible], columns=self.ingredients)
+        front_df['Age'] = self.age
+        front_df['Predicted Strength (psi)'] = all_strength[feasible]
+        front_df['Cost ($/yd^3)'] = all_cost[feasible]
+        if feasible.any():
+            front_df = front_df.iloc[paretoFront(all_cost[feasible],
+                                                 all_mixes[feasible][:, self.cement_index])].reset_index(drop=True)
+
+        self.pareto_front = front_df
+        print("Evaluated %i mixes in %f s, %i on the Pareto front" % (self.evaluated, self.elapsed, len(front_df)))
+        return front_df
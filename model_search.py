@@ -0,0 +1,146 @@
+''' K-fold cross-validation and hyperparameter search for the strength model. Every configuration
+    in the grid is scored by k-fold CV with configurations spread over worker processes; each fold
+    fits its scaler on the training part only and stops boosting early on a validation split carved
+    out of it, so the held-out fold is never seen until it is scored. The configuration with the
+    lowest mean held-out RMSE (psi) wins, ties going to the earlier grid entry, and its parameters
+    (with the number of rounds early stopping settled on) become the model_params Predictive trains with.
+
+        python model_search.py --folds 5 --workers 8
+'''
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# kept out of .model_cache, which only holds trained artifacts and may be wiped to force a retrain
+PARAMS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best_params.json')
+
+default_grid = {'learning_rate': [0.03, 0.1],
+                'max_depth': [4, 6, 8],
+                'min_child_weight': [1, 3],
+                'subsample': [0.8, 1.0],
+                'colsample_bylevel': [0.5, 1.0]}
+
+
+def gridConfigs(grid):
+    ''' Every combination of the grid as a list of param dicts, in a fixed order '''
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def crossValidate(X, y, params, folds=5, seed=0, max_rounds=2000, early_stopping_rounds=50, validation_size=0.15):
+    ''' Mean and spread of the held-out RMSE of one configuration over k folds, with the boosting
+        rounds early stopping kept in each fold and the wall time '''
+    # concrete_analysis imports this module for loadParams, so the model stack is only loaded for a search
+    from sklearn.model_selection import KFold, train_test_split
+    from sklearn.preprocessing import StandardScaler
+    from xgboost import XGBRegressor
+
+    start = time.perf_counter()
+    rmse, rounds = [], []
+    for train_index, test_index in KFold(folds, shuffle=True, random_state=seed).split(X):
+        X_fit, X_stop, y_fit, y_stop = train_test_split(X[train_index], y[train_index], test_size=validation_size,
+                                                        random_state=seed)
+        scaler = StandardScaler().fit(X_fit)
+        model = XGBRegressor(n_estimators=max_rounds, early_stopping_rounds=early_stopping_rounds,
+                             eval_metric='rmse', random_state=seed, n_jobs=1, **params)
+        model.fit(scaler.transform(X_fit), y_fit, eval_set=[(scaler.transform(X_stop), y_stop)], verbose=False)
+
+        predicted = model.predict(scaler.transform(X[test_index]), iteration_range=(0, model.best_iteration + 1))
+        rmse.append(float(np.sqrt(np.mean((predicted - y[test_index]) ** 2))))
+        rounds.append(model.best_iteration + 1)
+
+    return dict(params, rmse_psi=float(np.mean(rmse)), rmse_std_psi=float(np.std(rmse)),
+                rounds=int(round(np.mean(rounds))), seconds=time.perf_counter() - start)
+
+
+def searchModel(X, y, grid=None, folds=5, workers=None, seed=0, max_rounds=2000, early_stopping_rounds=50):
+    ''' Cross-validates every grid configuration in parallel and returns the results as a DataFrame,
+        best first. The ranking depends only on the scores and grid order, not on which worker
+        finished first '''
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    configs = gridConfigs(grid or default_grid)
+    options = (folds, seed, max_rounds, early_stopping_rounds)
+
+    if workers == 1 or len(configs) <= 1:
+        results = [crossValidate(X, y, config, *options) for config in configs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(crossValidate, [X] * len(configs), [y] * len(configs), configs,
+                                    *[[option] * len(configs) for option in options]))
+
+    table = pd.DataFrame(results)
+    table['grid_index'] = range(len(table))
+    return table.sort_values(['rmse_psi', 'grid_index'], kind='mergesort').reset_index(drop=True)
+
+
+def bestParams(table):
+    ''' XGBRegressor params of the top row: its grid values plus the early-stopped round count '''
+    # column by column, so integer params such as max_depth keep their dtype
+    params = {name: table[name].iloc[0] for name in table.columns
+              if name not in ('rmse_psi', 'rmse_std_psi', 'rounds', 'seconds', 'grid_index')}
+    params = {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+    params['n_estimators'] = int(table['rounds'].iloc[0])
+    return params
+
+
+def saveParams(params, table=None, file_name=PARAMS_FILE):
+    record = {'params': params, 'created': time.time()}
+    if table is not None:
+        record['rmse_psi'] = float(table.iloc[0]['rmse_psi'])
+        record['rmse_std_psi'] = float(table.iloc[0]['rmse_std_psi'])
+    with open(file_name, 'w') as f:
+        json.dump(record, f, indent=1)
+
+
+def loadParams(default, file_name=PARAMS_FILE):
+    ''' The params saved by the last search, or default when no search has been run '''
+    try:
+        with open(file_name) as f:
+            return json.load(f)['params']
+    except (OSError, ValueError, KeyError):
+        return dict(default)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-rounds', type=int, default=2000)
+    parser.add_argument('--early-stopping', type=int, default=50, help='rounds without improvement before stopping')
+    parser.add_argument('--output', default=None, help='write every configuration\'s scores to this CSV')
+    parser.add_argument('--no-save', action='store_true', help='do not make the winner the model Predictive uses')
+    args = parser.parse_args(argv)
+
+    from concrete_analysis import trainingData
+
+    df_train, X, y = trainingData()  # in the units the model is trained in, without loading or training a model
+    y = y.values
+
+    start = time.perf_counter()
+    table = searchModel(X, y, folds=args.folds, workers=args.workers, seed=args.seed, max_rounds=args.max_rounds,
+                        early_stopping_rounds=args.early_stopping)
+    elapsed = time.perf_counter() - start
+
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(table.drop(columns='grid_index').to_string(index=False, float_format='%.4g'))
+    params = bestParams(table)
+    print('Searched %i configurations x %i folds in %f s. Best held-out RMSE %.1f +/- %.1f psi with %s' % (
+        len(table), args.folds, elapsed, table.iloc[0]['rmse_psi'], table.iloc[0]['rmse_std_psi'], params))
+
+    if args.output:
+        table.to_csv(args.output, index=False)
+    if not args.no_save:
+        saveParams(params, table)
+        print('Saved to %s; Predictive trains with these params from its next start' % PARAMS_FILE)
+
+
+if __name__ == '__main__':
+    main()
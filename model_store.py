@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import pandas as pd
+
+STORE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache')
+
+
+class model_store:
+    ''' Content-addressed cache of trained strength models. Each artifact holds the XGBoost booster
+        and the fitted StandardScaler and is keyed by a hash of the training data plus the
+        hyperparameters, so a model is only trained once per unique (data, params) pair. '''
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_artifacts=8, max_age_days=None):
+        self.cache_dir = cache_dir
+        self.max_artifacts = max_artifacts
+        self.max_age_days = max_age_days
+        self.pinned = None  # callable returning keys evict must keep, set by model_updater to the current model
+        self.memory = {}  # key -> (model, scaler), skips the disk for repeat predictions in one session
+        self.key_locks = {}  # key -> lock held while that artifact is loaded or trained
+        self.lock = threading.Lock()
+
+    def artifactKey(self, df_train, params):
+        ''' Hashes the training table (values, columns and dtypes) together with the hyperparameters '''
+        digest = hashlib.sha256()
+        digest.update(('v%d' % STORE_VERSION).encode())
+        digest.update(json.dumps(list(map(str, df_train.columns))).encode())
+        digest.update(json.dumps(list(map(str, df_train.dtypes))).encode())
+        digest.update(pd.util.hash_pandas_object(df_train, index=True).values.tobytes())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:32]
+
+    def artifactPath(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        ''' Returns (model, scaler) for key, or None if it has not been trained yet '''
+        if key in self.memory:
+            return self.memory[key]
+
+        path = self.artifactPath(key)
+        if not os.path.isfile(os.path.join(path, 'meta.json')):
+            return None
+
+        from xgboost import XGBRegressor  # slow to import, so only once a model is actually loaded
+
+        try:
+            model = XGBRegressor()
+            model.load_model(os.path.join(path, 'booster.ubj'))
+            with open(os.path.join(path, 'scaler.pkl'), 'rb') as f:
+                scaler = pickle.load(f)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            # a half-written or corrupt artifact is treated as a miss and retrained
+            self.invalidate(key)
+            return None
+
+        os.utime(os.path.join(path, 'meta.json'))  # marks the artifact as recently used for eviction
+        self.memory[key] = (model, scaler)
+        return model, scaler
+
+    def save(self, key, model, scaler, params=None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.artifactPath(key)
+        tmp_path = path + '.tmp%d-%d' % (os.getpid(), threading.get_ident())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        model.save_model(os.path.join(tmp_path, 'booster.ubj'))
+        with open(os.path.join(tmp_path, 'scaler.pkl'), 'wb') as f:
+            pickle.dump(scaler, f)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'key': key, 'params': params, 'created': time.time(), 'version': STORE_VERSION},
+                      f, default=str)
+
+        # the artifact only becomes visible once it is complete
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # another process saved the same artifact first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.memory[key] = (model, scaler)
+        self.evict()
+
+    def keyLock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def getOrTrain(self, df_train, params, train_function):
+        ''' Loads the cached artifact for this training data and params, calling
+            train_function() -> (model, scaler) and storing the result on a miss. Threads asking for
+            the same key wait for the first one, so a model is trained once however many GUI jobs
+            need it at the same time '''
+        key = self.artifactKey(df_train, params)
+        with self.keyLock(key):
+            cached = self.load(key)
+            if cached is not None:
+                return cached
+
+            model, scaler = train_function()
+            self.save(key, model, scaler, params)
+        return model, scaler
+
+    def artifacts(self):
+        ''' Lists (key, last_used) for every complete artifact, most recently used first '''
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        found = []
+        for key in os.listdir(self.cache_dir):
+            meta = os.path.join(self.cache_dir, key, 'meta.json')
+            if '.tmp' not in key and os.path.isfile(meta):
+                found.append((key, os.path.getmtime(meta)))
+        return sorted(found, key=lambda item: item[1], reverse=True)
+
+    def invalidate(self, key=None):
+        ''' Removes one artifact, or every artifact (and any half-written one) when key is None. Only the
+            artifact folders go: other files in the cache folder, such as the compiled_model export of
+            the served model, are left to their owners '''
+        if key is None:
+            self.memory.clear()
+            if os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if os.path.isdir(os.path.join(self.cache_dir, name)):
+                        shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            return
+
+        self.memory.pop(key, None)
+        shutil.rmtree(self.artifactPath(key), ignore_errors=True)
+
+    def evict(self):
+        ''' Drops artifacts beyond max_artifacts (least recently used first) and any older than
+            max_age_days, never a pinned one '''
+        now = time.time()
+        pinned = set(self.pinned()) if self.pinned is not None else set()
+        for i, (key, last_used) in enumerate(item for item in self.artifacts() if item[0] not in pinned):
+            too_many = self.max_artifacts is not None and i >= self.max_artifacts
+            too_old = self.max_age_days is not None and now - last_used > self.max_age_days * 86400
+            if too_many or too_old:
+                self.invalidate(key)
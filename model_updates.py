@@ -0,0 +1,271 @@
+''' Incremental updates of the strength model from newly tested specimens. Each lab result (a mix in
+    lb/yd^3 with its measured strength in psi) is appended to lab_results.csv, and the current model
+    keeps boosting for a few rounds on the lab rows instead of being retrained. Every fifth result is
+    held out and never trained on, and so is every tenth row of concrete_data.csv: neither the base model
+    nor any update or retrain trains on those. An update is kept only if the RMSE on the held-out results
+    does not get worse and the RMSE on the held-out base rows stays within base_tolerance (25%) of the
+    base model's, so one bad result cannot pull the model away from the data it was trained on, even
+    before any lab result has been held out, and kept updates cannot drift away from it a little at a time.
+    After every retrain_every new results, a full retrain on concrete_data.csv plus the lab results runs
+    on a background thread and replaces the boosted model once it passes the same check.
+
+        python model_updates.py new_results.csv
+'''
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+LAB_RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lab_results.csv')
+# which artifact is the current model; kept out of .model_cache, which only holds artifacts and may be wiped
+CURRENT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'current_model.json')
+
+
+class model_updater:
+    ''' Keeps the model Predictive loads up to date with the lab results. The model in use is a model
+        store artifact named in current_model.json, tied to the base training data and params it grew from,
+        so a new model_search result or a changed concrete_data.csv starts over from the base model '''
+
+    def __init__(self, store, lab_file=LAB_RESULTS_FILE, current_file=CURRENT_FILE, holdout_every=5,
+                 update_rounds=10, retrain_every=25, tolerance=0.0, base_check_every=10, base_tolerance=0.25):
+        self.store = store
+        self.lab_file = lab_file
+        self.current_file = current_file
+        self.holdout_every = holdout_every
+        self.update_rounds = update_rounds
+        self.retrain_every = retrain_every
+        self.tolerance = tolerance  # allowed held-out RMSE growth of an update, as a fraction
+        self.base_check_every = base_check_every
+        # the same on the base check rows, against the base model: lab mixes may well differ from the base
+        # data, so this only catches updates that wreck the fit to it, such as one boosted on a typo
+        self.base_tolerance = base_tolerance
+        self.lock = threading.RLock()
+        # eviction must not drop the model current_model.json names, or every kept update would be lost
+        store.pinned = self.pinnedKeys
+        self.retrain_thread = None
+        self.last_report = None
+
+    def labResults(self):
+        if not os.path.isfile(self.lab_file):
+            return None
+        return pd.read_csv(self.lab_file)
+
+    def split(self, lab):
+        ''' (training rows, held-out rows) of the lab results. The split is by position in the file,
+            which is only ever appended to, so a result never moves between the two '''
+        held_out = (np.arange(len(lab)) + 1) % self.holdout_every == 0
+        return lab[~held_out], lab[held_out]
+
+    def state(self):
+        try:
+            with open(self.current_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def setState(self, state):
+        os.makedirs(os.path.dirname(self.current_file), exist_ok=True)
+        tmp_file = self.current_file + '.tmp%d-%d' % (os.getpid(), threading.get_ident())
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp_file, self.current_file)
+
+    def pinnedKeys(self):
+        ''' The current model and the base model it grew from '''
+        state = self.state()
+        return () if state is None else (state['key'], state['base_key'])
+
+    def currentKey(self, base_key):
+        ''' Model store key of the model updated from the lab results, or None to use the base model '''
+        state = self.state()
+        if state is None or state['base_key'] != base_key:
+            return None
+        return state['key']
+
+    def holdoutRmse(self, model, scaler, held_out, columns):
+        if held_out is None or len(held_out) == 0:
+            return None
+        predicted = model.predict(scaler.transform(held_out[columns].to_numpy(dtype=np.float64)))
+        return float(np.sqrt(np.mean((predicted - held_out['Strength'].to_numpy()) ** 2)))
+
+    def baseSplit(self, df_train):
+        ''' (rows the base model and full retrains train on, rows every update is checked against) of
+            the base training data '''
+        check = np.arange(len(df_train)) % self.base_check_every == 0
+        return df_train[~check], df_train[check]
+
+    def baseKey(self, df_train, params):
+        return self.store.artifactKey(self.baseSplit(df_train)[0], params)
+
+    def baseModel(self, predictive, params):
+        ''' (model, scaler) trained on the base rows alone, from the store when it has been trained before '''
+        rows = self.baseSplit(predictive.df_train)[0]
+        return self.store.getOrTrain(rows, params, lambda: predictive.train(
+            rows[list(predictive.feature_columns)].to_numpy(dtype=np.float64), rows['Strength']))
+
+    def baseState(self, base_key, model, scaler, base_check, columns):
+        ''' State of the base model, which holds its RMSE on the base check rows: every later update is
+            compared with that, not with the model it replaces '''
+        return {'base_key': base_key, 'key': base_key, 'kind': 'base', 'rows': 0, 'retrained_rows': 0,
+                'base_rmse': self.holdoutRmse(model, scaler, base_check, columns)}
+
+    def better(self, rmse_after, rmse_before, tolerance):
+        return rmse_before is None or rmse_after <= rmse_before * (1 + tolerance)
+
+    def passes(self, report):
+        ''' Whether an update may replace the model: the lab held-out RMSE did not get worse than the
+            current model's, and the base check RMSE not more than base_tolerance worse than the base model's '''
+        return (self.better(report['rmse_after'], report['rmse_before'], self.tolerance) and
+                self.better(report['base_rmse_after'], report['base_rmse_before'], self.base_tolerance))
+
+    def boost(self, model, scaler, rows, columns, params):
+        ''' A copy of model with update_rounds more trees fitted to rows. The scaler stays as it is, so
+            the earlier trees still see the inputs they were trained on '''
+        import xgboost
+
+        # xgboost.train continues from the model's predictions; XGBRegressor.fit(xgb_model=...) fits the
+        # new trees as if the model predicted its base score everywhere, which shifts every prediction
+        booster_params = {name: value for name, value in params.items() if name != 'n_estimators'}
+        booster = xgboost.train(booster_params, xgboost.DMatrix(scaler.transform(rows[columns].to_numpy(
+            dtype=np.float64)), label=rows['Strength'].to_numpy()), self.update_rounds,
+            xgb_model=model.get_booster().copy())
+        updated = xgboost.XGBRegressor(**params)
+        updated.load_model(bytearray(booster.save_raw()))
+        return updated
+
+    def addResults(self, results, predictive, params, retrain=True):
+        ''' Appends results (feature columns plus Strength, in psi) to the lab results and boosts the
+            current model on the new training rows. Returns a report with the held-out RMSE before and
+            after, the base check RMSE of the base model and of the update, and whether the update was kept '''
+        columns = list(predictive.feature_columns)
+        results = results[columns + ['Strength']].copy()
+        results['Added'] = time.time()
+
+        with self.lock:
+            lab = self.labResults()
+            first = 0 if lab is None else len(lab)
+            results.to_csv(self.lab_file, mode='a', header=lab is None, index=False)
+            lab = pd.concat([lab, results], ignore_index=True) if lab is not None else results.reset_index(drop=True)
+
+            base_key = self.baseKey(predictive.df_train, params)
+            base_check = self.baseSplit(predictive.df_train)[1]
+            model, scaler = predictive.model, predictive.scaler
+            state = self.state()
+            if state is None or state['base_key'] != base_key:
+                state = self.baseState(base_key, model, scaler, base_check, columns)  # Predictive loaded the base model
+            training, held_out = self.split(lab)
+
+            # boosting on every lab row, not just the new ones, keeps a few results from pulling the
+            # model around and retries rows an earlier, rejected update could not use
+            report = {'added': len(results), 'trained_on': len(training), 'held_out': len(held_out),
+                      'rmse_before': self.holdoutRmse(model, scaler, held_out, columns), 'rmse_after': None,
+                      'base_rmse_before': state['base_rmse'],
+                      'base_rmse_after': None, 'kept': False, 'seconds': 0.0}
+            start = time.perf_counter()
+            if len(training):
+                updated = self.boost(model, scaler, training, columns, params)
+                report['rmse_after'] = self.holdoutRmse(updated, scaler, held_out, columns)
+                report['base_rmse_after'] = self.holdoutRmse(updated, scaler, base_check, columns)
+                report['kept'] = self.passes(report)
+                if report['kept']:
+                    key = self.store.artifactKey(training, dict(params, boosted_from=state['key']))
+                    self.store.save(key, updated, scaler, dict(params, boosted_from=state['key']))
+                    state = dict(state, key=key, kind='boosted', rmse_psi=report['rmse_after'])
+                    predictive.model, predictive.model_key = updated, key
+            report['seconds'] = time.perf_counter() - start
+            self.setState(dict(state, rows=first + len(results), updated=time.time()))
+            self.last_report = report
+
+        if retrain and first + len(results) - state['retrained_rows'] >= self.retrain_every:
+            self.retrain(predictive, params)
+        return report
+
+    def retrain(self, predictive, params, wait=False):
+        ''' Retrains from scratch on the base data plus every lab training row, on a background thread
+            unless wait=True. Returns the thread, or None when a retrain is already running '''
+        with self.lock:
+            if self.retrain_thread is not None and self.retrain_thread.is_alive():
+                return None
+            self.retrain_thread = threading.Thread(target=self.fullRetrain, args=(predictive, params),
+                                                   name='model retrain', daemon=True)
+            self.retrain_thread.start()
+        if wait:
+            self.wait()
+        return self.retrain_thread
+
+    def wait(self):
+        if self.retrain_thread is not None:
+            self.retrain_thread.join()
+
+    def fullRetrain(self, predictive, params):
+        columns = list(predictive.feature_columns)
+        with self.lock:
+            lab = self.labResults()
+        if lab is None:
+            return
+        training = self.split(lab)[0]
+        base_rows, base_check = self.baseSplit(predictive.df_train)
+        table = pd.concat([base_rows[columns + ['Strength']], training[columns + ['Strength']]], ignore_index=True)
+        X, y = table[columns].to_numpy(dtype=np.float64), table['Strength']
+
+        start = time.perf_counter()
+        model, scaler = self.store.getOrTrain(table, params, lambda: predictive.train(X, y))
+        seconds = time.perf_counter() - start
+
+        with self.lock:
+            base_key = self.baseKey(predictive.df_train, params)
+            state = self.state()
+            if state is None or state['base_key'] != base_key:
+                state = dict(self.baseState(base_key, *self.baseModel(predictive, params), base_check, columns),
+                             rows=len(lab))
+
+            # results added while the retrain ran are boosted onto the retrained model
+            latest, held_out = self.split(self.labResults())
+            if len(latest) > len(training):
+                model = self.boost(model, scaler, latest, columns, params)
+
+            current = self.store.load(state['key'])
+            check = {'rmse_before': None, 'rmse_after': self.holdoutRmse(model, scaler, held_out, columns),
+                     'base_rmse_before': state['base_rmse'],
+                     'base_rmse_after': self.holdoutRmse(model, scaler, base_check, columns)}
+            if current:
+                check['rmse_before'] = self.holdoutRmse(*current, held_out, columns)
+            rmse_before, rmse_after = check['rmse_before'], check['rmse_after']
+
+            kept = self.passes(check)
+            if kept:
+                key = self.store.artifactKey(latest, dict(params, retrained=len(lab)))
+                self.store.save(key, model, scaler, dict(params, retrained=len(lab)))
+                self.setState(dict(state, key=key, kind='retrained', rows=max(state['rows'], len(latest) + len(held_out)),
+                                   retrained_rows=len(lab), rmse_psi=rmse_after, updated=time.time()))
+            else:
+                self.setState(dict(state, retrained_rows=len(lab)))
+            print('Retrained on %i mixes in %f s. Held-out RMSE %s -> %s psi, base data %s -> %s psi, %s' % (
+                len(table), seconds, rmse_before, rmse_after, check['base_rmse_before'], check['base_rmse_after'],
+                'kept' if kept else 'discarded'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('results', nargs='?', default=None,
+                        help='CSV of tested mixes: the feature columns in lb/yd^3 plus Strength in psi')
+    parser.add_argument('--retrain', action='store_true', help='retrain from scratch now and wait for it')
+    args = parser.parse_args(argv)
+
+    from concrete_analysis import Predictive, model_params
+
+    predictive = Predictive()
+    if args.results is not None:
+        report = predictive.addResults(pd.read_csv(args.results), retrain=not args.retrain)
+        print(report)
+    if args.retrain:
+        predictive.updates.retrain(predictive, model_params, wait=True)
+    predictive.updates.wait()
+
+
+if __name__ == '__main__':
+    main()
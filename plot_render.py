@@ -0,0 +1,219 @@
+''' Rendering stage for specimen plots. The analyzers describe a plot as a plot_spec whose series are
+    already downsampled with Largest-Triangle-Three-Buckets (a few thousand points keep the shape of a
+    50k-sample curve, peaks included). Specs are small and picklable, so they can be rendered later,
+    on a background thread, or in bulk: plot_renderer draws them with the Agg backend on Figure
+    objects that never enter pyplot's figure registry and are released as soon as they are written,
+    so exporting hundreds of specimens to PNG or one multi-page PDF does not grow memory. '''
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from instrument import stage
+
+# matplotlib is imported where the first figure is drawn: at over half a second it is the slowest import
+# on the analysis path, and runs with show=False, save_plot=False never need it
+
+MAX_POINTS = 2000  # per series after decimation
+DEFAULT_DPI = 500
+LIVE_FIGURE = 'Specimen plot'  # the pyplot window non-blocking shows draw into
+
+
+def lttb(x, y, threshold):
+    ''' Indices of the threshold points Largest-Triangle-Three-Buckets keeps: the first and last
+        points, plus from each bucket in between the point forming the largest triangle with the
+        previously kept point and the mean of the next bucket '''
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    counts = np.diff(edges)
+    # without the last point, so the last bucket's sum stops at its edge like the others
+    mean_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / counts, x[n - 1])
+    mean_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / counts, y[n - 1])
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # twice the triangle area with the last kept point and the next bucket's mean, for the whole bucket
+        px, py = x[previous], y[previous]
+        area = np.abs((px - mean_x[i + 1]) * (y[start:end] - py) - (px - x[start:end]) * (mean_y[i + 1] - py))
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+
+def decimate(x, y, max_points=MAX_POINTS):
+    ''' (x, y) reduced to at most max_points with lttb, skipping NaN samples (e.g. the start of a
+        rolling mean). Returns float64 copies, so the spec does not pin the source buffers '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.all():
+        x, y = x[finite], y[finite]
+    kept = lttb(x, y, max_points)
+    return x[kept], y[kept]
+
+
+class plot_spec:
+    ''' Everything needed to draw one specimen plot, with the series already decimated. y values are
+        added in the analyzers' units (psi) and multiplied by yscale when drawn, so a plot in other
+        output units only scales the decimated points '''
+
+    def __init__(self, name, title, xlabel='Strain (in/in)', ylabel='Stress (psi)', ylim=None, legend_loc='best',
+                 max_points=MAX_POINTS, yscale=1.0):
+        self.name = name
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.ylim = ylim
+        self.legend_loc = legend_loc
+        self.max_points = max_points
+        self.yscale = yscale
+        self.series = []
+        self.spans = []
+        self.hlines = []
+        self.bands = []
+
+    def addSeries(self, x, y, label):
+        self.series.append(decimate(x, y, self.max_points) + (label,))
+
+    def addLine(self, slope, intercept, x, label):
+        ''' A straight line over the range of x; two points draw it exactly '''
+        ends = np.array([np.nanmin(x), np.nanmax(x)]) if len(x) else np.zeros(2)
+        self.series.append((ends, intercept + slope * ends, label))
+
+    def addSpan(self, start, end, label):
+        self.spans.append((start, end, label))
+
+    def addHline(self, y, x_min, x_max, label):
+        self.hlines.append((y, x_min, x_max, label))
+
+    def addBand(self, x, low, high, label):
+        ''' A shaded region between two curves sampled on the same x (already coarse, so not decimated),
+            e.g. the min-max envelope of a replicate set '''
+        finite = np.isfinite(low) & np.isfinite(high)
+        self.bands.append(tuple(np.asarray(values, dtype=np.float64)[finite] for values in (x, low, high)) + (label,))
+
+    def draw(self, axes):
+        scale = self.yscale
+        for x, y, label in self.series:
+            axes.plot(x, y * scale, label=label)
+        for x, low, high, label in self.bands:
+            axes.fill_between(x, low * scale, high * scale, alpha=0.2, label=label)
+        for start, end, label in self.spans:
+            axes.axvspan(start, end, color='grey', alpha=0.2, label=label)
+        for y, x_min, x_max, label in self.hlines:
+            axes.hlines(y=y * scale, xmin=x_min, xmax=x_max, label=label)
+        axes.set_title(self.title)
+        axes.set_xlabel(self.xlabel)
+        axes.set_ylabel(self.ylabel)
+        if self.ylim is not None:
+            axes.set_ylim(*(limit * scale for limit in self.ylim))
+        axes.legend(fontsize=10, loc=self.legend_loc)
+
+    def show(self, block=True):
+        ''' Draws the spec in an interactive pyplot window and closes the figure once it is dismissed.
+            With block=False the window stays open alongside the caller's own event loop, and every
+            non-blocking show redraws the same window, so repeated calls do not pile up figures '''
+        import matplotlib.pyplot as plt
+
+        figure = plt.figure() if block else plt.figure(LIVE_FIGURE, clear=True)
+        self.draw(figure.gca())
+        plt.show(block=block)
+        if block:
+            plt.close(figure)
+
+
+def renderFigure(spec):
+    ''' An Agg figure of the spec, outside pyplot, so nothing keeps it alive after the caller drops it '''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    spec.draw(figure.add_subplot())
+    return figure
+
+
+def plotFileName(spec, folder=''):
+    return os.path.join(folder or '', '%s plot.png' % spec.name)
+
+
+def savePng(spec, file_name, dpi=DEFAULT_DPI):
+    with stage('render', file=file_name):
+        figure = renderFigure(spec)
+        try:
+            figure.savefig(file_name, dpi=dpi)
+        finally:
+            figure.clear()
+    return file_name
+
+
+class plot_renderer:
+    ''' Renders specs on background threads. Each submit() returns a future for the written file, so
+        the analysis can continue while the PNG is encoded; wait() blocks until all are written '''
+
+    def __init__(self, workers=1, dpi=DEFAULT_DPI):
+        self.workers = workers
+        self.dpi = dpi
+        self.pool = None
+        self.pending = []
+
+    def submit(self, spec, file_name):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='plot_render')
+        self.pending = [job for job in self.pending if not job.done()]
+        job = self.pool.submit(savePng, spec, file_name, self.dpi)
+        self.pending.append(job)
+        return job
+
+    def wait(self):
+        ''' Blocks until every submitted plot is written, re-raising the first rendering error '''
+        pending, self.pending = self.pending, []
+        for job in pending:
+            job.result()
+
+    def exportPng(self, specs, folder):
+        ''' One PNG per spec in folder, rendered on the worker threads '''
+        os.makedirs(folder, exist_ok=True)
+        jobs = [self.submit(spec, plotFileName(spec, folder)) for spec in specs]
+        return [job.result() for job in jobs]
+
+    def exportPdf(self, specs, file_name):
+        ''' All specs as the pages of one PDF. Pages are drawn and written one at a time, so only one
+            figure exists at any moment '''
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        with PdfPages(file_name) as pdf:
+            for spec in specs:
+                figure = renderFigure(spec)
+                pdf.savefig(figure)
+                figure.clear()
+        return file_name
+
+    def close(self):
+        self.wait()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+default_renderer = plot_renderer()
+
+
+def finishPlot(spec, show, save_plot, renderer=None):
+    ''' Queues the PNG on the background renderer (save_plot may be a folder to save into instead of
+        the working directory) and shows the plot in a window when show is set. Returns the render
+        job, or None when nothing is saved '''
+    job = None
+    if save_plot:
+        plot_dir = save_plot if isinstance(save_plot, str) else ''
+        job = (renderer or default_renderer).submit(spec, plotFileName(spec, plot_dir))
+    if show:
+        spec.show()
+    return job
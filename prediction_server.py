@@ -0,0 +1,288 @@
+''' Local prediction server. One process keeps the strength model loaded and answers predictions over
+    HTTP on localhost, so the GUI, spreadsheets and scripts stop paying the load (or train) cost each.
+    Concurrent requests are coalesced: the batcher thread takes the first waiting request, collects
+    whatever else arrives within max_wait_ms (up to max_batch mixes) and scores them with one predict
+    call. Latency, batch size and throughput are served at /metrics.
+
+        python prediction_server.py --port 8765
+
+        POST /predict  {"mix": [540, 0, 0, 162, 2.5, 1040, 676, 28]}     -> {"strength_psi": 6632.0}
+        POST /predict  {"mixes": [[...], ...]} or {"mixes": [{"Cement": 540, ...}, ...]}
+                                                                       -> {"strength_psi": [...]}
+        GET  /metrics  request and mix counts, latency percentiles, batch sizes, mixes/s
+        GET  /health   {"status": "ok", "model": <model store key>}
+        POST /reload   picks up a model updated from lab results since the server started
+'''
+import argparse
+import collections
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+DEFAULT_PORT = 8765
+
+
+class micro_batcher:
+    ''' Coalesces single predictions from many threads into batched predict calls on one thread '''
+
+    def __init__(self, predict, max_batch=256, max_wait_ms=2.0):
+        self.predict = predict  # (n, features) float64 matrix -> n strengths
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.incoming = 0
+        self.lock = threading.Lock()
+        self.batch_sizes = collections.deque(maxlen=10000)
+        self.running = True
+        self.thread = threading.Thread(target=self.loop, name='micro_batcher', daemon=True)
+        self.thread.start()
+
+    def arriving(self, change=1):
+        ''' Counts requests being received; the batcher only waits for others while some are '''
+        with self.lock:
+            self.incoming += change
+
+    def submit(self, mixes):
+        ''' Future for the strengths of a (n, features) matrix of mixes '''
+        future = Future()
+        self.pending.put((mixes, future))
+        return future
+
+    def loop(self):
+        while self.running:
+            try:
+                batch = [self.pending.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            rows = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while rows < self.max_batch:
+                try:
+                    item = self.pending.get_nowait()
+                except queue.Empty:
+                    # a lone request goes straight through; otherwise wait a little for the others
+                    remaining = deadline - time.perf_counter()
+                    if self.incoming <= 0 or remaining <= 0:
+                        break
+                    try:
+                        item = self.pending.get(timeout=min(remaining, 0.0002))
+                    except queue.Empty:
+                        continue
+                batch.append(item)
+                rows += len(item[0])
+            self.run(batch)
+
+    def run(self, batch):
+        try:
+            strengths = self.predict(np.concatenate([mixes for mixes, future in batch]))
+        except Exception as error:
+            for mixes, future in batch:
+                future.set_exception(error)
+            return
+        self.batch_sizes.append(len(strengths))
+        start = 0
+        for mixes, future in batch:
+            future.set_result(strengths[start:start + len(mixes)])
+            start += len(mixes)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+
+class server_metrics:
+    ''' Request latencies (the most recent 10000) and counters since the server started '''
+
+    def __init__(self):
+        self.started = time.time()
+        self.latencies = collections.deque(maxlen=10000)
+        self.finished = collections.deque(maxlen=10000)  # completion times, for the recent rate
+        self.requests = 0
+        self.mixes = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, mixes, error=False):
+        with self.lock:
+            self.requests += 1
+            self.mixes += mixes
+            self.errors += error
+            if not error:
+                self.latencies.append(seconds)
+                self.finished.append((time.time(), mixes))
+
+    def report(self, batch_sizes):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            now = time.time()
+            recent = sum(mixes for finished, mixes in self.finished if now - finished <= 10)
+            report = {'uptime_s': now - self.started, 'requests': self.requests, 'mixes': self.mixes,
+                      'errors': self.errors, 'mixes_per_s_last_10s': recent / min(10, now - self.started)}
+        if len(latencies):
+            report.update({'latency_ms_p50': float(np.percentile(latencies, 50)),
+                           'latency_ms_p90': float(np.percentile(latencies, 90)),
+                           'latency_ms_p99': float(np.percentile(latencies, 99)),
+                           'latency_ms_max': float(latencies.max())})
+        sizes = np.array(batch_sizes)
+        if len(sizes):
+            report.update({'batches': len(sizes), 'batch_size_mean': float(sizes.mean()),
+                           'batch_size_max': int(sizes.max())})
+        return report
+
+
+class prediction_service:
+    ''' The warm model behind the server. Predictive by default, or the NumPy compiled_model (same
+        predictions, faster to start, slower on large batches) '''
+
+    def __init__(self, compiled=False, max_batch=256, max_wait_ms=2.0):
+        self.compiled = compiled
+        self.lock = threading.Lock()
+        self.load()
+        self.batcher = micro_batcher(self.predictBatch, max_batch, max_wait_ms)
+        self.metrics = server_metrics()
+
+    def load(self):
+        from concrete_analysis import Predictive, feature_columns
+
+        predictive = Predictive()  # loads (or trains once) and publishes the compiled model
+        if self.compiled:
+            from compiled_model import compiled_model
+            model = compiled_model()
+            predict = model.predict
+        else:
+            predict = lambda mixes: predictive.model.predict(predictive.scaler.transform(mixes))
+        with self.lock:
+            self.predictive = predictive
+            self.predict = predict
+            self.columns = feature_columns
+            self.model_key = predictive.model_key
+
+    def predictBatch(self, mixes):
+        with self.lock:
+            predict = self.predict
+        return predict(mixes)
+
+    def mixMatrix(self, mixes):
+        ''' A float matrix from a list of ingredient lists or of {column: amount} dicts '''
+        if mixes and isinstance(mixes[0], dict):
+            mixes = [[mix[column] for column in self.columns] for mix in mixes]
+        matrix = np.array(mixes, dtype=np.float64, ndmin=2)
+        if matrix.shape[1] != len(self.columns):
+            raise ValueError('Expected %i ingredient columns (%s), got %i' % (
+                len(self.columns), ', '.join(self.columns), matrix.shape[1]))
+        return matrix
+
+    def handle(self, read):
+        ''' The response to a /predict request whose body read() returns '''
+        start = time.perf_counter()
+        self.batcher.arriving()
+        try:
+            body = json.loads(read())
+            single = 'mix' in body
+            mixes = self.mixMatrix([body['mix']] if single else body['mixes'])
+            future = self.batcher.submit(mixes)
+        finally:
+            self.batcher.arriving(-1)
+        try:
+            strengths = future.result()
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, len(mixes), error=True)
+            raise
+        self.metrics.record(time.perf_counter() - start, len(mixes))
+        strengths = [float(strength) for strength in strengths]
+        return {'strength_psi': strengths[0] if single else strengths}
+
+
+class request_handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so a client reuses its connection between requests
+    disable_nagle_algorithm = True  # headers and body go out in separate writes; don't hold the body back
+    service = None
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.reply(200, {'status': 'ok', 'model': self.service.model_key})
+        elif self.path == '/metrics':
+            self.reply(200, dict(self.service.metrics.report(self.service.batcher.batch_sizes),
+                                 model=self.service.model_key))
+        else:
+            self.reply(404, {'error': 'unknown path %s' % self.path})
+
+    def do_POST(self):
+        read = lambda: self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/reload':
+            read()
+            self.service.load()
+            self.reply(200, {'status': 'ok', 'model': self.service.model_key})
+        elif self.path == '/predict':
+            try:
+                self.reply(200, self.service.handle(read))
+            except (ValueError, KeyError, TypeError) as error:
+                self.reply(400, {'error': str(error)})
+            except Exception as error:
+                self.reply(500, {'error': str(error)})
+        else:
+            read()
+            self.reply(404, {'error': 'unknown path %s' % self.path})
+
+    def log_message(self, format, *args):
+        pass  # one line per request would swamp the console; /metrics has the counts
+
+
+class prediction_http_server(ThreadingHTTPServer):
+    request_queue_size = 128  # room for a burst of clients connecting at once
+    daemon_threads = True
+
+
+def serve(port=DEFAULT_PORT, host='127.0.0.1', compiled=False, max_batch=256, max_wait_ms=2.0):
+    ''' Loads the model and serves until interrupted '''
+    service = prediction_service(compiled, max_batch, max_wait_ms)
+    handler = type('bound_handler', (request_handler,), {'service': service})
+    server = prediction_http_server((host, port), handler)
+    print('Serving strength predictions on http://%s:%i (model %s)' % (host, port, service.model_key))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.batcher.close()
+
+
+def predictRemote(mixes, url='http://127.0.0.1:%i' % DEFAULT_PORT, timeout=30):
+    ''' Strengths (psi) from a running server, for scripts: one mix (a list of ingredients or a
+        {column: amount} dict) gives one strength, a list of mixes a list '''
+    single = isinstance(mixes, dict) or not isinstance(mixes[0], (list, tuple, dict))
+    body = json.dumps({'mix': mixes} if single else {'mixes': mixes}).encode()
+    request = Request(url + '/predict', body, {'Content-Type': 'application/json'})
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())['strength_psi']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on (default: this machine only)')
+    parser.add_argument('--compiled', action='store_true', help='predict with the NumPy compiled model')
+    parser.add_argument('--max-batch', type=int, default=256, help='most mixes scored in one predict call')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0,
+                        help='how long the first request of a batch waits for others to join it')
+    args = parser.parse_args(argv)
+    serve(args.port, args.host, args.compiled, args.max_batch, args.max_wait_ms)
+
+
+if __name__ == '__main__':
+    main()
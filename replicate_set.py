@@ -0,0 +1,273 @@
+''' Replicate sets: the cylinders broken for one mix, analyzed together. Each specimen goes through its
+    usual analyzer (and the results store), then the curves are stacked into NaN-padded (specimens,
+    samples) arrays and everything across the set is computed on those arrays at once: per-specimen
+    peak and strain at peak, mean, standard deviation and coefficient of variation of ultimate strength
+    and modulus, and the envelope (mean, standard deviation, min and max stress) on a common strain
+    grid. One overlay plot shows every curve, the envelope and the strength the model predicts for the
+    mix as a reference line.
+
+        python replicate_set.py tests/mixA_*.csv --name "Mix A" --mix 540 0 0 162 2.5 1040 676 28
+'''
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from concrete_analysis import Predictive, concrete_specimen, cob_specimen, UTM_analysis
+from units import IMPERIAL, unitSystem, unitLabel, factor, convert, convertMetrics, metricColumns
+from instrument import stage, instrumented
+from plot_render import plot_spec, finishPlot
+
+GRID_POINTS = 500
+
+analysis_methods = {concrete_specimen: 'concreteAnalysis', cob_specimen: 'cobAnalysis',
+                    UTM_analysis: 'specimenAnalysis'}
+
+
+def paddedCurves(curves):
+    ''' The curves' strain and stress stacked into (n, longest) arrays padded with NaN, and each length '''
+    lengths = np.array([len(curve.stress) for curve in curves], dtype=np.int64)
+    strain = np.full((len(curves), lengths.max(initial=0)), np.nan)
+    stress = np.full_like(strain, np.nan)
+    for i, curve in enumerate(curves):
+        strain[i, :lengths[i]] = curve.strain
+        stress[i, :lengths[i]] = curve.stress
+    return strain, stress, lengths
+
+
+def peaks(stress):
+    ''' Index and value of each row's peak stress, ignoring padding '''
+    index = np.argmax(np.where(np.isnan(stress), -np.inf, stress), axis=1)
+    return index, stress[np.arange(len(stress)), index]
+
+
+def gridCurves(strain, stress, lengths, grid):
+    ''' Every row's stress linearly interpolated at the grid strains, NaN outside the strains the row
+        covers. All rows are interpolated with one searchsorted: strain is made non-decreasing along each
+        row (a running maximum, which flattens small reversals of the crosshead) and each row is shifted
+        by its own offset so the whole array is one sorted sequence '''
+    n, width = strain.shape
+    monotone = np.fmax.accumulate(strain, axis=1)  # also carries the last strain into the padding
+    low = np.nanmin(monotone[:, 0]) if n else 0.0
+    span = np.nanmax(monotone) - low + 1.0
+    offsets = np.arange(n)[:, None] * span
+    flat = (monotone - low + offsets).ravel()
+    targets = grid[None, :] - low + offsets
+
+    starts = np.arange(n)[:, None] * width
+    last = starts + lengths[:, None] - 1
+    left = np.clip(np.searchsorted(flat, targets.ravel(), side='right').reshape(n, -1) - 1, starts,
+                   np.maximum(last - 1, starts))
+    right = np.minimum(left + 1, last)
+
+    x0, x1 = flat[left], flat[right]
+    y0, y1 = stress.ravel()[left], stress.ravel()[right]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(x1 > x0, (targets - x0) / (x1 - x0), 0.0)
+    values = y0 + fraction * (y1 - y0)
+    values[(targets < flat[starts]) | (targets > flat[last]) | (lengths[:, None] == 0)] = np.nan
+    return values
+
+
+def envelope(values):
+    ''' Count, mean, sample standard deviation, min and max down each grid column, skipping NaN '''
+    finite = np.isfinite(values)
+    count = finite.sum(axis=0)
+    filled = np.where(finite, values, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, filled.sum(axis=0) / count, np.nan)
+        deviation = np.where(finite, values - mean, 0.0)
+        std = np.where(count > 1, np.sqrt((deviation ** 2).sum(axis=0) / (count - 1)), np.nan)
+    low = np.where(count > 0, np.where(finite, values, np.inf).min(axis=0), np.nan)
+    high = np.where(count > 0, np.where(finite, values, -np.inf).max(axis=0), np.nan)
+    return count, mean, std, low, high
+
+
+def spread(values):
+    ''' Mean, sample standard deviation and coefficient of variation (%) of a set of values '''
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return np.nan, np.nan, np.nan
+    mean = float(values.mean())
+    std = float(values.std(ddof=1)) if len(values) > 1 else np.nan
+    return mean, std, 100 * std / mean if mean else np.nan
+
+
+def specimensFromFiles(files, material='concrete', radius=2, inch_column=1, kips_column=2, name=None, units=IMPERIAL,
+                       input_units=IMPERIAL):
+    ''' One analyzer per test file, named after the set and the file, reporting in units and reading
+        the radius and inch/kips columns in input_units '''
+    specimens = []
+    for file_name in files:
+        specimen_name = os.path.splitext(os.path.basename(file_name))[0]
+        if name:
+            specimen_name = '%s %s' % (name, specimen_name)
+        if material == 'concrete':
+            specimens.append(concrete_specimen(file_name, specimen_name, radius, kips_column, inch_column, units,
+                                               'Kips', input_units=input_units))
+        elif material == 'strain':
+            specimens.append(concrete_specimen(file_name, specimen_name, radius, kips_column, inch_column, units,
+                                               'Strain', input_units=input_units))
+        elif material == 'cob':
+            specimens.append(cob_specimen(file_name, specimen_name, radius, inch_column, kips_column, units,
+                                          input_units))
+        else:
+            specimens.append(UTM_analysis(file_name, specimen_name, units))
+    return specimens
+
+
+class replicate_set:
+    ''' The specimens of one mix. mix (the eight ingredients and age, as Predictive takes them) gives
+        the predicted reference strength, unless predicted_strength is passed directly. The metrics,
+        summary and plot are in units, as are mix (lb/yd^3 or kg/m^3) and predicted_strength; the curves
+        and envelope stay in psi like the analyzers' '''
+
+    def __init__(self, name, specimens, mix=None, predicted_strength=None, grid_points=GRID_POINTS, units=IMPERIAL):
+        self.name = name
+        self.specimens = specimens
+        self.mix = mix
+        self.units = unitSystem(units)
+        self.predicted_strength = predicted_strength
+        self.grid_points = grid_points
+        self.specimen_name = name  # what the GUI and batch code call any analyzer by
+        self.metrics = None  # one row per specimen
+        self.summary = {}
+        self.grid = None
+        self.envelope = None  # (count, mean, std, low, high) on self.grid
+        self.ultimate_strength = np.nan  # mean over the set
+        self.youngs_modulus = np.nan
+        self.plot_job = None
+
+    @instrumented('replicateAnalysis')
+    def replicateAnalysis(self, show=True, save_plot=True, use_store=True):
+        ''' Analyzes every specimen, then computes the per-specimen metrics, the set's statistics and
+            the stress envelope in one pass over the padded curves '''
+        if not self.specimens:
+            raise ValueError('Replicate set %s has no specimens' % self.name)
+        for specimen in self.specimens:
+            getattr(specimen, analysis_methods[type(specimen)])(show=False, save_plot=False, use_store=use_store)
+
+        with stage('derive', rows=len(self.specimens)):
+            strain, stress, lengths = paddedCurves([specimen.curve for specimen in self.specimens])
+            peak_index, peak_stress = peaks(stress)
+            ultimate = np.array([specimen.ultimate_strength for specimen in self.specimens], dtype=np.float64)
+            modulus = np.array([specimen.youngs_modulus for specimen in self.specimens], dtype=np.float64)
+
+            self.grid = np.linspace(max(np.nanmin(strain[:, 0]), 0.0), np.nanmax(strain), self.grid_points)
+            self.envelope = envelope(gridCurves(strain, stress, lengths, self.grid))
+
+            # the per-specimen values leave psi here, once per set
+            ultimate = convert(ultimate, 'stress', IMPERIAL, self.units)
+            modulus = convert(modulus, 'stress', IMPERIAL, self.units)
+            stress_units = unitLabel('stress', self.units)
+            self.metrics = pd.DataFrame({
+                'Specimen': [specimen.specimen_name for specimen in self.specimens],
+                'File': [specimen.file_name for specimen in self.specimens],
+                'Ultimate Strength (%s)' % stress_units: ultimate,
+                'Peak Stress (%s)' % stress_units: convert(peak_stress, 'stress', IMPERIAL, self.units),
+                'Strain at Peak': strain[np.arange(len(strain)), peak_index],
+                "Young's Modulus (%s)" % stress_units: modulus,
+                'R^2': [specimen.r_squared for specimen in self.specimens], 'Samples': lengths})
+            specimen_metrics = [convertMetrics(specimen.metrics, self.units) for specimen in self.specimens]
+            metric_columns = metricColumns(self.units)
+            for name, column in metric_columns.items():
+                if name != 'strain_at_peak':
+                    self.metrics[column] = [metrics[name] for metrics in specimen_metrics]
+
+        if self.predicted_strength is None and self.mix is not None:
+            self.predicted_strength = Predictive(*self.mix, units=self.units).strength_predict[0]
+
+        strength_mean, strength_std, strength_cv = spread(ultimate)
+        modulus_mean, modulus_std, modulus_cv = spread(modulus)
+        toughness_mean, toughness_std, toughness_cv = spread(self.metrics[metric_columns['toughness']])
+        self.ultimate_strength = strength_mean
+        self.youngs_modulus = modulus_mean
+        self.summary = {'specimens': len(self.specimens), 'strength_mean': strength_mean,
+                        'strength_std': strength_std, 'strength_cv': strength_cv, 'modulus_mean': modulus_mean,
+                        'modulus_std': modulus_std, 'modulus_cv': modulus_cv, 'toughness_mean': toughness_mean,
+                        'toughness_std': toughness_std, 'toughness_cv': toughness_cv}
+        if self.predicted_strength is not None:
+            self.summary['predicted_strength'] = float(self.predicted_strength)
+            self.summary['measured_over_predicted'] = strength_mean / float(self.predicted_strength)
+
+        print("%s (%i specimens) Ultimate Strength: %f +/- %f %s (CV %.1f%%). Young's Modulus: %f +/- %f %s "
+              "(CV %.1f%%)" % (self.name, len(self.specimens), strength_mean, strength_std, stress_units, strength_cv,
+                               modulus_mean, modulus_std, stress_units, modulus_cv))
+        if self.predicted_strength is not None:
+            print('%s predicted strength: %f %s (measured / predicted %f)' % (
+                self.name, float(self.predicted_strength), stress_units, self.summary['measured_over_predicted']))
+
+        if show or save_plot:
+            with stage('render'):
+                plot = self.plotSpec()
+            self.plot_job = finishPlot(plot, show, save_plot)
+        return self.summary
+
+    def plotSpec(self):
+        ''' Every specimen's curve over the set's mean and min-max envelope, with the predicted strength '''
+        count, mean, std, low, high = self.envelope
+        stress_units = unitLabel('stress', self.units)
+        predicted_psi = convert(self.predicted_strength, 'stress', self.units, IMPERIAL)
+        top = max(np.nanmax(high), predicted_psi or 0)
+        plot = plot_spec(self.name, '%s: %i specimens, Ultimate Strength %.0f +/- %.0f %s' % (
+            self.name, len(self.specimens), self.summary['strength_mean'], self.summary['strength_std'],
+            stress_units), ylabel='Stress (%s)' % stress_units, ylim=(0, 1.05 * top), legend_loc='lower right',
+            yscale=factor('stress', IMPERIAL, self.units))
+        for specimen in self.specimens:
+            plot.addSeries(specimen.curve.strain, specimen.curve.stress, specimen.specimen_name)
+        plot.addBand(self.grid, low, high, 'Envelope (min - max)')
+        plot.addSeries(self.grid, mean, 'Mean Stress')
+        if self.predicted_strength is not None:
+            plot.addHline(predicted_psi, self.grid[0], self.grid[-1],
+                          'Predicted Strength - %f %s' % (float(self.predicted_strength), stress_units))
+        return plot
+
+    def envelopeTable(self):
+        ''' The envelope on the strain grid, in the set's units '''
+        count, mean, std, low, high = self.envelope
+        scale = factor('stress', IMPERIAL, self.units)
+        return pd.DataFrame({'strain': self.grid, 'specimens': count, 'mean': mean * scale, 'std': std * scale,
+                             'min': low * scale, 'max': high * scale})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+', help='the replicate test files of one mix')
+    parser.add_argument('--name', default='Replicates', help='name of the mix, for the plot and the output files')
+    parser.add_argument('--material', choices=['concrete', 'strain', 'cob', 'utm'], default='concrete')
+    parser.add_argument('--radius', type=float, default=2,
+                        help='specimen radius in inches, or mm with --input-units si (concrete/cob)')
+    parser.add_argument('--inch-column', type=int, default=1, help='1-based inch (or mm) column (concrete/cob)')
+    parser.add_argument('--kips-column', type=int, default=2, help='1-based kips (or kN) column (concrete/cob)')
+    parser.add_argument('--units', choices=['imperial', 'si'], default='imperial',
+                        help='units of the results, --mix and --predicted: psi and lb/yd^3, or MPa and kg/m^3')
+    parser.add_argument('--input-units', choices=['imperial', 'si'], default='imperial',
+                        help='units of the radius and the inch/kips columns: in and kips, or mm and kN')
+    parser.add_argument('--mix', type=float, nargs=8, default=None,
+                        metavar=('CEMENT', 'SLAG', 'FLY_ASH', 'WATER', 'SUPER', 'COARSE', 'FINE', 'AGE'),
+                        help='the mix (lb/yd^3 or kg/m^3) and its age in days, to draw the predicted strength')
+    parser.add_argument('--predicted', type=float, default=None, help='predicted strength to draw instead')
+    parser.add_argument('--output', default=None,
+                        help='per-specimen metrics CSV (default: "<name> replicates.csv"), with the envelope '
+                             'written next to it')
+    parser.add_argument('--no-plot', action='store_true')
+    parser.add_argument('--rerun', action='store_true', help='re-analyze files already in the results store')
+    args = parser.parse_args(argv)
+
+    specimens = specimensFromFiles(args.files, args.material, args.radius, args.inch_column, args.kips_column,
+                                   units=args.units, input_units=args.input_units)
+    replicates = replicate_set(args.name, specimens, args.mix, args.predicted, units=args.units)
+    replicates.replicateAnalysis(show=False, save_plot=not args.no_plot, use_store=not args.rerun)
+    if replicates.plot_job is not None:
+        replicates.plot_job.result()
+
+    output = args.output or '%s replicates.csv' % args.name
+    replicates.metrics.to_csv(output, index=False)
+    replicates.envelopeTable().to_csv(os.path.splitext(output)[0] + ' envelope.csv', index=False)
+    print('Metrics written to %s' % output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+''' Local SQLite database of specimen results. Each result is keyed by the content hash of its test
+    file, the analysis type and the analysis parameters (radius, columns, ...), so re-running an
+    analyzed file skips the elastic region search and the curve metrics: the analyzer still loads
+    the curve (memory-mapped from the ingest cache) and recomputes its rolling mean, so data_table
+    and the plots have every sample. Summary columns are indexed for queries across thousands of
+    specimens, and each row keeps a decimated copy of the stress-strain curve for dashboards and
+    plots without the raw files.
+
+        python results_store.py --material cob --min-strength 100 --output cob_results.csv
+'''
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis_kernel import curve_result, metric_names, asColumn, rollingMean, ROLLING_WINDOW
+from ingest import default_cache
+from plot_render import lttb
+
+RESULTS_VERSION = 4  # part of every key; bump when the analysis changes its numbers
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.results.db')
+CURVE_POINTS = 500
+
+schema = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    file_hash TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    params TEXT NOT NULL,
+    specimen TEXT,
+    file_name TEXT,
+    material TEXT,
+    tested_at REAL,
+    analyzed_at REAL,
+    ultimate_strength REAL,
+    youngs_modulus REAL,
+    intercept REAL,
+    rvalue REAL,
+    r_squared REAL,
+    elastic_start REAL,
+    elastic_end REAL,
+    fit_start INTEGER,
+    fit_end INTEGER,
+    strain_at_peak REAL,
+    toughness REAL,
+    toughness_to_peak REAL,
+    yield_strain REAL,
+    yield_strength REAL,
+    secant_modulus REAL,
+    softening_slope REAL,
+    curve_points INTEGER,
+    curve BLOB,
+    UNIQUE (file_hash, analysis, params)
+);
+CREATE INDEX IF NOT EXISTS results_specimen ON results (specimen);
+CREATE INDEX IF NOT EXISTS results_tested_at ON results (tested_at);
+CREATE INDEX IF NOT EXISTS results_analyzed_at ON results (analyzed_at);
+CREATE INDEX IF NOT EXISTS results_material_strength ON results (material, ultimate_strength);
+CREATE INDEX IF NOT EXISTS results_strength ON results (ultimate_strength);
+'''
+
+summary_columns = ['id', 'specimen', 'file_name', 'material', 'analysis', 'params', 'tested_at', 'analyzed_at',
+                   'ultimate_strength', 'youngs_modulus', 'r_squared', 'elastic_start', 'elastic_end'] + metric_names + [
+                   'file_hash']
+
+
+class results_store:
+    ''' Results database shared by the analyzers. A connection is opened lazily per process and thread
+        (sqlite3 connections stay on their thread), in WAL mode, so parallel batch workers and GUI jobs
+        can write while a dashboard reads '''
+
+    def __init__(self, db_path=DEFAULT_DB, file_cache=None):
+        self.db_path = db_path
+        self.file_cache = file_cache or default_cache
+        self.local = threading.local()
+
+    def connect(self):
+        local = self.local
+        if getattr(local, 'connection', None) is None or local.pid != os.getpid():
+            local.connection = sqlite3.connect(self.db_path, timeout=30)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.executescript(schema)
+            local.pid = os.getpid()
+        return local.connection
+
+    def key(self, file_name, analysis, params):
+        ''' (content hash, analysis, canonical params) of a result. The hash comes from the ingest
+            cache's index, so unchanged files are not rehashed '''
+        params = json.dumps(dict(params, version=RESULTS_VERSION), sort_keys=True)
+        return self.file_cache.fileKey(file_name), analysis, params
+
+    def get(self, file_name, analysis, params):
+        ''' The stored row (a dict with the decimated curve) or None '''
+        cursor = self.connect().execute('SELECT * FROM results WHERE file_hash = ? AND analysis = ? AND params = ?',
+                                        self.key(file_name, analysis, params))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cursor.description], row))
+
+    def put(self, file_name, analysis, params, specimen, material):
+        ''' Stores an analyzed specimen's results and a decimated copy of its curve '''
+        curve = specimen.curve
+        finite = np.flatnonzero(np.isfinite(curve.strain) & np.isfinite(curve.stress))
+        kept = finite[lttb(curve.strain[finite], curve.stress[finite], CURVE_POINTS)]
+        curve_blob = np.stack([curve.strain[kept], curve.stress[kept], curve.rolling[kept]]).astype(np.float32)
+        row = self.key(file_name, analysis, params) + (
+            specimen.specimen_name, os.path.abspath(file_name), material, os.path.getmtime(file_name), time.time(),
+            float(specimen.ultimate_strength), float(specimen.youngs_modulus), float(curve.intercept),
+            float(curve.rvalue), float(specimen.r_squared), float(specimen.elastic_strain_bounds[0]),
+            float(specimen.elastic_strain_bounds[1]), int(curve.fit_start), int(curve.fit_end), len(kept),
+            curve_blob.tobytes()) + tuple(float(curve.metrics[name]) for name in metric_names)
+        columns = ['file_hash', 'analysis', 'params', 'specimen', 'file_name', 'material', 'tested_at', 'analyzed_at',
+                   'ultimate_strength', 'youngs_modulus', 'intercept', 'rvalue', 'r_squared', 'elastic_start',
+                   'elastic_end', 'fit_start', 'fit_end', 'curve_points', 'curve'] + metric_names
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO results (%s) VALUES (%s)' % (
+                ', '.join(columns), ', '.join('?' * len(columns))), row)
+
+    def storedCurve(self, row, strain=None, stress=None):
+        ''' curve_result of a row's results on its decimated curve or, given the full strain and stress
+            re-read from the test file, on those (the rolling mean is recomputed, the fit is not) '''
+        if strain is None:
+            strain, stress, rolling = np.frombuffer(row['curve'], dtype=np.float32).reshape(3, -1).astype(np.float64)
+            # the stored fit window indexes the full curve; on the decimated one, find its bounds again
+            fit_start = boundIndex(strain, row['elastic_start']) if len(strain) else 0
+            fit_end = boundIndex(strain, row['elastic_end'], fit_start) + 1 if len(strain) else 0
+        else:
+            strain, stress = asColumn(strain), asColumn(stress)
+            rolling = rollingMean(stress, ROLLING_WINDOW)
+            fit_start, fit_end = row['fit_start'], row['fit_end']
+        metrics = {name: np.nan if row[name] is None else row[name] for name in metric_names}  # NaN is stored as NULL
+        curve = curve_result(strain, stress, rolling, int(np.argmax(stress)) if len(stress) else 0,
+                             row['youngs_modulus'], row['intercept'], row['rvalue'], fit_start, fit_end, metrics)
+        curve.ultimate_strength = row['ultimate_strength']
+        curve.elastic_strain_bounds = (row['elastic_start'], row['elastic_end'])
+        return curve
+
+    def restore(self, specimen, row, strain, stress):
+        ''' Sets an analyzer's results from a stored row, as if it had just analyzed the file: curve is
+            the full strain and stress the analyzer re-read (from the ingest cache), the stored decimated
+            copy is kept as stored_curve '''
+        specimen.ultimate_strength = row['ultimate_strength']
+        specimen.youngs_modulus = row['youngs_modulus']
+        specimen.r_squared = row['r_squared']
+        specimen.elastic_strain_bounds = (row['elastic_start'], row['elastic_end'])
+        specimen.curve = self.storedCurve(row, strain, stress)
+        specimen.stored_curve = self.storedCurve(row)
+        specimen.metrics = specimen.curve.metrics
+
+    def query(self, name=None, material=None, analysis=None, min_strength=None, max_strength=None, since=None,
+              until=None, date_column='tested_at', limit=None):
+        ''' Summary rows matching every given filter, newest first, as a DataFrame. name may use SQL
+            LIKE wildcards (%), dates are datetimes, date strings or epoch seconds '''
+        if date_column not in ('tested_at', 'analyzed_at'):
+            raise ValueError("date_column must be 'tested_at' or 'analyzed_at'")
+
+        conditions, values = [], []
+        for column, operator, value in (('specimen', 'LIKE', name), ('material', '=', material),
+                                        ('analysis', '=', analysis), ('ultimate_strength', '>=', min_strength),
+                                        ('ultimate_strength', '<=', max_strength),
+                                        (date_column, '>=', epochSeconds(since)),
+                                        (date_column, '<=', epochSeconds(until))):
+            if value is not None:
+                conditions.append('%s %s ?' % (column, operator))
+                values.append(value)
+
+        sql = 'SELECT %s FROM results' % ', '.join(summary_columns)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY %s DESC' % date_column
+        if limit is not None:
+            sql += ' LIMIT %i' % limit
+
+        results = pd.read_sql_query(sql, self.connect(), params=values)
+        for column in ('tested_at', 'analyzed_at'):
+            results[column] = pd.to_datetime(results[column], unit='s')
+        return results
+
+    def curves(self, ids):
+        ''' {id: (strain, stress, rolling)} of the decimated curves of the given result ids '''
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        rows = self.connect().execute('SELECT id, curve FROM results WHERE id IN (%s)' % ', '.join('?' * len(ids)),
+                                      ids).fetchall()
+        return {i: tuple(np.frombuffer(blob, dtype=np.float32).reshape(3, -1)) for i, blob in rows}
+
+    def count(self):
+        return self.connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def invalidate(self, file_name=None):
+        ''' Drops the results of one file (any analysis or parameters), or every result '''
+        with self.connect() as connection:
+            if file_name is None:
+                connection.execute('DELETE FROM results')
+            else:
+                connection.execute('DELETE FROM results WHERE file_hash = ?', (self.file_cache.fileKey(file_name),))
+
+
+def boundIndex(strain, value, start=0):
+    ''' First sample from start on that is closest to a stored elastic strain bound '''
+    return start + int(np.argmin(np.abs(strain[start:] - value)))
+
+
+def epochSeconds(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return pd.Timestamp(value).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--name', default=None, help='specimen name, % as wildcard')
+    parser.add_argument('--material', choices=['concrete', 'cob'], default=None)
+    parser.add_argument('--analysis', default=None)
+    parser.add_argument('--min-strength', type=float, default=None)
+    parser.add_argument('--max-strength', type=float, default=None)
+    parser.add_argument('--since', default=None, help='test date, e.g. 2024-01-31')
+    parser.add_argument('--until', default=None)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--output', default=None, help='write the matches to a .csv or .xlsx file')
+    args = parser.parse_args(argv)
+
+    results = results_store(args.db).query(args.name, args.material, args.analysis, args.min_strength,
+                                           args.max_strength, args.since, args.until, limit=args.limit)
+    if args.output is None:
+        print(results.drop(columns=['params', 'file_hash']).to_string(index=False))
+    elif args.output.lower().endswith('.xlsx'):
+        results.to_excel(args.output, index=False)
+    else:
+        results.to_csv(args.output, index=False)
+    print('%i results' % len(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+''' Live analysis of a test in progress. streaming_analysis takes samples one at a time or in small
+    batches and keeps the running peak, a 50-sample rolling mean and the regression sums for the
+    modulus, each updated in O(1) per sample, so current estimates are available at any moment.
+    replaySource stands in for the UTM by feeding a recorded file at a chosen sample rate:
+
+        python streaming.py conc_mix_test.csv --rate 2000 --radius 2
+'''
+import argparse
+import math
+import time
+
+import numpy as np
+
+from ingest import loadTestFile
+
+
+class streaming_analysis:
+    ''' Incremental version of the specimen analyzers. In 'kips' mode samples are (inch, kips) and
+        are filtered and converted like kipsCurve; in 'stress' mode they are (strain, stress).
+        The modulus regression accumulates every loading sample (or only those inside
+        fit_stress_range, in psi) until the rolling mean falls failure_drop below its peak, so
+        noise at the start of the test cannot end the fit early '''
+
+    def __init__(self, mode='kips', radius=2, min_kips=0.5, window=50, fit_stress_range=None, failure_drop=0.15):
+        self.mode = mode
+        self.radius = radius
+        self.area = (radius ** 2) * np.pi
+        self.min_kips = min_kips
+        self.window = window
+        self.fit_stress_range = fit_stress_range
+        self.failure_drop = failure_drop
+
+        self.samples = 0
+        self.inch_zero = None
+        self.peak_stress = -math.inf
+        self.strain_at_peak = math.nan
+        self.peak_rolling = -math.inf
+        self.failed = False
+
+        self.ring = np.zeros(window)
+        self.ring_position = 0
+        self.ring_sum = 0.0
+
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+    def add(self, a, b):
+        ''' One sample: (inch, kips) in kips mode, (strain, stress) in stress mode '''
+        if not (np.isfinite(a) and np.isfinite(b)):
+            return  # a blank or text cell; NaN would stay in the running sums for the rest of the test
+        if self.mode == 'kips':
+            if b < self.min_kips or a < 0:
+                return
+            if self.inch_zero is None:
+                self.inch_zero = a
+            strain = (a - self.inch_zero) / self.radius
+            stress = b * 1000 / self.area
+        else:
+            strain, stress = a, b
+
+        self.samples += 1
+        if stress > self.peak_stress:
+            self.peak_stress = stress
+            self.strain_at_peak = strain
+
+        # ring buffer for the rolling mean; the sum is recomputed on every wrap so rounding cannot drift
+        i = self.ring_position % self.window
+        self.ring_sum += stress - self.ring[i]
+        self.ring[i] = stress
+        self.ring_position += 1
+        if i == self.window - 1:
+            self.ring_sum = float(self.ring.sum())
+
+        if self.ring_position >= self.window:
+            rolling = self.ring_sum / self.window
+            if rolling > self.peak_rolling:
+                self.peak_rolling = rolling
+            elif rolling < (1 - self.failure_drop) * self.peak_rolling:
+                self.failed = True
+
+        if not self.failed and (self.fit_stress_range is None or
+                                self.fit_stress_range[0] <= stress <= self.fit_stress_range[1]):
+            self.n += 1
+            self.sx += strain
+            self.sy += stress
+            self.sxx += strain * strain
+            self.sxy += strain * stress
+            self.syy += stress * stress
+
+    def addBatch(self, a, b):
+        ''' A block of samples at once, with the same result as calling add() on each in order '''
+        a = np.asarray(a, dtype=np.float64)
+        b = np.asarray(b, dtype=np.float64)
+        keep = np.isfinite(a) & np.isfinite(b)
+        if self.mode == 'kips':
+            keep &= (b >= self.min_kips) & (a >= 0)
+        if not keep.all():
+            a, b = a[keep], b[keep]
+        if len(a) == 0:
+            return
+        if self.mode == 'kips':
+            if self.inch_zero is None:
+                self.inch_zero = a[0]
+            strain = (a - self.inch_zero) / self.radius
+            stress = b * 1000 / self.area
+        else:
+            strain, stress = a, b
+
+        self.samples += len(stress)
+        i = int(np.argmax(stress))
+        if stress[i] > self.peak_stress:
+            self.peak_stress = float(stress[i])
+            self.strain_at_peak = float(strain[i])
+
+        # rolling mean at every new sample, continuing from the last window - 1 samples in the ring
+        k = min(self.ring_position, self.window - 1)
+        history = self.ring[(self.ring_position - k + np.arange(k)) % self.window]
+        csum = np.concatenate(([0.0], np.cumsum(np.concatenate((history, stress)))))
+        ends = k + 1 + np.arange(len(stress))
+        rolling = np.full(len(stress), np.nan)
+        valid = self.ring_position + np.arange(len(stress)) >= self.window - 1
+        rolling[valid] = (csum[ends[valid]] - csum[ends[valid] - self.window]) / self.window
+
+        # samples from the first failure on are excluded from the modulus sums
+        fit = np.full(len(stress), not self.failed)
+        if valid.any():
+            running_peak = np.fmax.accumulate(np.fmax(rolling, self.peak_rolling))
+            self.peak_rolling = float(running_peak[-1])
+            failing = np.flatnonzero(rolling < (1 - self.failure_drop) * running_peak)
+            if len(failing) and not self.failed:
+                self.failed = True
+                fit[failing[0]:] = False
+        if self.fit_stress_range is not None:
+            fit &= (stress >= self.fit_stress_range[0]) & (stress <= self.fit_stress_range[1])
+
+        x = strain[fit]
+        y = stress[fit]
+        self.n += len(x)
+        self.sx += float(x.sum())
+        self.sy += float(y.sum())
+        self.sxx += float(np.dot(x, x))
+        self.sxy += float(np.dot(x, y))
+        self.syy += float(np.dot(y, y))
+
+        tail = stress[-self.window:]
+        start = self.ring_position % self.window
+        positions = (start + np.arange(len(stress) - len(tail), len(stress))) % self.window
+        self.ring[positions] = tail
+        self.ring_position += len(stress)
+        self.ring_sum = float(self.ring.sum())
+
+    def rollingMean(self):
+        if self.ring_position < self.window:
+            return math.nan
+        return float(self.ring_sum) / self.window
+
+    def estimates(self):
+        ''' Current peak stress, rolling mean and modulus fit as a dict '''
+        slope = intercept = r_squared = math.nan
+        if self.n >= 2:
+            mean_x = self.sx / self.n
+            mean_y = self.sy / self.n
+            var_x = self.sxx / self.n - mean_x * mean_x
+            var_y = self.syy / self.n - mean_y * mean_y
+            cov = self.sxy / self.n - mean_x * mean_y
+            if var_x > 0:
+                slope = cov / var_x
+                intercept = mean_y - slope * mean_x
+                r_squared = min(cov * cov / (var_x * var_y), 1.0) if var_y > 0 else 0.0
+
+        return {'samples': self.samples, 'peak_stress': self.peak_stress if self.samples else math.nan,
+                'strain_at_peak': self.strain_at_peak, 'rolling_mean': self.rollingMean(),
+                'youngs_modulus': slope, 'intercept': intercept, 'r_squared': r_squared,
+                'fit_samples': self.n, 'failed': self.failed}
+
+
+def replaySource(file_name, columns=(0, 1), sample_rate=None, batch_size=1):
+    ''' Yields (a, b) arrays of batch_size samples from a recorded test file, paced to sample_rate
+        samples per second (as fast as possible when sample_rate is None). columns are the
+        names or 0-based indices of the two channels, e.g. ('inch', 'kips') '''
+    test_data = loadTestFile(file_name)
+    a = test_data.column(columns[0])
+    b = test_data.column(columns[1])
+    start = time.perf_counter()
+    for i in range(0, len(a), batch_size):
+        if sample_rate is not None:
+            delay = start + i / sample_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield a[i:i + batch_size], b[i:i + batch_size]
+
+
+def replay(analyzer, source, report_every=None):
+    ''' Feeds a source into the analyzer and returns the per-update latencies in seconds '''
+    latencies = []
+    last_report = time.perf_counter()
+    for a, b in source:
+        start = time.perf_counter()
+        if len(a) == 1:
+            analyzer.add(float(a[0]), float(b[0]))
+        else:
+            analyzer.addBatch(a, b)
+        latencies.append(time.perf_counter() - start)
+
+        if report_every is not None and time.perf_counter() - last_report >= report_every:
+            last_report = time.perf_counter()
+            print("%(samples)i samples  peak %(peak_stress).1f psi  rolling %(rolling_mean).1f psi  "
+                  "modulus %(youngs_modulus).0f psi  R^2 %(r_squared).4f" % analyzer.estimates())
+    return np.array(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file_name')
+    parser.add_argument('--mode', choices=['kips', 'stress'], default='kips')
+    parser.add_argument('--columns', nargs=2, default=['0', '1'],
+                        help='the two channels, as names or 0-based indices (inch kips / strain stress)')
+    parser.add_argument('--radius', type=float, default=2)
+    parser.add_argument('--rate', type=float, default=1000, help='samples per second, 0 for as fast as possible')
+    parser.add_argument('--batch', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    columns = [int(c) if c.isdigit() else c for c in args.columns]
+    analyzer = streaming_analysis(args.mode, args.radius)
+    source = replaySource(args.file_name, columns, args.rate or None, args.batch)
+    latencies = replay(analyzer, source, report_every=1.0)
+    print("Final: %(samples)i samples  peak %(peak_stress).1f psi  modulus %(youngs_modulus).0f psi  "
+          "R^2 %(r_squared).4f" % analyzer.estimates())
+    print("Update latency p50 %.2f us, p99 %.2f us" % (np.percentile(latencies, 50) * 1e6,
+                                                       np.percentile(latencies, 99) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
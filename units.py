@@ -0,0 +1,105 @@
+''' Units at the boundaries. Inside, everything works in one system: the analyzers, the kernel and the
+    results store in psi, inches, kips and in/in strain, the strength model (with its lab results, the
+    compiled model, the mix designer and the prediction server) in lb/yd^3 and psi. Input in SI or
+    imperial units is converted once on the way in and results once on the way out, as scalar factors
+    or one broadcast multiply over a mix matrix, never inside the per-sample code.
+
+        convert(40, 'stress', SI, IMPERIAL)              # 5801.52 psi
+        convertMixes(mixes_kg_m3, SI, IMPERIAL)          # the whole (n, 8) matrix at once
+'''
+import numpy as np
+
+IMPERIAL = 'imperial'
+SI = 'si'
+
+LB_YD3_PER_KG_M3 = 1.68555
+PSI_PER_MPA = 145.038
+MM_PER_IN = 25.4
+KN_PER_KIP = 4.44822
+
+# quantity: (imperial unit, SI unit, SI value of one imperial unit)
+quantities = {'stress': ('psi', 'MPa', 1 / PSI_PER_MPA),
+              'length': ('in', 'mm', MM_PER_IN),
+              'force': ('kips', 'kN', KN_PER_KIP),
+              'mix': ('lb/yd^3', 'kg/m^3', 1 / LB_YD3_PER_KG_M3),
+              'toughness': ('in-lb/in^3', 'MJ/m^3', 1 / PSI_PER_MPA),  # stress times strain
+              'strain': ('in/in', 'mm/mm', 1.0),
+              'age': ('days', 'days', 1.0)}
+
+# quantity of each model feature, in the order of concrete_analysis.feature_columns
+feature_quantities = ['mix'] * 7 + ['age']
+
+# full-curve metric: (column label, quantity, or None for a plain strain)
+metric_quantities = {'strain_at_peak': ('Strain at Peak', None),
+                     'toughness': ('Toughness', 'toughness'),
+                     'toughness_to_peak': ('Toughness to Peak', 'toughness'),
+                     'yield_strain': ('Yield Strain (0.2% offset)', None),
+                     'yield_strength': ('Yield Strength', 'stress'),
+                     'secant_modulus': ('Secant Modulus', 'stress'),
+                     'softening_slope': ('Softening Slope', 'stress')}
+
+system_names = {'imperial': IMPERIAL, 'us': IMPERIAL, 'si': SI, 'metric': SI}
+
+
+def unitSystem(name):
+    ''' IMPERIAL or SI from a name as the GUI and command lines spell it ('Imperial', 'Metric', 'SI', ...) '''
+    system = system_names.get(str(name).strip().lower()) if name is not None else IMPERIAL
+    if system is None:
+        raise ValueError('Unknown unit system %r: use imperial or si' % name)
+    return system
+
+
+def factor(quantity, from_units, to_units):
+    ''' What a value in from_units is multiplied by to be in to_units '''
+    si_per_imperial = quantities[quantity][2]
+    from_units, to_units = unitSystem(from_units), unitSystem(to_units)
+    if from_units == to_units:
+        return 1.0
+    return si_per_imperial if to_units == SI else 1 / si_per_imperial
+
+
+def convert(values, quantity, from_units, to_units):
+    ''' A scalar (as a float, so numeric strings from the GUI work too) or an array in from_units, in
+        to_units. None stays None '''
+    if values is None:
+        return None
+    scale = factor(quantity, from_units, to_units)
+    if isinstance(values, (int, float, str, np.floating, np.integer)):
+        return float(values) * scale
+    return values if scale == 1.0 else np.asarray(values, dtype=np.float64) * scale
+
+
+def unitLabel(quantity, units):
+    return quantities[quantity][0 if unitSystem(units) == IMPERIAL else 1]
+
+
+def mixFactors(from_units, to_units, with_strength=False):
+    ''' Per-column factors of a mix matrix (the feature columns, then Strength if with_strength) '''
+    columns = feature_quantities + (['stress'] if with_strength else [])
+    return np.array([factor(quantity, from_units, to_units) for quantity in columns])
+
+
+def convertMixes(mixes, from_units, to_units, with_strength=False):
+    ''' An (n, features) mix matrix in from_units, in to_units, with one broadcast multiply. Returns the
+        matrix itself when no conversion is needed '''
+    if unitSystem(from_units) == unitSystem(to_units):
+        return mixes
+    return mixes * mixFactors(from_units, to_units, with_strength)
+
+
+def convertMetrics(metrics, to_units):
+    ''' Full-curve metrics (analysis_kernel.curveMetrics, in psi) in to_units '''
+    return {name: convert(value, metric_quantities[name][1], IMPERIAL, to_units)
+            if metric_quantities[name][1] else value for name, value in metrics.items()}
+
+
+def metricColumns(units):
+    ''' {metric name: table column label with its unit} '''
+    return {name: label if quantity is None else '%s (%s)' % (label, unitLabel(quantity, units))
+            for name, (label, quantity) in metric_quantities.items()}
+
+
+def stressPerForce(radius, units):
+    ''' psi per unit of a force column (kips or kN) on a cylinder of this radius (in or mm) '''
+    radius_in = convert(radius, 'length', units, IMPERIAL)
+    return 1000 * factor('force', units, IMPERIAL) / (np.pi * radius_in ** 2)